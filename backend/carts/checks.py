@@ -0,0 +1,14 @@
+from django.core.checks import Tags, register
+
+from config.checks import check_shared_cache
+
+from .guest import GUEST_CART_CACHE_ALIAS
+
+
+# a local memory cache is enough for a single development server, so the
+# cache is only checked for deployment
+@register(Tags.caches, deploy=True)
+def check_guest_cart_cache(app_configs, **kwargs):
+    return check_shared_cache(
+        GUEST_CART_CACHE_ALIAS, "carts.E001", "the guest carts", allow_database=False
+    )
@@ -0,0 +1,168 @@
+import secrets
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.functional import cached_property
+
+from products.models import Product
+
+from .managers import (
+    MAX_ITEM_QUANTITY,
+    CartOperationError,
+    check_quantities,
+    resolve_quantities,
+)
+from .models import CartItem, CartPricesMixin, get_cart_totals
+
+# Signed cookie holding the token of the guest cart.
+GUEST_CART_COOKIE = "guest_cart"
+GUEST_CART_SALT = "carts.guest"
+# Cache alias holding the guest carts, as {product id: quantity} dicts. It must
+# be shared by the server processes and kept out of the database, which the
+# `carts.E001` deploy check enforces.
+GUEST_CART_CACHE_ALIAS = "carts"
+
+
+class GuestCart(CartPricesMixin):
+    """
+    Cart of an anonymous user, stored in the cache under the token of a signed
+    cookie, so browsing sessions don't write to the database. Units aren't
+    held for guest carts; they are reserved once the cart is merged into the
+    cart of the user at login.
+
+    Guest cart items are unsaved `CartItem` instances whose id is the id of
+    their product.
+    """
+
+    id = None
+    user = None
+    created_at = None
+
+    def __init__(self, token=None, quantities=None):
+        self.token = token or secrets.token_urlsafe(24)
+        self.quantities = quantities or {}
+
+    @classmethod
+    def from_request(cls, request):
+        """Returns the guest cart of the request, or an empty new one."""
+        token = request.get_signed_cookie(
+            GUEST_CART_COOKIE, default=None, salt=GUEST_CART_SALT
+        )
+        if token is None:
+            return cls()
+        return cls(token, get_guest_cart_cache().get(get_cache_key(token)))
+
+    def save(self, response):
+        """Stores the cart and sets its cookie on the response."""
+        timeout = settings.GUEST_CART_TTL.total_seconds()
+        get_guest_cart_cache().set(get_cache_key(self.token), self.quantities, timeout)
+        response.set_signed_cookie(
+            GUEST_CART_COOKIE,
+            self.token,
+            salt=GUEST_CART_SALT,
+            max_age=timeout,
+            httponly=True,
+            samesite="Lax",
+        )
+
+    def delete(self, response):
+        get_guest_cart_cache().delete(get_cache_key(self.token))
+        response.delete_cookie(GUEST_CART_COOKIE, samesite="Lax")
+
+    def add_product(self, product_id: int, quantity: int = 1) -> int | None:
+        """
+        Adds `quantity` of the product to the cart. The units must be available,
+        and the item quantity can't exceed the product stock nor
+        MAX_ITEM_QUANTITY. Returns the new quantity of the item, or None if
+        the product doesn't exist or the units aren't available.
+        """
+        product = (
+            Product.objects.filter(pk=product_id)
+            .values("stock", "reserved_stock")
+            .first()
+        )
+        new_quantity = self.quantities.get(product_id, 0) + quantity
+        if (
+            product is None
+            or quantity > product["stock"] - product["reserved_stock"]
+            or new_quantity > product["stock"]
+            or new_quantity > MAX_ITEM_QUANTITY
+        ):
+            return None
+        self.quantities[product_id] = new_quantity
+        return new_quantity
+
+    def change_quantity(self, product_id: int, change: int) -> int | None:
+        """
+        Changes the quantity of the item of the product by `change`, with the
+        checks of `add_product` for added units. The quantity can't drop below
+        1. Returns the new quantity, or None if the change isn't allowed.
+        """
+        if product_id not in self.quantities:
+            return None
+        if change > 0:
+            return self.add_product(product_id, change)
+        new_quantity = self.quantities[product_id] + change
+        if new_quantity < 1:
+            return None
+        self.quantities[product_id] = new_quantity
+        return new_quantity
+
+    def remove(self, product_id: int) -> bool:
+        return self.quantities.pop(product_id, None) is not None
+
+    def apply_operations(self, operations):
+        """
+        Applies the cart `operations` (see `resolve_quantities`), checked against
+        the stock in a single query. Raises CartOperationError if any resulting
+        quantity isn't allowed, in which case nothing is changed.
+        """
+        product_ids = {operation["product_id"] for operation in operations}
+        products = {
+            product["id"]: product
+            for product in Product.objects.filter(pk__in=product_ids).values(
+                "id", "stock", "reserved_stock"
+            )
+        }
+        resolved = resolve_quantities(self.quantities, operations)
+        errors = check_quantities(resolved, self.quantities, products)
+        if errors:
+            raise CartOperationError(errors)
+        for product_id, quantity in resolved.items():
+            if quantity:
+                self.quantities[product_id] = quantity
+            else:
+                self.quantities.pop(product_id, None)
+
+    @cached_property
+    def items(self):
+        """Items of the cart, with their products loaded in a single query."""
+        products = Product.objects.in_bulk(list(self.quantities))
+        return [
+            CartItem(id=product.id, product=product, quantity=self.quantities[pk])
+            for pk, product in products.items()
+        ]
+
+    @cached_property
+    def totals(self):
+        return get_cart_totals(self.items)
+
+
+def get_guest_cart_cache():
+    return caches[GUEST_CART_CACHE_ALIAS]
+
+
+def get_cache_key(token):
+    return f"guest-cart:{token}"
+
+
+def merge_guest_cart(request, user, response):
+    """
+    Merges the guest cart of the request into the cart of the user with a
+    single statement, and deletes the guest cart.
+    """
+    if GUEST_CART_COOKIE not in request.COOKIES:
+        return
+    guest_cart = GuestCart.from_request(request)
+    CartItem.objects.merge_products(user, guest_cart.quantities)
+    guest_cart.delete(response)
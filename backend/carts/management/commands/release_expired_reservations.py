@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from carts.models import StockReservation
+
+
+class Command(BaseCommand):
+    help = (
+        "Release the stock held by expired cart reservations. Meant to run "
+        "periodically, e.g. every minute from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Reservations released per transaction.",
+        )
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Also recompute the reserved stock of products from the reservations.",
+        )
+
+    def handle(self, *args, **options):
+        reservations, units = StockReservation.objects.release_expired(
+            options["batch_size"]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Released {units} unit(s) from {reservations} expired reservation(s)."
+            )
+        )
+        if options["rebuild"]:
+            updated = StockReservation.objects.rebuild_reserved_stock()
+            self.stdout.write(
+                self.style.SUCCESS(f"Rebuilt reserved stock of {updated} product(s).")
+            )
@@ -0,0 +1,538 @@
+from django.conf import settings
+from django.db import connections, models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+# most units of a product in a cart, as validated by `CartItem.quantity`
+MAX_ITEM_QUANTITY = 1000
+
+
+class CartQuerySet(models.QuerySet):
+    def with_items(self):
+        """
+        Prefetches the items of the carts along with their products, so the cart
+        items and totals are served from a single extra query.
+        """
+        from .models import CartItem
+
+        return self.prefetch_related(
+            models.Prefetch(
+                "items", queryset=CartItem.objects.select_related("product")
+            )
+        )
+
+
+def get_table_names(connection):
+    """Returns the quoted table names used by the cart statements."""
+    from products.models import Product
+
+    from .models import Cart, CartItem, StockReservation
+
+    return {
+        name: connection.ops.quote_name(model._meta.db_table)
+        for name, model in (
+            ("cart", Cart),
+            ("item", CartItem),
+            ("product", Product),
+            ("reservation", StockReservation),
+        )
+    }
+
+
+# Holds the units of the `target` rows (cart_id, product_id, quantity) for
+# the cart items of the user, and adds them to the items, in a single
+# statement. The targets lock their product rows, so the stock checks are
+# evaluated against the latest reservations.
+RESERVE_SQL = """
+    WITH target AS (
+        {target}
+    ), reserved AS (
+        UPDATE {product} AS product
+        SET reserved_stock = product.reserved_stock + target.quantity
+        FROM target
+        WHERE product.id = target.product_id
+    ), cart_item AS (
+        INSERT INTO {item} AS item (cart_id, product_id, quantity, date_added)
+        SELECT cart_id, product_id, quantity, %(now)s FROM target
+        ON CONFLICT (cart_id, product_id) DO UPDATE
+        SET quantity = item.quantity + EXCLUDED.quantity
+        RETURNING item.id, item.product_id, item.quantity
+    ), reservation AS (
+        INSERT INTO {reservation} AS reservation
+            (cart_item_id, product_id, quantity, expires_at)
+        SELECT cart_item.id, cart_item.product_id, target.quantity, %(expires_at)s
+        FROM cart_item
+        JOIN target ON target.product_id = cart_item.product_id
+        ON CONFLICT (cart_item_id) DO UPDATE
+        SET quantity = reservation.quantity + EXCLUDED.quantity,
+            expires_at = EXCLUDED.expires_at
+    )
+    SELECT quantity FROM cart_item
+"""
+
+# `quantity` units of a single product, only if they are all available and
+# the item quantity doesn't exceed the stock nor `max_quantity`.
+PRODUCT_TARGET_SQL = """
+        SELECT cart.id AS cart_id, product.id AS product_id, %(quantity)s AS quantity
+        FROM {product} AS product
+        JOIN {cart} AS cart ON cart.user_id = %(user_id)s
+        LEFT JOIN {item} AS item
+            ON item.cart_id = cart.id AND item.product_id = product.id
+        WHERE {condition}
+            AND product.stock - product.reserved_stock >= %(quantity)s
+            AND COALESCE(item.quantity, 0) + %(quantity)s <= product.stock
+            AND COALESCE(item.quantity, 0) + %(quantity)s <= %(max_quantity)s
+        FOR UPDATE OF product
+"""
+
+# The `lines` (product_id, quantity) of several products, each clamped to the
+# available units and to the stock and `max_quantity` left for the item.
+LINES_TARGET_SQL = """
+        SELECT
+            cart.id AS cart_id,
+            product.id AS product_id,
+            LEAST(
+                lines.quantity,
+                product.stock - product.reserved_stock,
+                product.stock - COALESCE(item.quantity, 0),
+                %(max_quantity)s - COALESCE(item.quantity, 0)
+            ) AS quantity
+        FROM (VALUES {lines}) AS lines (product_id, quantity)
+        JOIN {product} AS product ON product.id = lines.product_id
+        JOIN {cart} AS cart ON cart.user_id = %(user_id)s
+        LEFT JOIN {item} AS item
+            ON item.cart_id = cart.id AND item.product_id = product.id
+        WHERE product.stock - product.reserved_stock > 0
+            AND COALESCE(item.quantity, 0) < product.stock
+            AND COALESCE(item.quantity, 0) < %(max_quantity)s
+        ORDER BY product.id
+        FOR UPDATE OF product
+"""
+
+# Removes `quantity` units from a cart item of the user, and releases up to as
+# many units of its reservation, in a single statement. The product row is
+# locked before the item and its reservation, in the order of RESERVE_SQL, so
+# concurrent statements on the same item cannot deadlock.
+RELEASE_SQL = """
+    WITH locked AS (
+        SELECT product.id
+        FROM {item} AS item
+        JOIN {cart} AS cart ON cart.id = item.cart_id
+        JOIN {product} AS product ON product.id = item.product_id
+        WHERE item.id = %(item_id)s AND cart.user_id = %(user_id)s
+        FOR UPDATE OF product
+    ), cart_item AS (
+        UPDATE {item} AS item
+        SET quantity = item.quantity - %(quantity)s
+        FROM locked
+        WHERE item.id = %(item_id)s
+            AND item.product_id = locked.id
+            AND item.quantity - %(quantity)s >= 1
+        RETURNING item.id, item.quantity
+    ), held AS (
+        SELECT
+            reservation.id,
+            reservation.product_id,
+            LEAST(reservation.quantity, %(quantity)s) AS released
+        FROM {reservation} AS reservation
+        JOIN cart_item ON cart_item.id = reservation.cart_item_id
+        FOR UPDATE OF reservation
+    ), reservation AS (
+        UPDATE {reservation} AS reservation
+        SET quantity = reservation.quantity - held.released
+        FROM held
+        WHERE reservation.id = held.id
+    ), released AS (
+        UPDATE {product} AS product
+        SET reserved_stock = product.reserved_stock - held.released
+        FROM held
+        WHERE product.id = held.product_id
+    )
+    SELECT quantity FROM cart_item
+"""
+
+# Sets the quantities and holds of the `lines` of a cart in a single
+# statement: items and holds dropping to zero are deleted, the others are
+# upserted, and the reserved stock of the products follows the holds.
+APPLY_SQL = """
+    WITH lines (product_id, quantity, held, reserved_change) AS (
+        VALUES {lines}
+    ), released AS (
+        DELETE FROM {reservation} AS reservation
+        USING {item} AS item, lines
+        WHERE reservation.cart_item_id = item.id
+            AND item.cart_id = %(cart_id)s
+            AND item.product_id = lines.product_id
+            AND lines.held = 0
+    ), removed AS (
+        DELETE FROM {item} AS item
+        USING lines
+        WHERE item.cart_id = %(cart_id)s
+            AND item.product_id = lines.product_id
+            AND lines.quantity = 0
+    ), cart_item AS (
+        INSERT INTO {item} AS item (cart_id, product_id, quantity, date_added)
+        SELECT %(cart_id)s, product_id, quantity, %(now)s FROM lines
+        WHERE quantity > 0
+        ON CONFLICT (cart_id, product_id) DO UPDATE
+        SET quantity = EXCLUDED.quantity
+        RETURNING item.id, item.product_id
+    ), reservation AS (
+        INSERT INTO {reservation} AS reservation
+            (cart_item_id, product_id, quantity, expires_at)
+        SELECT cart_item.id, cart_item.product_id, lines.held, %(expires_at)s
+        FROM cart_item
+        JOIN lines ON lines.product_id = cart_item.product_id
+        WHERE lines.held > 0
+        ON CONFLICT (cart_item_id) DO UPDATE
+        SET quantity = EXCLUDED.quantity,
+            expires_at = EXCLUDED.expires_at
+    )
+    UPDATE {product} AS product
+    SET reserved_stock = product.reserved_stock + lines.reserved_change
+    FROM lines
+    WHERE product.id = lines.product_id AND lines.reserved_change <> 0
+"""
+
+# Deletes a batch of expired reservations and releases their units.
+RELEASE_EXPIRED_SQL = """
+    WITH expired AS (
+        DELETE FROM {reservation}
+        WHERE id IN (
+            SELECT reservation.id
+            FROM {reservation} AS reservation
+            JOIN {product} AS product ON product.id = reservation.product_id
+            WHERE reservation.expires_at <= %(now)s
+            ORDER BY reservation.expires_at
+            LIMIT %(batch_size)s
+            -- skipping the products locked by cart statements, which lock the
+            -- product before its reservations, so the sweeper never waits on them
+            FOR UPDATE OF reservation, product SKIP LOCKED
+        )
+        RETURNING product_id, quantity
+    ), released AS (
+        SELECT product_id, SUM(quantity) AS quantity
+        FROM expired
+        GROUP BY product_id
+    ), products AS (
+        UPDATE {product} AS product
+        SET reserved_stock = GREATEST(product.reserved_stock - released.quantity, 0)
+        FROM released
+        WHERE product.id = released.product_id
+    )
+    SELECT COUNT(*), COALESCE(SUM(quantity), 0) FROM expired
+"""
+
+
+def resolve_quantities(quantities, operations):
+    """
+    Returns the quantities of the products after applying the `operations` to
+    `quantities`, keyed by product id. Operations are dicts with an `action`
+    ("set", "add" or "remove"), a `product_id` and a `quantity`, applied in
+    order. Only the products of the operations are returned.
+    """
+    resolved = {}
+    for operation in operations:
+        product_id = operation["product_id"]
+        current = resolved.get(product_id, quantities.get(product_id, 0))
+        if operation["action"] == "add":
+            resolved[product_id] = current + operation["quantity"]
+        elif operation["action"] == "set":
+            resolved[product_id] = operation["quantity"]
+        else:
+            resolved[product_id] = 0
+    return resolved
+
+
+def check_quantities(resolved, quantities, products):
+    """
+    Checks the `resolved` quantities against the current `quantities` and the
+    stock of the `products`, dicts with `stock` and `reserved_stock` keyed by
+    id. Returns error messages keyed by product id.
+    """
+    errors = {}
+    for product_id, quantity in resolved.items():
+        product = products.get(product_id)
+        if product is None:
+            if quantity:
+                errors[product_id] = (
+                    f'Invalid pk "{product_id}" - object does not exist.'
+                )
+        elif quantity > MAX_ITEM_QUANTITY:
+            errors[product_id] = (
+                f"Ensure the quantity is less than or equal to {MAX_ITEM_QUANTITY}."
+            )
+        elif (
+            quantity > product["stock"]
+            or quantity - quantities.get(product_id, 0)
+            > product["stock"] - product["reserved_stock"]
+        ):
+            errors[product_id] = "Quantity exceeds available stock."
+    return errors
+
+
+class CartOperationError(Exception):
+    """The cart operations can't be applied, `errors` are keyed by product id."""
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+class CartItemQuerySet(models.QuerySet):
+    def reserve(self, user, target, params, **template_fields):
+        """
+        Runs RESERVE_SQL for the `target` rows of the user, creating the cart of
+        the user if it's missing. `template_fields` fill in the target template.
+        Returns the quantities of the updated items.
+        """
+        from .models import Cart
+
+        connection = connections[self.db]
+        tables = get_table_names(connection)
+        sql = RESERVE_SQL.format(
+            target=target.format(**tables, **template_fields), **tables
+        )
+        now = timezone.now()
+        params = {
+            **params,
+            "user_id": user.pk,
+            "max_quantity": MAX_ITEM_QUANTITY,
+            "now": now,
+            "expires_at": now + settings.CART_RESERVATION_TTL,
+        }
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+            if not rows and not Cart.objects.using(self.db).filter(user=user).exists():
+                # the user has no cart yet, create it and reserve again
+                Cart.objects.using(self.db).get_or_create(user=user)
+                cursor.execute(sql, params)
+                rows = cursor.fetchall()
+        return [row[0] for row in rows]
+
+    def add_product(self, user, product_id: int, quantity: int = 1) -> int | None:
+        """
+        Adds `quantity` of the product to the cart of the user and holds the
+        units for it, with a single statement. The units must be available,
+        i.e. not held by other carts, and the item quantity can't exceed the
+        product stock nor MAX_ITEM_QUANTITY. Returns the new quantity of the
+        cart item, or None if the units aren't available or the product
+        doesn't exist.
+        """
+        quantities = self.reserve(
+            user,
+            PRODUCT_TARGET_SQL,
+            {"product_id": product_id, "quantity": quantity},
+            condition="product.id = %(product_id)s",
+        )
+        return quantities[0] if quantities else None
+
+    def change_quantity(self, user, item_id: int, change: int) -> int | None:
+        """
+        Changes the quantity of the cart item of the user by `change` with a
+        single statement, holding added units and releasing removed ones. The
+        quantity can't drop below 1, and added units must be available.
+        Returns the new quantity, or None if the item doesn't exist or the
+        change isn't allowed.
+        """
+        if change > 0:
+            quantities = self.reserve(
+                user,
+                PRODUCT_TARGET_SQL,
+                {"item_id": item_id, "quantity": change},
+                condition="item.id = %(item_id)s",
+            )
+            return quantities[0] if quantities else None
+
+        connection = connections[self.db]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                RELEASE_SQL.format(**get_table_names(connection)),
+                {"item_id": item_id, "user_id": user.pk, "quantity": -change},
+            )
+            row = cursor.fetchone()
+        return row[0] if row is not None else None
+
+    def merge_products(self, user, quantities: dict[int, int]) -> int:
+        """
+        Adds the quantities of several products, keyed by product id, to the
+        cart of the user and holds their units, with a single statement. Each
+        quantity is clamped to the available units and to MAX_ITEM_QUANTITY.
+        Returns the number of updated items.
+        """
+        if not quantities:
+            return 0
+        lines = []
+        params = {}
+        for index, (product_id, quantity) in enumerate(quantities.items()):
+            lines.append(
+                f"(%(product_{index})s::bigint, %(quantity_{index})s::integer)"
+            )
+            params[f"product_{index}"] = product_id
+            params[f"quantity_{index}"] = quantity
+        return len(self.reserve(user, LINES_TARGET_SQL, params, lines=", ".join(lines)))
+
+    def apply_operations(self, user, operations):
+        """
+        Applies the cart `operations` (see `resolve_quantities`) to the cart of
+        the user in a single transaction: the products are locked and checked
+        in one query, the items and holds read in another, and the changes
+        applied with a single statement. Units added to an item are held,
+        units removed release its hold. Raises CartOperationError if any
+        resulting quantity isn't allowed, in which case nothing is changed.
+        """
+        from products.models import Product
+
+        from .models import Cart
+
+        product_ids = sorted({operation["product_id"] for operation in operations})
+        with transaction.atomic(using=self.db):
+            cart, _ = Cart.objects.using(self.db).get_or_create(user=user)
+            # lock the products in a consistent order before reading the items,
+            # so the holds read can't change until the end of the transaction
+            products = {
+                product["id"]: product
+                for product in Product.objects.using(self.db)
+                .filter(pk__in=product_ids)
+                .order_by("pk")
+                .select_for_update()
+                .values("id", "stock", "reserved_stock")
+            }
+            items = {
+                item["product_id"]: item
+                for item in self.filter(cart=cart, product_id__in=product_ids).values(
+                    "product_id", "quantity", held=Coalesce("reservation__quantity", 0)
+                )
+            }
+            quantities = {
+                product_id: item["quantity"] for product_id, item in items.items()
+            }
+            resolved = resolve_quantities(quantities, operations)
+            errors = check_quantities(resolved, quantities, products)
+            if errors:
+                raise CartOperationError(errors)
+
+            lines = []
+            params = {"cart_id": cart.pk}
+            for product_id, quantity in resolved.items():
+                if product_id not in products:
+                    continue
+                current = quantities.get(product_id, 0)
+                held = items[product_id]["held"] if product_id in items else 0
+                if quantity == 0:
+                    new_held = 0
+                elif quantity >= current:
+                    new_held = held + quantity - current
+                else:
+                    new_held = max(held - (current - quantity), 0)
+                index = len(lines)
+                lines.append(
+                    f"(%(product_{index})s::bigint, %(quantity_{index})s::integer, "
+                    f"%(held_{index})s::integer, %(change_{index})s::integer)"
+                )
+                params.update(
+                    {
+                        f"product_{index}": product_id,
+                        f"quantity_{index}": quantity,
+                        f"held_{index}": new_held,
+                        f"change_{index}": new_held - held,
+                    }
+                )
+            if not lines:
+                return
+
+            connection = connections[self.db]
+            now = timezone.now()
+            params["now"] = now
+            params["expires_at"] = now + settings.CART_RESERVATION_TTL
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    APPLY_SQL.format(
+                        lines=", ".join(lines), **get_table_names(connection)
+                    ),
+                    params,
+                )
+
+
+class CartItemManager(models.Manager):
+    def get_queryset(self):
+        return CartItemQuerySet(self.model, using=self._db)
+
+    def add_product(self, user, product_id: int, quantity: int = 1) -> int | None:
+        return self.get_queryset().add_product(user, product_id, quantity)
+
+    def change_quantity(self, user, item_id: int, change: int) -> int | None:
+        return self.get_queryset().change_quantity(user, item_id, change)
+
+    def merge_products(self, user, quantities: dict[int, int]) -> int:
+        return self.get_queryset().merge_products(user, quantities)
+
+    def apply_operations(self, user, operations):
+        return self.get_queryset().apply_operations(user, operations)
+
+
+class StockReservationQuerySet(models.QuerySet):
+    def release_expired(self, batch_size: int = 1000) -> tuple[int, int]:
+        """
+        Deletes the expired reservations and releases their units, in batches of
+        `batch_size` reservations. Returns the number of released reservations
+        and units.
+        """
+        connection = connections[self.db]
+        sql = RELEASE_EXPIRED_SQL.format(**get_table_names(connection))
+        now = timezone.now()
+        reservations = units = 0
+        while True:
+            with transaction.atomic(using=self.db), connection.cursor() as cursor:
+                cursor.execute(sql, {"now": now, "batch_size": batch_size})
+                released_reservations, released_units = cursor.fetchone()
+            reservations += released_reservations
+            units += released_units
+            if released_reservations < batch_size:
+                return reservations, units
+
+    def rebuild_reserved_stock(self) -> int:
+        """
+        Recomputes `Product.reserved_stock` of every product from the existing
+        reservations. Returns the number of corrected products.
+        """
+        from products.models import Product
+
+        reserved = Coalesce(
+            Subquery(
+                self.model.objects.filter(product=OuterRef("pk"))
+                .order_by()
+                .values("product")
+                .annotate(total=Sum("quantity"))
+                .values("total"),
+                output_field=models.PositiveIntegerField(),
+            ),
+            0,
+        )
+        return (
+            Product.objects.using(self.db)
+            .alias(reserved=reserved)
+            .exclude(reserved_stock=F("reserved"))
+            .update(reserved_stock=F("reserved"))
+        )
+
+
+class StockReservationManager(models.Manager):
+    def get_queryset(self):
+        return StockReservationQuerySet(self.model, using=self._db)
+
+    def release_expired(self, batch_size: int = 1000) -> tuple[int, int]:
+        return self.get_queryset().release_expired(batch_size)
+
+    def rebuild_reserved_stock(self) -> int:
+        return self.get_queryset().rebuild_reserved_stock()
+
+
+class CartManager(models.Manager):
+    def get_queryset(self):
+        return CartQuerySet(self.model, using=self._db)
+
+    def with_items(self):
+        return self.get_queryset().with_items()
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:21
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_cart_items(apps, schema_editor):
+    """Merges cart items of the same product into one item with their total quantity."""
+    CartItem = apps.get_model("carts", "CartItem")
+    duplicates = (
+        CartItem.objects.order_by()
+        .values("cart", "product")
+        .annotate(items=Count("pk"), total_quantity=Sum("quantity"), kept=Min("pk"))
+        .filter(items__gt=1)
+    )
+    for duplicate in duplicates:
+        CartItem.objects.filter(pk=duplicate["kept"]).update(
+            quantity=duplicate["total_quantity"]
+        )
+        CartItem.objects.filter(
+            cart=duplicate["cart"], product=duplicate["product"]
+        ).exclude(pk=duplicate["kept"]).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("carts", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="cartitem",
+            options={"ordering": ["-date_added"]},
+        ),
+        migrations.RunPython(merge_duplicate_cart_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="cartitem",
+            constraint=models.UniqueConstraint(
+                fields=("cart", "product"), name="unique_cart_product"
+            ),
+        ),
+    ]
@@ -4,35 +4,51 @@ from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.utils.functional import cached_property
 
 from products.models import Product
 
+from .managers import (
+    MAX_ITEM_QUANTITY,
+    CartItemManager,
+    CartManager,
+    StockReservationManager,
+)
+
 STANDARD_DELIVERY_CHARGE = Decimal("10.00")
 
 
-class Cart(models.Model):
-    user = models.OneToOneField(
-        settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE,
-        related_name="cart",
-    )
-    products = models.ManyToManyField(Product, through="CartItem")
-    created_at = models.DateTimeField(auto_now_add=True)
+def get_cart_totals(items):
+    """
+    Returns the original price, discounted price and subtotal of the items,
+    computed in a single pass over the items.
 
-    def __str__(self):
-        return f"{self.id} by {self.user}"
+    Load carts with `Cart.objects.with_items()` so that no query is needed.
+    """
+    totals = {"original_price": 0, "discounted_price": 0, "subtotal": 0}
+    for item in items:
+        product = item.product
+        totals["original_price"] += product.price * item.quantity
+        totals["discounted_price"] += product.discounted_price * item.quantity
+        totals["subtotal"] += product.selling_price * item.quantity
+    return totals
+
+
+class CartPricesMixin:
+    """
+    Prices of a cart from its `totals`, see `get_cart_totals()`, shared by the
+    persistent and the guest carts.
+    """
 
     def original_price(self):
         """
         Returns the total original price of all items in the cart without discount applied.
         """
-        items = self.items.all()
-        return sum([item.product.price * item.quantity for item in items])
+        return self.totals["original_price"]
 
     def discounted_price(self):
         """Returns the total discounted price of all items in the cart."""
-        items = self.items.all()
-        return sum([item.product.discounted_price * item.quantity for item in items])
+        return self.totals["discounted_price"]
 
     def discount_percentage(self):
         """Returns the total discount percentage of the cart."""
@@ -49,8 +65,7 @@ class Cart(models.Model):
         """
         Returns the subtotal price of the cart.
         """
-        items = self.items.all()
-        return sum([item.product.selling_price * item.quantity for item in items])
+        return self.totals["subtotal"]
 
     def total(self):
         """
@@ -59,16 +74,45 @@ class Cart(models.Model):
         return self.subtotal() + self.delivery_charge()
 
 
+class Cart(CartPricesMixin, models.Model):
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="cart",
+    )
+    products = models.ManyToManyField(Product, through="CartItem")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = CartManager()
+
+    def __str__(self):
+        return f"{self.id} by {self.user}"
+
+    @cached_property
+    def totals(self):
+        """Totals of the items of the cart, computed once per cart instance."""
+        return get_cart_totals(self.items.all())
+
+
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name="items")
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(
-        default=1, validators=[MinValueValidator(1), MaxValueValidator(1000)]
+        default=1,
+        validators=[MinValueValidator(1), MaxValueValidator(MAX_ITEM_QUANTITY)],
     )
     date_added = models.DateTimeField(auto_now_add=True)
 
+    objects = CartItemManager()
+
     class Meta:
         ordering = ["-date_added"]
+        constraints = [
+            # a product appears once per cart, quantities are added up instead
+            models.UniqueConstraint(
+                fields=["cart", "product"], name="unique_cart_product"
+            ),
+        ]
 
     def __str__(self):
         return f"Cart {self.cart.id}: {self.product.name} x {self.quantity}"
@@ -86,3 +130,24 @@ class CartItem(models.Model):
         Returns the total price of the item based on the product's selling price.
         """
         return self.product.selling_price * self.quantity
+
+
+class StockReservation(models.Model):
+    """
+    Units of a product held for a cart item until `expires_at`. The held
+    units are counted in `Product.reserved_stock`.
+    """
+
+    cart_item = models.OneToOneField(
+        CartItem, on_delete=models.CASCADE, related_name="reservation"
+    )
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="reservations"
+    )
+    quantity = models.PositiveIntegerField(default=0)
+    expires_at = models.DateTimeField(db_index=True)
+
+    objects = StockReservationManager()
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} until {self.expires_at}"
@@ -4,11 +4,15 @@ from rest_framework import serializers
 
 from products.models import Product
 from products.serializers import ProductSerializer
+from users.serializers import DynamicFieldsModelSerializer
 
 from .models import Cart, CartItem
 
+# lookups read by the prices of the items, see `get_cart_totals`
+ITEM_PRICE_LOOKUPS = ("quantity", "product__price", "product__discount_price")
 
-class CartItemSerializer(serializers.ModelSerializer):
+
+class CartItemSerializer(DynamicFieldsModelSerializer):
     product = ProductSerializer(
         read_only=True,
         fields=[
@@ -29,6 +33,8 @@ class CartItemSerializer(serializers.ModelSerializer):
     )
     total = serializers.SerializerMethodField()
 
+    field_lookups = {"total": ITEM_PRICE_LOOKUPS}
+
     class Meta:
         model = CartItem
         fields = ["id", "product", "product_id", "quantity", "total"]
@@ -48,7 +54,37 @@ class CartItemSerializer(serializers.ModelSerializer):
         return obj.get_total()
 
 
-class CartSerializer(serializers.ModelSerializer):
+class AddToCartSerializer(serializers.Serializer):
+    """Validates the input of adding a product to the cart, the stock is checked on insert."""
+
+    product_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, max_value=1000, default=1)
+
+
+class CartOperationSerializer(serializers.Serializer):
+    """An operation on the quantity of a product in the cart."""
+
+    action = serializers.ChoiceField(choices=["set", "add", "remove"], default="set")
+    product_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=0, max_value=1000, required=False)
+
+    def validate(self, attrs):
+        if attrs["action"] == "remove":
+            attrs["quantity"] = 0
+        elif "quantity" not in attrs:
+            raise serializers.ValidationError({"quantity": "This field is required."})
+        elif attrs["action"] == "add" and attrs["quantity"] < 1:
+            raise serializers.ValidationError(
+                {"quantity": "Ensure this value is greater than or equal to 1."}
+            )
+        return attrs
+
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=100)
+
+
+class CartSerializer(DynamicFieldsModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
     original_price = serializers.SerializerMethodField()
     discounted_price = serializers.SerializerMethodField()
@@ -57,6 +93,20 @@ class CartSerializer(serializers.ModelSerializer):
     subtotal = serializers.SerializerMethodField()
     total = serializers.SerializerMethodField()
 
+    field_lookups = {
+        **{
+            field_name: [f"items__{lookup}" for lookup in ITEM_PRICE_LOOKUPS]
+            for field_name in (
+                "original_price",
+                "discounted_price",
+                "discount_percentage",
+                "subtotal",
+                "total",
+            )
+        },
+        "delivery_charge": (),
+    }
+
     class Meta:
         model = Cart
         fields = [
@@ -0,0 +1,18 @@
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from products.models import Product
+
+from .models import StockReservation
+
+
+@receiver(post_delete, sender=StockReservation)
+def release_reserved_stock(sender, instance, **kwargs):
+    # reservations deleted through the ORM, e.g. along with their cart item,
+    # release their units; the sweeper releases expired ones in bulk
+    if instance.quantity:
+        Product.objects.filter(pk=instance.product_id).update(
+            reserved_stock=Greatest(F("reserved_stock") - instance.quantity, 0)
+        )
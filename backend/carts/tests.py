@@ -1,3 +1,659 @@
-from django.test import TestCase
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import caches
+from django.core.checks import Tags, run_checks
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from config.testing import QueryBudgetTestMixin
+from products.models import Category, Product
+from users.models import CustomUser, IdempotencyKey
+from vendors.models import Vendor
+
+from .checks import check_guest_cart_cache
+from .managers import MAX_ITEM_QUANTITY
+from .models import Cart, CartItem, StockReservation
+
+
+def cache_config(backend):
+    return {"BACKEND": f"django.core.cache.backends.{backend}", "LOCATION": "carts"}
+
+
+class UserCartTestCase(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="customer@example.com",
+            username="customer",
+            first_name="customer",
+            last_name="doe",
+        )
+        vendor_user = CustomUser.objects.create_user(
+            email="vendor@example.com",
+            username="vendor",
+            first_name="vendor",
+            last_name="doe",
+        )
+        category = Category.objects.create(name="cat1", slug="cat1")
+        vendor = Vendor.objects.create(
+            name="ven1",
+            user=vendor_user,
+            description="lorem",
+            email="ven1@example.com",
+            address="lorem",
+            phone_number="0000000000",
+            status=Vendor.Status.ACTIVE,
+        )
+        self.products = [
+            Product.objects.create(
+                name=f"product{i}",
+                slug=f"product{i}",
+                description="lorem",
+                price=Decimal("20.00"),
+                discount_price=Decimal("15.00") if i % 2 else None,
+                stock=10,
+                status=Product.Status.ACTIVE,
+                category=category,
+                vendor=vendor,
+            )
+            for i in range(5)
+        ]
+        # carts are created along with their user
+        self.cart = Cart.objects.get(user=self.user)
+        self.client.force_login(self.user)
+
+    def test_query_budget(self):
+        def add_items(count):
+            start = self.cart.items.count()
+            CartItem.objects.bulk_create(
+                CartItem(cart=self.cart, product=product, quantity=1)
+                for product in self.products[start : start + count]
+            )
+
+        self.assertQueryBudget(
+            "/api/carts/user/", add_items, user=self.user, sizes=(1, 3, 5)
+        )
+
+    def get_cart(self):
+        response = self.client.get("/api/carts/user/")
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_cart_totals(self):
+        CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=2)
+        CartItem.objects.create(cart=self.cart, product=self.products[1], quantity=1)
+        data = self.get_cart()
+        self.assertEqual(data["original_price"], 60.0)
+        self.assertEqual(data["discounted_price"], 5.0)
+        self.assertEqual(data["subtotal"], 55.0)
+        self.assertEqual(data["total"], 65.0)
+        self.assertEqual(data["discount_percentage"], 8.33)
+        self.assertEqual(sorted(item["total"] for item in data["items"]), [15.0, 40.0])
+
+    def test_query_count_does_not_depend_on_items(self):
+        CartItem.objects.create(cart=self.cart, product=self.products[0])
+        self.get_cart()  # load the session and the user once
+        with self.assertNumQueries(4):
+            self.get_cart()
+
+        for product in self.products[1:]:
+            CartItem.objects.create(cart=self.cart, product=product)
+        with self.assertNumQueries(4):
+            data = self.get_cart()
+        self.assertEqual(len(data["items"]), 5)
+
+    def test_add_to_cart_adds_up_quantities(self):
+        product = self.products[0]
+        response = self.client.post(
+            "/api/carts/add/", {"product_id": product.id, "quantity": 3}
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["quantity"], 3)
+
+        response = self.client.post(
+            "/api/carts/add/", {"product_id": product.id, "quantity": 7}
+        )
+        self.assertEqual(response.json()["quantity"], 10)
+        self.assertEqual(
+            CartItem.objects.get(cart=self.cart, product=product).quantity, 10
+        )
+
+    def test_add_to_cart_checks_stock(self):
+        product = self.products[0]
+        self.client.post("/api/carts/add/", {"product_id": product.id, "quantity": 8})
+        response = self.client.post(
+            "/api/carts/add/", {"product_id": product.id, "quantity": 3}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("quantity", response.json())
+        self.assertEqual(
+            CartItem.objects.get(cart=self.cart, product=product).quantity, 8
+        )
+
+        response = self.client.post("/api/carts/add/", {"product_id": 0})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post("/api/carts/add/", {"product_id": 999999})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("product_id", response.json())
+
+    def test_add_to_cart_creates_missing_cart(self):
+        self.cart.delete()
+        response = self.client.post(
+            "/api/carts/add/", {"product_id": self.products[0].id}
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Cart.objects.get(user=self.user).items.count(), 1)
+
+    def test_change_quantity(self):
+        item = CartItem.objects.create(
+            cart=self.cart, product=self.products[0], quantity=9
+        )
+        with self.assertNumQueries(3):
+            response = self.client.patch(f"/api/carts/increment/{item.pk}/")
+        self.assertEqual(response.json()["quantity"], 10)
+
+        # the stock is 10
+        response = self.client.patch(f"/api/carts/increment/{item.pk}/")
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.patch(f"/api/carts/decrement/{item.pk}/")
+        self.assertEqual(response.json()["quantity"], 9)
+
+        CartItem.objects.filter(pk=item.pk).update(quantity=1)
+        response = self.client.patch(f"/api/carts/decrement/{item.pk}/")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["quantity"], 1)
+
+    def test_item_quantity_is_capped(self):
+        # the stock validator doesn't cover stock updated in bulk
+        Product.objects.filter(pk__in=[p.pk for p in self.products[:2]]).update(
+            stock=5000
+        )
+        for product in self.products[:2]:
+            product.refresh_from_db()
+        item = CartItem.objects.create(
+            cart=self.cart, product=self.products[0], quantity=MAX_ITEM_QUANTITY
+        )
+        response = self.client.post(
+            "/api/carts/add/", {"product_id": self.products[0].id, "quantity": 1}
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.patch(f"/api/carts/increment/{item.pk}/")
+        self.assertEqual(response.status_code, 400)
+        item.refresh_from_db()
+        self.assertEqual(item.quantity, MAX_ITEM_QUANTITY)
+
+        # merged quantities are clamped to the cap
+        CartItem.objects.create(cart=self.cart, product=self.products[1], quantity=900)
+        updated = CartItem.objects.merge_products(
+            self.user, {self.products[0].id: 500, self.products[1].id: 500}
+        )
+        self.assertEqual(updated, 1)
+        self.assertEqual(
+            CartItem.objects.get(cart=self.cart, product=self.products[1]).quantity,
+            MAX_ITEM_QUANTITY,
+        )
+
+    def test_change_quantity_of_other_cart_item(self):
+        other = CustomUser.objects.create_user(
+            email="other@example.com",
+            username="other",
+            first_name="other",
+            last_name="doe",
+        )
+        item = CartItem.objects.create(
+            cart=Cart.objects.get(user=other), product=self.products[0]
+        )
+        response = self.client.patch(f"/api/carts/increment/{item.pk}/")
+        self.assertEqual(response.status_code, 404)
+        item.refresh_from_db()
+        self.assertEqual(item.quantity, 1)
+
+    def batch(self, *operations):
+        return self.client.post(
+            "/api/carts/batch/",
+            {"operations": operations},
+            content_type="application/json",
+        )
+
+    def test_batch_operations(self):
+        self.client.post(
+            "/api/carts/add/", {"product_id": self.products[0].id, "quantity": 4}
+        )
+        self.client.post(
+            "/api/carts/add/", {"product_id": self.products[1].id, "quantity": 2}
+        )
+        response = self.batch(
+            {"action": "set", "product_id": self.products[0].id, "quantity": 1},
+            {"action": "remove", "product_id": self.products[1].id},
+            {"action": "add", "product_id": self.products[2].id, "quantity": 3},
+            {"action": "add", "product_id": self.products[2].id, "quantity": 2},
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(
+            sorted((item["product"]["id"], item["quantity"]) for item in data["items"]),
+            [(self.products[0].id, 1), (self.products[2].id, 5)],
+        )
+        self.assertEqual(data["subtotal"], 120.0)
+
+        # the holds follow the quantities
+        self.assertEqual(
+            list(
+                Product.objects.filter(pk__in=[p.pk for p in self.products[:3]])
+                .order_by("pk")
+                .values_list("reserved_stock", flat=True)
+            ),
+            [1, 0, 5],
+        )
+        self.assertEqual(
+            sorted(StockReservation.objects.values_list("quantity", flat=True)), [1, 5]
+        )
+
+    def test_batch_operations_are_all_or_nothing(self):
+        self.client.post(
+            "/api/carts/add/", {"product_id": self.products[0].id, "quantity": 4}
+        )
+        response = self.batch(
+            {"action": "remove", "product_id": self.products[0].id},
+            {"action": "set", "product_id": self.products[1].id, "quantity": 11},
+            {"action": "add", "product_id": 999999, "quantity": 1},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            set(response.json()["products"]), {str(self.products[1].id), "999999"}
+        )
+        self.assertEqual(self.cart.items.get().quantity, 4)
+
+    def test_batch_query_count_does_not_depend_on_operations(self):
+        self.get_cart()  # load the session and the user once
+        with self.assertNumQueries(10):
+            self.batch({"product_id": self.products[0].id, "quantity": 1})
+        with self.assertNumQueries(10):
+            self.batch(
+                *(
+                    {"product_id": product.id, "quantity": 2}
+                    for product in self.products
+                )
+            )
+
+    def test_cart_items_hold_stock(self):
+        product = self.products[0]
+        self.client.post("/api/carts/add/", {"product_id": product.id, "quantity": 8})
+        product.refresh_from_db()
+        self.assertEqual(product.reserved_stock, 8)
+        self.assertEqual(product.available_stock, 2)
+        response = self.client.get(f"/api/products/{product.slug}/availability/")
+        self.assertEqual(
+            response.json(), {"id": product.id, "stock": 10, "available": 2}
+        )
+
+        # units held by a cart can't be added to another one
+        other = CustomUser.objects.create_user(
+            email="other@example.com",
+            username="other",
+            first_name="other",
+            last_name="doe",
+        )
+        self.client.force_login(other)
+        response = self.client.post(
+            "/api/carts/add/", {"product_id": product.id, "quantity": 3}
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            "/api/carts/add/", {"product_id": product.id, "quantity": 2}
+        )
+        self.assertEqual(response.status_code, 201)
+        product.refresh_from_db()
+        self.assertEqual(product.reserved_stock, 10)
+
+        # decrementing an item releases its units
+        item = CartItem.objects.get(cart__user=other)
+        response = self.client.patch(f"/api/carts/decrement/{item.pk}/")
+        self.assertEqual(response.json()["quantity"], 1)
+        self.assertEqual(StockReservation.objects.get(cart_item=item).quantity, 1)
+        product.refresh_from_db()
+        self.assertEqual(product.reserved_stock, 9)
+
+    def test_removed_cart_items_release_stock(self):
+        product = self.products[0]
+        self.client.post("/api/carts/add/", {"product_id": product.id, "quantity": 4})
+        item = CartItem.objects.get(cart=self.cart)
+        response = self.client.delete(f"/api/carts/remove/{item.pk}/")
+        self.assertEqual(response.status_code, 204)
+        product.refresh_from_db()
+        self.assertEqual(product.reserved_stock, 0)
+
+    def test_expired_reservations_are_released(self):
+        for product in self.products[:3]:
+            self.client.post(
+                "/api/carts/add/", {"product_id": product.id, "quantity": 2}
+            )
+        StockReservation.objects.filter(product__in=self.products[:2]).update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        self.assertEqual(StockReservation.objects.release_expired(batch_size=1), (2, 4))
+        reserved = Product.objects.filter(pk__in=[p.pk for p in self.products[:3]])
+        self.assertEqual(
+            sorted(reserved.values_list("reserved_stock", flat=True)), [0, 0, 2]
+        )
+        # the items stay in the cart, only their hold is gone
+        self.assertEqual(self.cart.items.count(), 3)
+
+        Product.objects.update(reserved_stock=7)
+        call_command("release_expired_reservations", "--rebuild", stdout=StringIO())
+        self.assertEqual(
+            sorted(Product.objects.values_list("reserved_stock", flat=True)),
+            [0, 0, 0, 0, 2],
+        )
+
+
+class IdempotentAddToCartTestCase(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.user = CustomUser.objects.create_user(
+            email="customer@example.com",
+            username="customer",
+            first_name="customer",
+            last_name="doe",
+        )
+        vendor_user = CustomUser.objects.create_user(
+            email="vendor@example.com",
+            username="vendor",
+            first_name="vendor",
+            last_name="doe",
+        )
+        vendor = Vendor.objects.create(
+            name="ven1",
+            user=vendor_user,
+            description="lorem",
+            email="ven1@example.com",
+            address="lorem",
+            phone_number="0000000000",
+            status=Vendor.Status.ACTIVE,
+        )
+        self.product = Product.objects.create(
+            name="product",
+            slug="product",
+            description="lorem",
+            price=Decimal("20.00"),
+            stock=10,
+            status=Product.Status.ACTIVE,
+            category=Category.objects.create(name="cat1", slug="cat1"),
+            vendor=vendor,
+        )
+        self.client.force_login(self.user)
+
+    def add(self, key, quantity=2):
+        return self.client.post(
+            "/api/carts/add/",
+            {"product_id": self.product.id, "quantity": quantity},
+            headers={"Idempotency-Key": key},
+        )
+
+    def test_retries_are_replayed(self):
+        first = self.add("retry")
+        self.assertEqual(first.status_code, 201)
+        # the replay is served from the cache, then from the table
+        for _ in range(2):
+            response = self.add("retry")
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.json(), first.json())
+            self.assertEqual(response["Idempotent-Replayed"], "true")
+            caches["default"].clear()
+        self.assertEqual(CartItem.objects.get(cart__user=self.user).quantity, 2)
+        self.assertEqual(IdempotencyKey.objects.get().status_code, 201)
+
+        # another key is another request
+        self.assertEqual(self.add("other").json()["quantity"], 4)
+
+    def test_key_reused_for_another_request(self):
+        self.add("retry")
+        response = self.add("retry", quantity=3)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(CartItem.objects.get(cart__user=self.user).quantity, 2)
+
+    def test_expired_keys_are_purged_and_reclaimed(self):
+        self.add("retry")
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        caches["default"].clear()
+        # an expired key is claimed again by the next request
+        self.assertEqual(self.add("retry").json()["quantity"], 4)
+
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        call_command("purge_idempotency_keys", stdout=StringIO())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class GuestCartTestCase(TestCase):
+    def setUp(self):
+        caches["carts"].clear()
+        self.user = CustomUser.objects.create_user(
+            email="customer@example.com",
+            username="customer",
+            first_name="customer",
+            last_name="doe",
+            password="secret-password",
+        )
+        vendor_user = CustomUser.objects.create_user(
+            email="vendor@example.com",
+            username="vendor",
+            first_name="vendor",
+            last_name="doe",
+        )
+        category = Category.objects.create(name="cat1", slug="cat1")
+        vendor = Vendor.objects.create(
+            name="ven1",
+            user=vendor_user,
+            description="lorem",
+            email="ven1@example.com",
+            address="lorem",
+            phone_number="0000000000",
+            status=Vendor.Status.ACTIVE,
+        )
+        self.products = [
+            Product.objects.create(
+                name=f"product{i}",
+                slug=f"product{i}",
+                description="lorem",
+                price=Decimal("20.00"),
+                stock=10,
+                status=Product.Status.ACTIVE,
+                category=category,
+                vendor=vendor,
+            )
+            for i in range(2)
+        ]
+
+    def add(self, product, quantity):
+        return self.client.post(
+            "/api/carts/add/", {"product_id": product.id, "quantity": quantity}
+        )
+
+    def test_guest_cart_is_not_stored_in_the_database(self):
+        # a single read of the product stock
+        with self.assertNumQueries(1):
+            response = self.add(self.products[0], 3)
+        self.assertEqual(response.json()["quantity"], 3)
+        self.assertEqual(self.add(self.products[0], 8).status_code, 400)
+        self.add(self.products[1], 1)
+
+        response = self.client.patch(f"/api/carts/increment/{self.products[1].id}/")
+        self.assertEqual(response.json()["quantity"], 2)
+        response = self.client.patch(f"/api/carts/decrement/{self.products[0].id}/")
+        self.assertEqual(response.json()["quantity"], 2)
+
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/carts/user/")
+        data = response.json()
+        self.assertEqual(data["subtotal"], 80.0)
+        self.assertEqual(
+            sorted((item["id"], item["quantity"]) for item in data["items"]),
+            [(self.products[0].id, 2), (self.products[1].id, 2)],
+        )
+        self.assertFalse(CartItem.objects.exists())
+
+        response = self.client.delete(f"/api/carts/remove/{self.products[1].id}/")
+        self.assertEqual(response.status_code, 204)
+        response = self.client.patch(f"/api/carts/increment/{self.products[1].id}/")
+        self.assertEqual(response.status_code, 404)
+
+    def test_guest_cart_writes_run_no_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.add(self.products[0], 3)
+        # only the stock is read, the cart is written to the cache
+        [query] = queries.captured_queries
+        self.assertTrue(query["sql"].startswith("SELECT"))
+
+        with self.assertNumQueries(0):
+            response = self.client.patch(f"/api/carts/decrement/{self.products[0].id}/")
+            self.assertEqual(response.json()["quantity"], 2)
+            response = self.client.delete(f"/api/carts/remove/{self.products[0].id}/")
+            self.assertEqual(response.status_code, 204)
+
+    def test_guest_batch_operations(self):
+        self.add(self.products[0], 3)
+        response = self.client.post(
+            "/api/carts/batch/",
+            {
+                "operations": [
+                    {"action": "remove", "product_id": self.products[0].id},
+                    {"action": "set", "product_id": self.products[1].id, "quantity": 4},
+                ]
+            },
+            content_type="application/json",
+        )
+        self.assertEqual(
+            [(item["id"], item["quantity"]) for item in response.json()["items"]],
+            [(self.products[1].id, 4)],
+        )
+        self.assertEqual(len(self.client.get("/api/carts/user/").json()["items"]), 1)
+
+    def test_forged_cookie_is_ignored(self):
+        self.add(self.products[0], 3)
+        self.client.cookies["guest_cart"] = "forged"
+        self.assertEqual(self.client.get("/api/carts/user/").json()["items"], [])
+
+    def test_guest_cart_is_merged_at_login(self):
+        cart = Cart.objects.get(user=self.user)
+        CartItem.objects.add_product(self.user, self.products[0].id, 6)
+        self.add(self.products[0], 4)
+        self.add(self.products[1], 2)
+        Product.objects.filter(pk=self.products[0].pk).update(stock=9)
+
+        response = self.client.post(
+            "/api/token/",
+            {"email": "customer@example.com", "password": "secret-password"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("access", response.json())
+        self.assertEqual(response.cookies["guest_cart"].value, "")
+
+        # the quantities are added up, up to the units left in stock
+        self.assertEqual(
+            sorted(cart.items.values_list("product_id", "quantity")),
+            [(self.products[0].id, 9), (self.products[1].id, 2)],
+        )
+        self.assertEqual(
+            sorted(Product.objects.values_list("reserved_stock", flat=True)), [2, 9]
+        )
+
+
+class GuestCartCacheCheckTestCase(TestCase):
+    def test_guest_carts_need_a_shared_cache(self):
+        for backend in ("redis.RedisCache", "memcached.PyMemcacheCache"):
+            with override_settings(
+                CACHES={**settings.CACHES, "carts": cache_config(backend)}
+            ):
+                self.assertEqual(check_guest_cart_cache(None), [])
+        for backend in ("locmem.LocMemCache", "db.DatabaseCache"):
+            with override_settings(
+                CACHES={**settings.CACHES, "carts": cache_config(backend)}
+            ):
+                [error] = check_guest_cart_cache(None)
+            self.assertEqual(error.id, "carts.E001")
+
+        # the local memory cache of the tests is only rejected for deployment
+        self.assertFalse(run_checks(tags=[Tags.caches]))
+        [error] = run_checks(tags=[Tags.caches], include_deployment_checks=True)
+        self.assertEqual(error.id, "carts.E001")
+
+        caches_without_carts = {
+            alias: config
+            for alias, config in settings.CACHES.items()
+            if alias != "carts"
+        }
+        with override_settings(CACHES=caches_without_carts):
+            [error] = check_guest_cart_cache(None)
+        self.assertEqual(error.id, "carts.E001")
+
+
+class ConcurrentCartItemTestCase(TransactionTestCase):
+    def test_release_locks_the_product_before_the_item(self):
+        user = CustomUser.objects.create_user(
+            email="customer@example.com",
+            username="customer",
+            first_name="customer",
+            last_name="doe",
+        )
+        vendor = Vendor.objects.create(
+            name="ven1",
+            user=CustomUser.objects.create_user(
+                email="vendor@example.com",
+                username="vendor",
+                first_name="vendor",
+                last_name="doe",
+            ),
+            description="lorem",
+            email="ven1@example.com",
+            address="lorem",
+            phone_number="0000000000",
+        )
+        product = Product.objects.create(
+            name="product0",
+            slug="product0",
+            description="lorem",
+            price=Decimal("20.00"),
+            stock=10,
+            status=Product.Status.ACTIVE,
+            category=Category.objects.create(name="cat1", slug="cat1"),
+            vendor=vendor,
+        )
+        CartItem.objects.add_product(user, product.id, 2)
+        item = CartItem.objects.get(cart__user=user)
+
+        def decrement():
+            try:
+                CartItem.objects.change_quantity(user, item.pk, -1)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=decrement)
+        with transaction.atomic():
+            # a concurrent reservation of the product
+            Product.objects.select_for_update().get(pk=product.pk)
+            thread.start()
+            with connection.cursor() as cursor:
+                for _ in range(100):
+                    cursor.execute(
+                        "SELECT COUNT(*) FROM pg_stat_activity "
+                        "WHERE wait_event_type = 'Lock' AND pid <> pg_backend_pid()"
+                    )
+                    if cursor.fetchone()[0]:
+                        break
+                    time.sleep(0.05)
+            # the waiting release doesn't hold the item the reservation updates next
+            CartItem.objects.select_for_update(nowait=True).get(pk=item.pk)
+        thread.join()
+
+        item.refresh_from_db()
+        self.assertEqual(item.quantity, 1)
+        product.refresh_from_db()
+        self.assertEqual(product.reserved_stock, 1)
@@ -7,6 +7,7 @@ urlpatterns = [
     path("<int:pk>/", views.CartDetailView.as_view()),
     path("user/", views.UserCartView.as_view()),
     path("add/", views.AddToCartView.as_view()),
+    path("batch/", views.CartBatchView.as_view()),
     path("remove/<int:pk>/", views.RemoveFromCartView.as_view()),
     path("increment/<int:pk>/", views.IncrementCartItemQuantityView.as_view()),
     path("decrement/<int:pk>/", views.DecrementCartItemQuantityView.as_view()),
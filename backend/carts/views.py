@@ -1,114 +1,232 @@
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from rest_framework import generics, permissions, status
 from rest_framework.generics import ListCreateAPIView
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from config.fields import SparseFieldsMixin
+from config.idempotency import idempotent
+from config.pagination import EstimatedCountLimitOffsetPagination
+from config.telemetry import ServerTimingMixin
+from products.models import Product
+
+from .guest import GuestCart
+from .managers import CartOperationError
 from .models import Cart, CartItem
-from .serializers import CartItemSerializer, CartSerializer
+from .serializers import AddToCartSerializer, CartBatchSerializer, CartSerializer
 
 
-class CartListView(ListCreateAPIView):
-    queryset = Cart.objects.all()
+class CartListView(ServerTimingMixin, SparseFieldsMixin, ListCreateAPIView):
+    queryset = Cart.objects.with_items()
     permission_classes = [permissions.IsAdminUser]
     serializer_class = CartSerializer
+    pagination_class = EstimatedCountLimitOffsetPagination
 
 
-class CartDetailView(generics.RetrieveAPIView):
+class CartDetailView(ServerTimingMixin, generics.RetrieveAPIView):
     pass
 
 
-class UserCartView(APIView):
+def product_not_found_response(product_id):
+    return Response(
+        {"product_id": [f'Invalid pk "{product_id}" - object does not exist.']},
+        status=status.HTTP_400_BAD_REQUEST,
+    )
+
+
+def stock_exceeded_response():
+    return Response(
+        {"quantity": "Quantity exceeds available stock."},
+        status=status.HTTP_400_BAD_REQUEST,
+    )
+
+
+class UserCartView(ServerTimingMixin, APIView):
     """
-    View to retrieve request user's cart.
+    View to retrieve request user's cart, or the guest cart of anonymous users.
     """
 
-    permission_classes = [permissions.IsAuthenticated]
+    query_budget = 2
+    permission_classes = [permissions.AllowAny]
 
     def get(self, request, *args, **kwargs):
-        cart, _ = Cart.objects.get_or_create(user=request.user)
-        serializer = CartSerializer(cart)
+        if request.user.is_anonymous:
+            cart = GuestCart.from_request(request)
+            serializer = CartSerializer(cart, context={"request": request})
+            return Response(serializer.data, status=status.HTTP_200_OK)
+
+        cart, _ = Cart.objects.with_items().get_or_create(user=request.user)
+        serializer = CartSerializer(cart, context={"request": request})
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class AddToCartView(APIView):
-    """Add product to the cart."""
+class AddToCartView(ServerTimingMixin, APIView):
+    """Add product to the cart, or to the guest cart of anonymous users."""
 
-    permission_classes = [permissions.IsAuthenticated]
+    permission_classes = [permissions.AllowAny]
 
+    @idempotent
     def post(self, request, *args, **kwargs):
-        cart, _ = Cart.objects.get_or_create(user=self.request.user)
-        serializer = CartItemSerializer(data=request.data)
+        serializer = AddToCartSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
+        product_id = serializer.validated_data["product_id"]
+        quantity = serializer.validated_data["quantity"]
+
+        if request.user.is_anonymous:
+            guest_cart = GuestCart.from_request(request)
+            quantity = guest_cart.add_product(product_id, quantity)
+        else:
+            # the stock check is part of the upsert, so concurrent additions
+            # can't exceed the stock
+            quantity = CartItem.objects.add_product(request.user, product_id, quantity)
+        if quantity is None:
+            if not Product.objects.filter(pk=product_id).exists():
+                return product_not_found_response(product_id)
+            return stock_exceeded_response()
+
+        response = Response(
+            {"message": "Product added successully.", "quantity": quantity},
+            status=status.HTTP_201_CREATED,
+        )
+        if request.user.is_anonymous:
+            guest_cart.save(response)
+        return response
 
-        product = serializer._validated_data["product"]
-        quantity = serializer._validated_data.get("quantity", 1)
 
-        cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
-        if not created:
-            # If the item already exists, update the quantity
-            cart_item.quantity += quantity
-            cart_item.save()
-        return Response(
-            {"message": "Product added successully."}, status=status.HTTP_201_CREATED
-        )
+class CartBatchView(ServerTimingMixin, APIView):
+    """
+    Apply several quantity operations to the cart in a single transaction,
+    and return the updated cart.
+    """
 
+    permission_classes = [permissions.AllowAny]
 
-class RemoveFromCartView(APIView):
+    @idempotent
+    def post(self, request, *args, **kwargs):
+        serializer = CartBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        operations = serializer.validated_data["operations"]
+
+        try:
+            if request.user.is_anonymous:
+                cart = GuestCart.from_request(request)
+                cart.apply_operations(operations)
+            else:
+                CartItem.objects.apply_operations(request.user, operations)
+                cart = Cart.objects.with_items().get(user=request.user)
+        except CartOperationError as error:
+            return Response(
+                {"products": error.errors}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        serializer = CartSerializer(cart, context={"request": request})
+        response = Response(serializer.data, status=status.HTTP_200_OK)
+        if request.user.is_anonymous:
+            cart.save(response)
+        return response
+
+
+class RemoveFromCartView(ServerTimingMixin, APIView):
     """Remove product from the cart."""
 
-    permission_classes = [permissions.IsAuthenticated]
+    permission_classes = [permissions.AllowAny]
 
+    @idempotent
     def delete(self, request, pk, *args, **kwargs):
-        cart = get_object_or_404(Cart, user=request.user)
-        cart_item = get_object_or_404(CartItem, cart=cart, pk=pk)
-        cart_item.delete()
-        return Response(
+        response = Response(
             {"message": "Product removed successfully."},
             status=status.HTTP_204_NO_CONTENT,
         )
+        if request.user.is_anonymous:
+            # guest cart items are identified by their product
+            guest_cart = GuestCart.from_request(request)
+            if not guest_cart.remove(pk):
+                raise Http404
+            guest_cart.save(response)
+            return response
 
-
-class IncrementCartItemQuantityView(APIView):
-    def patch(self, request, pk, *args, **kwargs):
         cart = get_object_or_404(Cart, user=request.user)
         cart_item = get_object_or_404(CartItem, cart=cart, pk=pk)
-        # Check if the incremented quantity exceeds the stock
-        # add 1 to the current quantity to simulate the increment
-        if cart_item.quantity + 1 > cart_item.product.stock:
-            return Response(
-                {"quantity": "Quantity exceeds available stock."},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-        cart_item.quantity += 1
-        cart_item.save()
+        cart_item.delete()
+        return response
+
+
+class IncrementCartItemQuantityView(ServerTimingMixin, APIView):
+    permission_classes = [permissions.AllowAny]
+
+    @idempotent
+    def patch(self, request, pk, *args, **kwargs):
+        if request.user.is_anonymous:
+            return self.patch_guest_cart(request, pk)
+
+        # increment by 1 unless the incremented quantity exceeds the stock
+        quantity = CartItem.objects.change_quantity(request.user, pk, 1)
+        if quantity is None:
+            get_object_or_404(CartItem, cart__user=request.user, pk=pk)
+            return stock_exceeded_response()
+        return self.get_response(quantity)
+
+    def patch_guest_cart(self, request, product_id):
+        guest_cart = GuestCart.from_request(request)
+        if product_id not in guest_cart.quantities:
+            raise Http404
+        quantity = guest_cart.change_quantity(product_id, 1)
+        if quantity is None:
+            return stock_exceeded_response()
+        response = self.get_response(quantity)
+        guest_cart.save(response)
+        return response
+
+    def get_response(self, quantity):
         return Response(
             {
                 "message": "Product quantity incremented successfully.",
-                "quantity": cart_item.quantity,
+                "quantity": quantity,
             },
             status=status.HTTP_200_OK,
         )
 
 
-class DecrementCartItemQuantityView(APIView):
+class DecrementCartItemQuantityView(ServerTimingMixin, APIView):
+    permission_classes = [permissions.AllowAny]
+
+    @idempotent
     def patch(self, request, pk, *args, **kwargs):
-        cart = get_object_or_404(Cart, user=request.user)
-        cart_item = get_object_or_404(CartItem, cart=cart, pk=pk)
-        if cart_item.quantity <= 1:
-            return Response(
-                {
-                    "message": "Cannot decrement quantity. Minimum quantity is 1.",
-                    "quantity": cart_item.quantity,
-                },
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-        cart_item.quantity -= 1
-        cart_item.save()
+        if request.user.is_anonymous:
+            return self.patch_guest_cart(request, pk)
+
+        quantity = CartItem.objects.change_quantity(request.user, pk, -1)
+        if quantity is None:
+            cart_item = get_object_or_404(CartItem, cart__user=request.user, pk=pk)
+            return self.get_minimum_quantity_response(cart_item.quantity)
+        return self.get_response(quantity)
+
+    def patch_guest_cart(self, request, product_id):
+        guest_cart = GuestCart.from_request(request)
+        if product_id not in guest_cart.quantities:
+            raise Http404
+        quantity = guest_cart.change_quantity(product_id, -1)
+        if quantity is None:
+            return self.get_minimum_quantity_response(guest_cart.quantities[product_id])
+        response = self.get_response(quantity)
+        guest_cart.save(response)
+        return response
+
+    def get_minimum_quantity_response(self, quantity):
+        return Response(
+            {
+                "message": "Cannot decrement quantity. Minimum quantity is 1.",
+                "quantity": quantity,
+            },
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    def get_response(self, quantity):
         return Response(
             {
                 "message": "Product quantity decremented successfully.",
-                "quantity": cart_item.quantity,
+                "quantity": quantity,
             },
             status=status.HTTP_200_OK,
         )
@@ -0,0 +1,254 @@
+import secrets
+import statistics
+import time
+import tracemalloc
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import get_key_func
+from django.db import transaction
+from django.test import override_settings
+from rest_framework.permissions import SAFE_METHODS
+
+from config.caching import RESPONSE_CACHE_ALIAS
+from config.queries import QueryRecorder
+
+# latency percentiles of the results
+PERCENTILES = (50, 95, 99)
+# metrics compared against a baseline, higher values being worse
+COMPARED_METRICS = ("p50_ms", "p95_ms", "p99_ms", "queries", "allocated_kib")
+# metrics compared exactly, any increase being a regression
+EXACT_METRICS = {"queries"}
+
+
+def get_server_name():
+    """
+    Returns a host name accepted by ALLOWED_HOSTS, sent by the benchmark
+    client instead of the `testserver` default of the test client.
+    """
+    for host in settings.ALLOWED_HOSTS:
+        if host != "*":
+            # ".example.com" also matches example.com
+            return host.lstrip(".")
+    return "localhost"
+
+
+class IsolatedCaches:
+    """
+    Points every cache alias at a namespace of its own while the benchmark
+    runs: the backends are kept, so the cache costs are measured, but the keys
+    get a prefix unique to the run. The benchmark then neither reads nor
+    overwrites the entries of the site, e.g. sessions, throttles, cached
+    responses and hit counters.
+
+    The keys used are recorded, so `delete()` removes the entries of the
+    benchmark only, where clearing the caches would drop the entries of the
+    site too. They are all deleted on exit.
+    """
+
+    def __init__(self):
+        self.prefix = f"benchmark-{secrets.token_hex(4)}"
+        # {alias: {(key, version)}}
+        self.keys = defaultdict(set)
+        self.override = override_settings(
+            CACHES={
+                alias: self.isolate(alias, config)
+                for alias, config in settings.CACHES.items()
+            }
+        )
+
+    def isolate(self, alias, config):
+        key_func = get_key_func(config.get("KEY_FUNCTION"))
+        keys = self.keys[alias]
+
+        def make_key(key, key_prefix, version):
+            keys.add((key, version))
+            return key_func(key, key_prefix, version)
+
+        key_prefix = ":".join(filter(None, [self.prefix, config.get("KEY_PREFIX")]))
+        return {**config, "KEY_PREFIX": key_prefix, "KEY_FUNCTION": make_key}
+
+    def delete(self, alias=None):
+        """Deletes the entries of the benchmark from the cache `alias`, or all caches."""
+        for alias in [alias] if alias else list(self.keys):
+            versions = defaultdict(list)
+            for key, version in self.keys[alias]:
+                versions[version].append(key)
+            for version, keys in versions.items():
+                caches[alias].delete_many(keys, version=version)
+            # deleting records the keys again
+            self.keys[alias].clear()
+
+    def __enter__(self):
+        self.override.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            self.delete()
+        finally:
+            self.override.disable()
+
+
+class RollBack(Exception):
+    def __init__(self, response):
+        super().__init__(response)
+        self.response = response
+
+
+class Endpoint:
+    """
+    A benchmarked endpoint. `build_request(index)` returns the path and the
+    data of the index-th request, so the requests can vary, e.g. across
+    products or search terms.
+
+    With `rollback`, the default for unsafe methods, each request runs in a
+    transaction of its own that is rolled back, so every request starts from
+    the same rows.
+    """
+
+    def __init__(
+        self,
+        name,
+        method,
+        build_request,
+        expected_status=200,
+        rollback=None,
+        **extra,
+    ):
+        self.name = name
+        self.method = method
+        self.build_request = build_request
+        self.expected_status = expected_status
+        self.rollback = method not in SAFE_METHODS if rollback is None else rollback
+        # headers of the requests, e.g. HTTP_AUTHORIZATION
+        self.extra = extra
+
+    def send(self, client, index):
+        path, data = self.build_request(index)
+        send = getattr(client, self.method.lower())
+        if self.rollback:
+            try:
+                with transaction.atomic():
+                    raise RollBack(send(path, data, **self.extra))
+            except RollBack as rollback:
+                response = rollback.response
+        else:
+            response = send(path, data, **self.extra)
+        if response.status_code != self.expected_status:
+            raise RuntimeError(
+                f"{self.name}: {self.method} {path} returned "
+                f"{response.status_code}: {response.content[:200]!r}"
+            )
+        return response
+
+
+class EndpointBenchmark:
+    """
+    Sends requests to endpoints through the full middleware and URL stack of a
+    test client, and measures their latency, throughput, queries and allocated
+    memory. Queries and memory are measured on separate requests, as tracing
+    them slows the requests down.
+
+    With `cold`, the responses cached by the benchmark in the `caches` are
+    deleted before each request, so the views run every time.
+    """
+
+    def __init__(
+        self,
+        client,
+        caches,
+        requests=100,
+        warmup=10,
+        traced_requests=10,
+        cold=False,
+    ):
+        self.client = client
+        self.caches = caches
+        self.requests = requests
+        self.warmup = warmup
+        self.traced_requests = traced_requests
+        self.cold = cold
+
+    def prepare(self):
+        if self.cold:
+            self.caches.delete(RESPONSE_CACHE_ALIAS)
+
+    def run(self, endpoint):
+        """Returns the metrics of the endpoint, latencies in milliseconds."""
+        for index in range(self.warmup):
+            self.prepare()
+            endpoint.send(self.client, index)
+
+        latencies = []
+        for index in range(self.requests):
+            self.prepare()
+            start = time.perf_counter()
+            endpoint.send(self.client, index)
+            latencies.append(time.perf_counter() - start)
+
+        queries = []
+        for index in range(self.traced_requests):
+            self.prepare()
+            with QueryRecorder() as recorder:
+                endpoint.send(self.client, index)
+            queries.append(recorder.count)
+
+        allocated = []
+        tracemalloc.start()
+        try:
+            for index in range(self.traced_requests):
+                self.prepare()
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                endpoint.send(self.client, index)
+                allocated.append(tracemalloc.get_traced_memory()[1] - before)
+        finally:
+            tracemalloc.stop()
+
+        return {
+            "requests": len(latencies),
+            "requests_per_s": round(len(latencies) / sum(latencies), 1),
+            "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+            **{
+                f"p{percentile}_ms": round(
+                    get_percentile(latencies, percentile) * 1000, 3
+                )
+                for percentile in PERCENTILES
+            },
+            "queries": round(statistics.fmean(queries), 2) if queries else None,
+            "allocated_kib": (
+                round(statistics.fmean(allocated) / 1024, 1) if allocated else None
+            ),
+        }
+
+
+def get_percentile(values, percentile):
+    """Returns the percentile of the values, interpolated between the closest ones."""
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[percentile - 1]
+
+
+def compare_results(results, baseline, tolerance):
+    """
+    Returns `(endpoint, metric, baseline, result)` tuples of the metrics over
+    their baseline by more than the `tolerance` ratio, or over it at all for
+    query counts. Endpoints and metrics missing from either side are skipped.
+    """
+    regressions = []
+    for name, metrics in results.items():
+        baseline_metrics = baseline.get(name)
+        if baseline_metrics is None:
+            continue
+        for metric in COMPARED_METRICS:
+            value, baseline_value = metrics.get(metric), baseline_metrics.get(metric)
+            if value is None or baseline_value is None:
+                continue
+            limit = baseline_value
+            if metric not in EXACT_METRICS:
+                limit *= 1 + tolerance
+            if value > limit:
+                regressions.append((name, metric, baseline_value, value))
+    return regressions
@@ -0,0 +1,258 @@
+import datetime
+import hashlib
+import json
+import time
+
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from config.telemetry import ServerTimingMixin
+from users.permissions import IsAdmin
+
+# Cache alias holding the cached responses and the generation counters.
+RESPONSE_CACHE_ALIAS = "responses"
+# Entries are invalidated through generations, the timeout only bounds how
+# long unreachable entries occupy the cache.
+RESPONSE_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def get_response_cache():
+    return caches[RESPONSE_CACHE_ALIAS]
+
+
+def get_generations(names):
+    """
+    Returns the current generation of each name.
+
+    A missing generation starts at the current time, so a counter that was
+    evicted from the cache never repeats a value used by older entries.
+    """
+    cache = get_response_cache()
+    keys = {name: f"generation:{name}" for name in names}
+    generations = cache.get_many(keys.values())
+    for key in keys.values():
+        if key not in generations:
+            cache.add(key, time.time_ns(), timeout=None)
+            generations[key] = cache.get(key)
+    return {name: generations[key] for name, key in keys.items()}
+
+
+def bump_generation(*names):
+    """Invalidates every cached response that depends on one of the names."""
+    cache = get_response_cache()
+    for name in names:
+        try:
+            cache.incr(f"generation:{name}")
+        except ValueError:
+            cache.add(f"generation:{name}", time.time_ns(), timeout=None)
+
+
+def record_cache_lookup(view_name, hit):
+    cache = get_response_cache()
+    key = f"stats:{view_name}:{'hit' if hit else 'miss'}"
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, timeout=None)
+
+
+# response headers stored along with the cached response data
+CACHED_RESPONSE_HEADERS = ("ETag", "Last-Modified")
+
+
+class CachedResponseMixin:
+    """
+    Caches the successful GET responses of the view, keyed on the request URL
+    with normalized query parameters, the visibility class of the user and the
+    generations of `cache_dependencies`.
+
+    Anonymous and customer users share the "public" visibility class and
+    admin users get their own. Vendor users aren't cached, because vendors
+    can see their own unpublished products.
+    """
+
+    # generation names the response depends on, bumped when their rows change
+    cache_dependencies = ()
+    cached_views = set()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        CachedResponseMixin.cached_views.add(cls.__name__)
+
+    def get_cache_visibility(self, request):
+        user = request.user
+        if not user.is_authenticated or user.is_customer:
+            return "public"
+        if user.is_admin:
+            return "admin"
+        return None
+
+    def is_response_cacheable(self, response):
+        return response.status_code == 200
+
+    def get_response_cache_key(self, request, visibility):
+        generations = get_generations(self.cache_dependencies)
+        params = sorted(
+            (key, sorted(values)) for key, values in request.query_params.lists()
+        )
+        key_data = [
+            request.build_absolute_uri(request.path),
+            visibility,
+            params,
+            [generations[name] for name in self.cache_dependencies],
+        ]
+        digest = hashlib.sha256(json.dumps(key_data).encode()).hexdigest()
+        return f"response:{digest}"
+
+    def get(self, request, *args, **kwargs):
+        visibility = self.get_cache_visibility(request)
+        if visibility is None:
+            return super().get(request, *args, **kwargs)
+
+        cache = get_response_cache()
+        key = self.get_response_cache_key(request, visibility)
+        cached = cache.get(key)
+        record_cache_lookup(type(self).__name__, hit=cached is not None)
+        if cached is not None:
+            headers = cached["headers"]
+            # validators of a cached response are as fresh as the response itself
+            response = get_conditional_response(
+                request,
+                etag=headers.get("ETag"),
+                last_modified=parse_http_date_safe(headers.get("Last-Modified", "")),
+            ) or Response(cached["data"], headers=headers)
+            response["X-Cache"] = "HIT"
+            return response
+
+        response = super().get(request, *args, **kwargs)
+        if self.is_response_cacheable(response):
+            headers = {
+                header: response[header]
+                for header in CACHED_RESPONSE_HEADERS
+                if header in response
+            }
+            cache.set(
+                key,
+                {"data": response.data, "headers": headers},
+                timeout=RESPONSE_CACHE_TIMEOUT,
+            )
+        response["X-Cache"] = "MISS"
+        return response
+
+
+class ConditionalGetMixin:
+    """
+    Adds an ETag to GET responses and answers conditional requests with
+    `304 Not Modified`.
+
+    Detail views use the values of `conditional_fields` of the object for a
+    strong ETag, and the latest timestamp among them as Last-Modified. They
+    answer conditional requests from a pre-query of those values, before the
+    object is loaded and serialized.
+
+    List views use a weak ETag of the serialized page, so no query beyond the
+    page itself is run, and have no Last-Modified, which cannot tell removed
+    rows apart. Conditional requests are answered once the page is serialized.
+
+    Combined with `CachedResponseMixin`, this mixin must follow it, so the
+    validators are cached along with the response.
+    """
+
+    conditional_fields = ("updated_at",)
+
+    def get_conditional_queryset(self):
+        """Returns the queryset of the rows the user may see, used for the pre-query."""
+        return self.filter_queryset(self.get_queryset())
+
+    def get_conditional_variant(self, request):
+        """Returns the part of the ETag distinguishing representations of the same rows."""
+        user = request.user
+        role = "admin" if user.is_authenticated and user.is_admin else "public"
+        return [role, request.accepted_renderer.format]
+
+    def get_conditional_state(self, request):
+        """Returns the `(etag, last_modified)` of the object, or `(None, None)`."""
+        queryset = self.get_conditional_queryset()
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        filter_kwargs = {self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        values = (
+            queryset.filter(**filter_kwargs)
+            .values_list(*self.conditional_fields)
+            .first()
+        )
+        if values is None:
+            # let the view raise the appropriate error
+            return None, None
+
+        key_data = [self.get_conditional_variant(request), values]
+        digest = hashlib.md5(json.dumps(key_data, default=str).encode()).hexdigest()
+        timestamps = [
+            value.timestamp()
+            for value in values
+            if isinstance(value, datetime.datetime)
+        ]
+        return f'"{digest}"', int(max(timestamps)) if timestamps else None
+
+    def get_list_etag(self, request, data):
+        """Returns the weak ETag of the serialized page."""
+        key_data = [self.get_conditional_variant(request), data]
+        digest = hashlib.md5(json.dumps(key_data, default=str).encode()).hexdigest()
+        return f'W/"{digest}"'
+
+    def get(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        if lookup_url_kwarg not in self.kwargs:
+            return self.get_list(request, *args, **kwargs)
+
+        etag, last_modified = self.get_conditional_state(request)
+        if etag is None:
+            return super().get(request, *args, **kwargs)
+
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if not_modified is not None:
+            return not_modified
+
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            response["ETag"] = etag
+            if last_modified is not None:
+                response["Last-Modified"] = http_date(last_modified)
+        return response
+
+    def get_list(self, request, *args, **kwargs):
+        response = super().get(request, *args, **kwargs)
+        if response.status_code != 200:
+            return response
+        response["ETag"] = self.get_list_etag(request, response.data)
+        return get_conditional_response(request, etag=response["ETag"]) or response
+
+
+class ResponseCacheStatsView(ServerTimingMixin, APIView):
+    """Retrieve the response cache hits and misses of each cached view."""
+
+    permission_classes = [IsAdmin]
+
+    def get(self, request, *args, **kwargs):
+        views = sorted(CachedResponseMixin.cached_views)
+        keys = [f"stats:{view}:{kind}" for view in views for kind in ("hit", "miss")]
+        counters = get_response_cache().get_many(keys)
+
+        stats = []
+        for view in views:
+            hits = counters.get(f"stats:{view}:hit", 0)
+            misses = counters.get(f"stats:{view}:miss", 0)
+            lookups = hits + misses
+            stats.append(
+                {
+                    "view": view,
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_ratio": round(hits / lookups, 4) if lookups else None,
+                }
+            )
+        return Response({"views": stats})
@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.checks import Error
+
+# cache backends whose entries are private to the server process
+PROCESS_LOCAL_CACHE_BACKENDS = {
+    "django.core.cache.backends.dummy.DummyCache",
+    "django.core.cache.backends.locmem.LocMemCache",
+}
+
+# cache backend writing every entry to a database table
+DATABASE_CACHE_BACKEND = "django.core.cache.backends.db.DatabaseCache"
+
+
+def check_shared_cache(alias, check_id, contents, allow_database=True):
+    """
+    Returns an error if the cache `alias`, which holds `contents`, is missing
+    or private to the server process, so it isn't seen by the other processes,
+    or if it's stored in the database while `allow_database` is false.
+    """
+    config = settings.CACHES.get(alias)
+    if config is None:
+        return [
+            Error(
+                f'The "{alias}" cache, holding {contents}, is not configured.',
+                hint=f'Add a shared cache to CACHES["{alias}"].',
+                id=check_id,
+            )
+        ]
+    if config["BACKEND"] in PROCESS_LOCAL_CACHE_BACKENDS:
+        return [
+            Error(
+                f'The "{alias}" cache, holding {contents}, is private to the '
+                f"server process.",
+                hint=(
+                    f'Point CACHES["{alias}"] at a cache shared by the server '
+                    f"processes, e.g. redis or memcached."
+                ),
+                id=check_id,
+            )
+        ]
+    if not allow_database and config["BACKEND"] == DATABASE_CACHE_BACKEND:
+        return [
+            Error(
+                f'The "{alias}" cache, holding {contents}, is stored in the database.',
+                hint=f'Point CACHES["{alias}"] at redis or memcached.',
+                id=check_id,
+            )
+        ]
+    return []
@@ -0,0 +1,291 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from django.utils.functional import cached_property
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.relations import ManyRelatedField, RelatedField
+
+from users.serializers import DynamicFieldsModelSerializer
+
+# lookup of all the columns of a model, e.g. `vendor__*`
+ALL_FIELDS = "*"
+
+
+def get_query_param_names(request, param):
+    """Returns the comma separated names of the query parameter, or None if absent."""
+    if param not in request.query_params:
+        return None
+    return [
+        name.strip()
+        for value in request.query_params.getlist(param)
+        for name in value.split(",")
+        if name.strip()
+    ]
+
+
+def get_serializer_lookups(serializer, model, prefix=""):
+    """Returns the lookups of the model fields read by the readable fields of the serializer."""
+    lookups = [
+        f"{prefix}{lookup}"
+        for lookup in getattr(serializer, "representation_lookups", ())
+    ]
+    for field in serializer._readable_fields:
+        lookups.extend(get_field_lookups(field, model, prefix))
+    return lookups
+
+
+def get_field_lookups(field, model, prefix=""):
+    """
+    Returns the lookups of the model fields the serializer field reads, through
+    relations and nested serializers. Lookups that can't be derived from the
+    source (method fields, properties) are read from the `field_lookups` of
+    the serializer, or all the columns of the model are read.
+    """
+    declared = getattr(field.parent, "field_lookups", {})
+    if field.field_name in declared:
+        return [f"{prefix}{lookup}" for lookup in declared[field.field_name]]
+    if isinstance(field, serializers.SerializerMethodField) or field.source == "*":
+        return [f"{prefix}{ALL_FIELDS}"]
+
+    lookups = []
+    opts = model._meta
+    for index, attr in enumerate(field.source_attrs):
+        try:
+            model_field = opts.get_field(attr)
+        except FieldDoesNotExist:
+            return [*lookups, f"{prefix}{ALL_FIELDS}"]
+        lookup = f"{prefix}{attr}"
+        is_last = index == len(field.source_attrs) - 1
+
+        if not model_field.is_relation:
+            return [*lookups, lookup if is_last else f"{prefix}{ALL_FIELDS}"]
+        if model_field.concrete and not model_field.many_to_many:
+            # the foreign key column
+            lookups.append(lookup)
+        if is_last:
+            related_model = model_field.related_model
+            if isinstance(field, ManyRelatedField):
+                return [*lookups, f"{lookup}__pk"]
+            if isinstance(field, RelatedField) and field.use_pk_only_optimization():
+                return lookups if model_field.concrete else [f"{lookup}__pk"]
+            if isinstance(field, serializers.ListSerializer):
+                field = field.child
+            if isinstance(field, serializers.ModelSerializer):
+                return [
+                    *lookups,
+                    *get_serializer_lookups(field, related_model, f"{lookup}__"),
+                ]
+            return [*lookups, f"{lookup}__{ALL_FIELDS}"]
+
+        prefix = f"{lookup}__"
+        opts = model_field.related_model._meta
+    return lookups
+
+
+class QueryPlan:
+    """
+    The columns and relations of a model read by a set of lookups, e.g. from
+    `get_serializer_lookups`. To-one relations are joined with
+    `select_related`, to-many relations are prefetched with their own plans,
+    and only the read columns are loaded.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.field_names = {model._meta.pk.name}
+        self.all_fields = False
+        # name -> plan of the related model
+        self.joined = {}
+        self.prefetched = {}
+
+    def add(self, lookup):
+        name, _, rest = lookup.partition("__")
+        if name == ALL_FIELDS:
+            self.all_fields = True
+            return
+        if name == "pk":
+            name = self.model._meta.pk.name
+        try:
+            model_field = self.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # annotations and properties
+            self.all_fields = True
+            return
+
+        if not model_field.is_relation:
+            self.field_names.add(name)
+            return
+        related_model = model_field.related_model
+        if model_field.many_to_many or model_field.one_to_many:
+            plan = self.prefetched.get(name)
+            if plan is None:
+                plan = self.prefetched[name] = QueryPlan(related_model)
+                if model_field.one_to_many:
+                    # the foreign key the prefetched rows are matched on
+                    plan.add(model_field.field.name)
+        else:
+            if model_field.concrete:
+                self.field_names.add(name)
+            if not rest and model_field.concrete:
+                return
+            plan = self.joined.get(name)
+            if plan is None:
+                plan = self.joined[name] = QueryPlan(related_model)
+        if rest:
+            plan.add(rest)
+
+    def get_only(self, prefix=""):
+        if self.all_fields:
+            field_names = [field.name for field in self.model._meta.concrete_fields]
+        else:
+            field_names = sorted(self.field_names)
+        lookups = [f"{prefix}{name}" for name in field_names]
+        for name, plan in self.joined.items():
+            lookups.extend(plan.get_only(f"{prefix}{name}__"))
+        return lookups
+
+    def get_select_related(self, prefix=""):
+        lookups = []
+        for name, plan in self.joined.items():
+            lookups.append(f"{prefix}{name}")
+            lookups.extend(plan.get_select_related(f"{prefix}{name}__"))
+        return lookups
+
+    def get_prefetches(self, prefix=""):
+        prefetches = []
+        for name, plan in self.prefetched.items():
+            queryset = plan.apply(plan.model._default_manager.all())
+            prefetches.append(Prefetch(f"{prefix}{name}", queryset=queryset))
+        for name, plan in self.joined.items():
+            prefetches.extend(plan.get_prefetches(f"{prefix}{name}__"))
+        return prefetches
+
+    def apply(self, queryset):
+        """Returns the queryset with the relations and columns of the plan only."""
+        queryset = queryset.select_related(None).prefetch_related(None)
+        select_related = self.get_select_related()
+        if select_related:
+            # without arguments, `select_related` follows every foreign key
+            queryset = queryset.select_related(*select_related)
+        prefetches = self.get_prefetches()
+        if prefetches:
+            queryset = queryset.prefetch_related(*prefetches)
+        return queryset.only(*self.get_only())
+
+
+class QueryPlanMixin:
+    """
+    Plans the queryset of GET requests from the field tree of the serializer
+    with `QueryPlan`, instead of hand tuned `select_related`, `only` and
+    `defer` calls, so nested serializers don't query once per row.
+
+    Fields that read relations through methods or properties must declare
+    their lookups in the `field_lookups` of their serializer. The relations
+    of the view queryset are replaced by the planned ones.
+    """
+
+    # lookups read by the view itself, e.g. for permission checks
+    required_lookups = ()
+
+    def get_query_plan(self, queryset):
+        model = queryset.model
+        plan = QueryPlan(model)
+        serializer = self.get_serializer()
+        for lookup in (
+            *self.required_lookups,
+            *get_serializer_lookups(serializer, model),
+        ):
+            plan.add(lookup)
+
+        # cursors are created from the ordering fields of the boundary rows
+        ordering = [*(queryset.query.order_by or model._meta.ordering)]
+        cursor_paginator = getattr(self.paginator, "cursor_paginator", None)
+        if cursor_paginator is not None:
+            cursor_ordering = cursor_paginator.ordering
+            if isinstance(cursor_ordering, str):
+                cursor_ordering = [cursor_ordering]
+            ordering.extend(cursor_ordering)
+        for term in ordering:
+            if not isinstance(term, str):
+                continue
+            name = term.lstrip("-")
+            try:
+                model._meta.get_field(name)
+            except FieldDoesNotExist:
+                # annotations, expressions and `pk`
+                continue
+            plan.add(name)
+        return plan
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method not in SAFE_METHODS or not issubclass(
+            self.get_serializer_class(), serializers.ModelSerializer
+        ):
+            return queryset
+        return self.get_query_plan(queryset).apply(queryset)
+
+
+class SparseFieldsMixin(QueryPlanMixin):
+    """
+    Lets GET requests pick the fields of a `DynamicFieldsModelSerializer` with
+    `?fields=id,name`, or add fields to `default_fields` with
+    `?include=description`. The query is planned for the selected fields, and
+    views can skip the annotations of unselected fields with
+    `is_field_selected`.
+
+    Combined with `ConditionalGetMixin`, this mixin must precede it, so the
+    ETag varies with the selected fields.
+    """
+
+    fields_query_param = "fields"
+    include_query_param = "include"
+    # fields serialized without a `fields` parameter, None for all the fields
+    default_fields = None
+
+    @cached_property
+    def selected_fields(self):
+        """Returns the names of the selected fields, or None for all the fields."""
+        request = self.request
+        serializer_class = self.get_serializer_class()
+        if request.method not in SAFE_METHODS or not issubclass(
+            serializer_class, DynamicFieldsModelSerializer
+        ):
+            return None
+
+        fields = get_query_param_names(request, self.fields_query_param)
+        include = get_query_param_names(request, self.include_query_param)
+        if fields is None and include is None and self.default_fields is None:
+            return None
+
+        serializer = serializer_class(context=self.get_serializer_context())
+        available = [field.field_name for field in serializer._readable_fields]
+        for param, names in (
+            (self.fields_query_param, fields),
+            (self.include_query_param, include),
+        ):
+            unknown = [name for name in names or () if name not in available]
+            if unknown:
+                raise ValidationError(
+                    {param: [f"Unknown field(s): {', '.join(unknown)}."]}
+                )
+
+        if fields is None:
+            fields = available if self.default_fields is None else self.default_fields
+        selected = set(fields).union(include or ())
+        # in the order of the serializer, so equal selections are equal
+        return tuple(name for name in available if name in selected)
+
+    def is_field_selected(self, *field_names):
+        """Returns whether any of the fields is serialized."""
+        selected = self.selected_fields
+        return selected is None or any(name in selected for name in field_names)
+
+    def get_serializer(self, *args, **kwargs):
+        if self.selected_fields is not None:
+            kwargs.setdefault("fields", self.selected_fields)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_conditional_variant(self, request):
+        return [*super().get_conditional_variant(request), self.selected_fields]
@@ -0,0 +1,163 @@
+import functools
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from users.models import IdempotencyKey
+
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+# Cache alias holding the fast-path copies of the recorded responses.
+IDEMPOTENCY_CACHE_ALIAS = "default"
+
+# Claims the key for the request. An expired record of the key is reclaimed,
+# otherwise nothing is returned. A concurrent retry waits on the unique index
+# until the first request commits, and then finds its record.
+CLAIM_SQL = """
+    INSERT INTO {table} AS record (user_id, key, fingerprint, created_at)
+    VALUES (%(user_id)s, %(key)s, %(fingerprint)s, %(now)s)
+    ON CONFLICT (user_id, key) DO UPDATE
+    SET fingerprint = EXCLUDED.fingerprint,
+        status_code = NULL,
+        response = NULL,
+        created_at = EXCLUDED.created_at
+    WHERE record.created_at <= %(expired_before)s
+    RETURNING id
+"""
+
+
+def get_cache_key(user_id, key):
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return f"idempotency:{user_id}:{digest}"
+
+
+def get_request_fingerprint(request):
+    """Returns a digest of the method, path and data of the request."""
+    data = request.data
+    if hasattr(data, "lists"):
+        data = dict(data.lists())
+    payload = json.dumps(
+        [request.method, request.path, data], sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def replay(record):
+    response = Response(record["response"], status=record["status_code"])
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def idempotent(handler):
+    """
+    Records the first response to a write sent with an `Idempotency-Key` header,
+    per user and key, and replays it for retries of the request instead of
+    running the handler again.
+
+    Decorates `APIView` handlers, or `create`/`update` of generic views. The
+    handler runs in a transaction along with the claim of the key, so a
+    concurrent retry waits for the first request and replays its response.
+    Responses with a server error status, requests that raise and responses
+    without data aren't recorded, and can be retried. Reusing a key for a
+    different request is answered with 422.
+    """
+
+    @functools.wraps(handler)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_KEY_HEADER)
+        if key is None or not request.user.is_authenticated:
+            return handler(self, request, *args, **kwargs)
+        if not key or len(key) > 255:
+            return Response(
+                {"detail": f"{IDEMPOTENCY_KEY_HEADER} must be 1 to 255 characters."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        user_id = request.user.pk
+        fingerprint = get_request_fingerprint(request)
+        cache = caches[IDEMPOTENCY_CACHE_ALIAS]
+        cache_key = get_cache_key(user_id, key)
+        record = cache.get(cache_key)
+        if record is None:
+            with transaction.atomic():
+                record_id = claim_key(user_id, key, fingerprint)
+                if record_id is None:
+                    record = (
+                        IdempotencyKey.objects.filter(user_id=user_id, key=key)
+                        .values("fingerprint", "status_code", "response")
+                        .first()
+                    )
+                else:
+                    response = handler(self, request, *args, **kwargs)
+                    if response.status_code >= 500 or not hasattr(response, "data"):
+                        IdempotencyKey.objects.filter(pk=record_id).delete()
+                        return response
+                    record = {
+                        "fingerprint": fingerprint,
+                        "status_code": response.status_code,
+                        "response": response.data,
+                    }
+                    IdempotencyKey.objects.filter(pk=record_id).update(
+                        status_code=response.status_code, response=response.data
+                    )
+                    transaction.on_commit(
+                        functools.partial(
+                            cache.set,
+                            cache_key,
+                            record,
+                            settings.IDEMPOTENCY_KEY_TTL.total_seconds(),
+                        )
+                    )
+                    return response
+
+        if record is None or record["fingerprint"] != fingerprint:
+            # the key was claimed by a different request
+            return Response(
+                {
+                    "detail": f"{IDEMPOTENCY_KEY_HEADER} was already used "
+                    "for a different request."
+                },
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        return replay(record)
+
+    return wrapper
+
+
+def claim_key(user_id, key, fingerprint):
+    """Returns the id of the claimed record, or None if the key is recorded."""
+    now = timezone.now()
+    table = connection.ops.quote_name(IdempotencyKey._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            CLAIM_SQL.format(table=table),
+            {
+                "user_id": user_id,
+                "key": key,
+                "fingerprint": fingerprint,
+                "now": now,
+                "expired_before": now - settings.IDEMPOTENCY_KEY_TTL,
+            },
+        )
+        row = cursor.fetchone()
+    return row[0] if row is not None else None
+
+
+def purge_expired_keys(batch_size=1000):
+    """Deletes the expired records in batches. Returns the number of deleted rows."""
+    expired_before = timezone.now() - settings.IDEMPOTENCY_KEY_TTL
+    deleted = 0
+    while True:
+        ids = list(
+            IdempotencyKey.objects.filter(created_at__lte=expired_before).values_list(
+                "pk", flat=True
+            )[:batch_size]
+        )
+        if not ids:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
@@ -1,12 +1,322 @@
+import json
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+
+# Below this many (estimated) rows an exact COUNT(*) is cheap enough to run.
+ESTIMATED_COUNT_THRESHOLD = 10_000
+
+
+def get_max_limit(request):
+    if request.user.is_superuser or request.user.is_staff:
+        return 100  # maximum allowable limit
+    return 50
+
+
+def get_estimated_count(queryset):
+    """
+    Returns the PostgreSQL planner estimate of the number of rows of the queryset,
+    or None if no estimate is available.
+
+    Unfiltered querysets use the table statistics in `pg_class.reltuples`, other
+    querysets use the row estimate of their `EXPLAIN` plan.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+
+    query = queryset.query
+    with connection.cursor() as cursor:
+        if not (query.where or query.distinct or query.combinator or query.is_sliced):
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)",
+                [connection.ops.quote_name(queryset.model._meta.db_table)],
+            )
+            row = cursor.fetchone()
+            # reltuples is -1 for tables that were never vacuumed or analyzed
+            if row is not None and row[0] >= 0:
+                return row[0]
+
+        sql, params = queryset.order_by().query.sql_with_params()
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def get_count(queryset, threshold=ESTIMATED_COUNT_THRESHOLD):
+    """
+    Returns a `(count, is_estimated)` tuple. The planner estimate is used for
+    large querysets, and an exact count once the estimate is below `threshold`.
+    """
+    estimate = get_estimated_count(queryset)
+    if estimate is None or estimate < threshold:
+        return queryset.count(), False
+    return estimate, True
+
+
+class EstimatedCountPaginator(Paginator):
+    """Django paginator counting with planner estimates, e.g. for admin changelists."""
+
+    @cached_property
+    def count(self):
+        count, _ = get_count(self.object_list)
+        return count
 
 
 class CustomLimitOffsetPagination(pagination.LimitOffsetPagination):
     default_limit = 12
+    # count strategy, set `estimate_count` to report planner estimates for
+    # large result sets instead of running an exact COUNT(*)
+    estimate_count = False
+    estimate_count_threshold = ESTIMATED_COUNT_THRESHOLD
 
     def get_limit(self, request):
-        if request.user.is_superuser or request.user.is_staff:
-            self.max_limit = 100  # maximum allowable limit
-        else:
-            self.max_limit = 50
+        self.max_limit = get_max_limit(request)
         return super().get_limit(request)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.estimate_count:
+            return super().paginate_queryset(queryset, request, view=view)
+
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.offset = self.get_offset(request)
+        self.request = request
+
+        # fetch an extra item to know whether rows follow this page, so that
+        # the page links stay correct when the estimate is off
+        results = list(queryset[self.offset : self.offset + self.limit + 1])
+        page = results[: self.limit]
+        if len(results) <= self.limit and (page or not self.offset):
+            # the last page was reached, so the total is known exactly
+            self.count, self.count_is_estimated = self.offset + len(page), False
+        else:
+            self.count, self.count_is_estimated = get_count(
+                queryset, self.estimate_count_threshold
+            )
+            if len(results) > self.limit:
+                self.count = max(self.count, self.offset + len(results))
+
+        if self.count > self.limit and self.template is not None:
+            self.display_page_controls = True
+        return page
+
+    def get_paginated_response(self, data):
+        if not self.estimate_count:
+            return super().get_paginated_response(data)
+        return Response(
+            {
+                "count": self.count,
+                "count_is_estimated": self.count_is_estimated,
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        if self.estimate_count:
+            response_schema["properties"]["count_is_estimated"] = {
+                "type": "boolean",
+                "example": False,
+            }
+        return response_schema
+
+
+class EstimatedCountLimitOffsetPagination(CustomLimitOffsetPagination):
+    estimate_count = True
+
+
+class CustomCursorPagination(pagination.CursorPagination):
+    """
+    Keyset pagination that seeks on every ordering field plus the primary key.
+
+    Unlike the DRF cursor pagination, the cursor stores the values of all the
+    ordering fields of the boundary row, so pages are fetched with a
+    `WHERE (created_at, id) < (...)` style filter instead of an offset, and no
+    `COUNT(*)` is run. Ordering fields must be non-nullable.
+    """
+
+    page_size = 12
+    page_size_query_param = "limit"
+    ordering = "-created_at"
+
+    def get_page_size(self, request):
+        self.max_page_size = get_max_limit(request)
+        return super().get_page_size(request)
+
+    def get_ordering(self, request, queryset, view):
+        ordering = queryset.query.order_by
+        # keep an ordering applied by the filters (e.g. search relevance), as
+        # long as it only contains plain field names
+        if not ordering or not all(
+            isinstance(term, str) and "__" not in term and term != "?"
+            for term in ordering
+        ):
+            ordering = super().get_ordering(request, queryset, view)
+        # the primary key makes the position of every row unique
+        if not {"pk", "-pk", "id", "-id"} & set(ordering):
+            tiebreaker = "-pk" if ordering[-1].startswith("-") else "pk"
+            ordering = (*ordering, tiebreaker)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = self.decode_position(self.cursor.position) if self.cursor else None
+
+        ordering = (
+            pagination._reverse_ordering(self.ordering) if reverse else self.ordering
+        )
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.get_seek_filter(ordering, position))
+
+        # fetch an extra item to determine if there is a page following this one
+        results = list(queryset[: self.page_size + 1])
+        self.page = results[: self.page_size]
+        has_following_page = len(results) > self.page_size
+
+        if reverse:
+            # the query ordering was reversed, restore the requested ordering
+            self.page.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_following_page
+        else:
+            self.has_next = has_following_page
+            self.has_previous = position is not None
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def get_seek_filter(self, ordering, position):
+        """
+        Returns a filter selecting the rows that follow `position` in `ordering`,
+        i.e. the expanded form of a row value comparison.
+
+        The expanded form is an OR of conjunctions, which PostgreSQL cannot turn
+        into an index range, so it is combined with a redundant bound on the
+        leading ordering field that lets the planner seek into the composite
+        index instead of scanning from the start of it.
+        """
+        seek_filter = Q()
+        preceding = {}
+        for term in ordering:
+            field_name = term.lstrip("-")
+            lookup = "lt" if term.startswith("-") else "gt"
+            value = position[field_name]
+            seek_filter |= Q(**preceding, **{f"{field_name}__{lookup}": value})
+            preceding[field_name] = value
+
+        leading_term = ordering[0]
+        field_name = leading_term.lstrip("-")
+        lookup = "lte" if leading_term.startswith("-") else "gte"
+        return Q(**{f"{field_name}__{lookup}": position[field_name]}) & seek_filter
+
+    def decode_position(self, position):
+        if position is None:
+            return None
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, dict) or list(values) != [
+            term.lstrip("-") for term in self.ordering
+        ]:
+            # the cursor was created for another ordering
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = {}
+        for term in ordering:
+            field_name = term.lstrip("-")
+            if isinstance(instance, dict):
+                value = instance[field_name]
+            else:
+                value = getattr(instance, field_name)
+            values[field_name] = str(value)
+        return json.dumps(values, separators=(",", ":"))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        position = self._get_position_from_instance(self.page[-1], self.ordering)
+        return self.encode_cursor(
+            pagination.Cursor(offset=0, reverse=False, position=position)
+        )
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        position = self._get_position_from_instance(self.page[0], self.ordering)
+        return self.encode_cursor(
+            pagination.Cursor(offset=0, reverse=True, position=position)
+        )
+
+
+class CursorOrLimitOffsetPagination(pagination.BasePagination):
+    """
+    Uses cursor pagination when the request has a `cursor` query parameter
+    (an empty value requests the first page), and limit/offset pagination
+    otherwise, so clients can move to cursors one listing at a time.
+    """
+
+    cursor_pagination_class = CustomCursorPagination
+    limit_offset_pagination_class = CustomLimitOffsetPagination
+
+    def __init__(self):
+        self.cursor_paginator = self.cursor_pagination_class()
+        self.limit_offset_paginator = self.limit_offset_pagination_class()
+        self.paginator = self.limit_offset_paginator
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_paginator.cursor_query_param in request.query_params:
+            self.paginator = self.cursor_paginator
+        else:
+            self.paginator = self.limit_offset_paginator
+        return self.paginator.paginate_queryset(queryset, request, view=view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.limit_offset_paginator.get_paginated_response_schema(schema)
+
+    def get_results(self, data):
+        return self.paginator.get_results(data)
+
+    @property
+    def display_page_controls(self):
+        return self.paginator.display_page_controls
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+    def get_schema_operation_parameters(self, view):
+        parameters = {}
+        for paginator in (self.limit_offset_paginator, self.cursor_paginator):
+            for parameter in paginator.get_schema_operation_parameters(view):
+                parameters.setdefault(parameter["name"], parameter)
+        return list(parameters.values())
+
+
+class CursorOrEstimatedCountPagination(CursorOrLimitOffsetPagination):
+    limit_offset_pagination_class = EstimatedCountLimitOffsetPagination
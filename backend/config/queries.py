@@ -0,0 +1,143 @@
+import logging
+import re
+import sys
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.db import connections
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+# a run of placeholders, e.g. the values of `IN (%s, %s, %s)`
+PLACEHOLDERS_RE = re.compile(r"%s(?:\s*,\s*%s)+")
+# savepoint names are unique to each savepoint
+SAVEPOINT_RE = re.compile(r'"s\d+_x\d+"')
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def get_query_fingerprint(sql):
+    """
+    Returns the shape of the SQL statement, equal for statements that only
+    differ by their parameters, e.g. the queries of an N+1.
+    """
+    sql = WHITESPACE_RE.sub(" ", sql.strip())
+    sql = SAVEPOINT_RE.sub('"savepoint"', sql)
+    return PLACEHOLDERS_RE.sub("%s, ...", sql)
+
+
+def get_serializer_field():
+    """
+    Returns the `Serializer.field` being represented by the innermost
+    serializer on the stack, or None outside of serializers.
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        if frame.f_code.co_name == "to_representation":
+            serializer = frame.f_locals.get("self")
+            if isinstance(serializer, serializers.Serializer):
+                field_name = frame.f_locals.get("field_name")
+                if field_name is None:
+                    field_name = getattr(
+                        frame.f_locals.get("field"), "field_name", None
+                    )
+                if field_name is not None:
+                    return f"{type(serializer).__name__}.{field_name}"
+        frame = frame.f_back
+    return None
+
+
+class QueryRecorder:
+    """
+    Records the number, duration and shapes of the queries run on every
+    database connection within the `with` block.
+
+    With `trace_fields`, the serializer field that caused a query is recorded
+    for repeated shapes, which costs a walk of the stack per repeated query.
+    """
+
+    def __init__(self, trace_fields=False):
+        self.trace_fields = trace_fields
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        # fingerprint -> serializer field of the first repeated query
+        self.fields = {}
+        self._stack = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            fingerprint = get_query_fingerprint(sql)
+            self.fingerprints[fingerprint] += 1
+            if (
+                self.trace_fields
+                and self.fingerprints[fingerprint] == 2
+                and fingerprint not in self.fields
+            ):
+                self.fields[fingerprint] = get_serializer_field()
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+        self._stack = None
+
+    def get_repeated(self, threshold=2):
+        """
+        Returns `(fingerprint, count, field)` tuples of the shapes run at least
+        `threshold` times, the most repeated first.
+        """
+        return [
+            (fingerprint, count, self.fields.get(fingerprint))
+            for fingerprint, count in self.fingerprints.most_common()
+            if count >= threshold
+        ]
+
+
+class QueryInspectionMiddleware:
+    """
+    Development middleware logging the GET requests that run more queries than
+    the `query_budget` of their view, and the SQL shapes repeated within a
+    request along with the serializer field that caused them, e.g. an N+1.
+
+    Budgets count the queries of the view, session authentication adds its
+    own queries to the requests of the browsable API.
+    """
+
+    # number of identical shapes within a request worth a warning
+    repeat_threshold = 3
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryRecorder(trace_fields=True) as recorder:
+            response = self.get_response(request)
+
+        budget = getattr(request, "query_budget", None)
+        if request.method == "GET" and budget is not None and recorder.count > budget:
+            logger.warning(
+                f"{request.method} {request.path}: {recorder.count} queries over "
+                f"the budget of {budget} ({recorder.duration * 1000:.1f} ms)."
+            )
+        for fingerprint, count, field in recorder.get_repeated(self.repeat_threshold):
+            source = f" from {field}" if field else ""
+            logger.warning(
+                f"{request.method} {request.path}: query repeated {count} "
+                f"times{source}: {fingerprint}"
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, "view_class", None)
+        request.query_budget = getattr(view_class, "query_budget", None)
@@ -1,6 +1,8 @@
 import os
 from datetime import timedelta
 
+from corsheaders.defaults import default_headers
+
 from config.env import BASE_DIR, env
 
 # Take environment variables from .env file
@@ -26,6 +28,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     # local apps
     "carts.apps.CartsConfig",
     "orders.apps.OrdersConfig",
@@ -42,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so the timings cover the other middlewares
+    "config.telemetry.ServerTimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
@@ -89,6 +94,23 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# The default and responses caches are local memory caches by default. Point
+# the URLs at a shared cache (e.g. redis://redis:6379/1) when running several
+# server processes, so that response cache invalidations reach every process.
+# The guest carts must outlive and be shared by the server processes without
+# writing to the database, so their cache defaults to the redis service of the
+# docker compose file. Set CART_CACHE_URL=locmemcache://carts to develop
+# without redis; the deploy checks reject it.
+
+CACHES = {
+    "default": env.cache("CACHE_URL", default="locmemcache://"),
+    "responses": env.cache("RESPONSE_CACHE_URL", default="locmemcache://responses"),
+    "carts": env.cache("CART_CACHE_URL", default="redis://redis:6379/1"),
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -139,8 +161,8 @@ AUTH_USER_MODEL = "users.CustomUser"
 # project authentication configuration
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
-        "rest_framework.authentication.BasicAuthentication",
+        "users.authentication.ClaimsJWTAuthentication",
+        "users.authentication.CachedBasicAuthentication",
         "rest_framework.authentication.SessionAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
@@ -156,14 +178,42 @@ REST_FRAMEWORK = {
 # JWT configuration
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(days=30),
+    "TOKEN_REFRESH_SERIALIZER": "users.serializers.CustomTokenRefreshSerializer",
     # "UPDATE_LAST_LOGIN": True,
 }
 
+# how long a verified Basic authentication is trusted without hashing the
+# password again
+BASIC_AUTH_CACHE_TTL = timedelta(
+    seconds=env.int("BASIC_AUTH_CACHE_TTL_SECONDS", default=300)
+)
+
+# cart configuration
+# how long units added to a cart are held for it before the sweeper
+# (`manage.py release_expired_reservations`) releases them
+CART_RESERVATION_TTL = timedelta(
+    minutes=env.int("CART_RESERVATION_TTL_MINUTES", default=15)
+)
+
+# how long the guest carts of anonymous users are kept since their last change
+GUEST_CART_TTL = timedelta(days=env.int("GUEST_CART_TTL_DAYS", default=7))
+
+# how long the responses recorded for `Idempotency-Key` headers are replayed
+# before `manage.py purge_idempotency_keys` deletes them
+IDEMPOTENCY_KEY_TTL = timedelta(hours=env.int("IDEMPOTENCY_KEY_TTL_HOURS", default=24))
+
+# share of the requests timed by `config.telemetry.ServerTimingMiddleware` and
+# logged, between 0 and 1. The Server-Timing header of the timed requests is
+# only sent with DEBUG on or to staff users, as it reveals the database time
+# and query counts.
+SERVER_TIMING_SAMPLE_RATE = env.float("SERVER_TIMING_SAMPLE_RATE", default=1.0)
+
 # cors-headers configuration
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
     "http://127.0.0.1:3000",
 ]
+CORS_ALLOW_HEADERS = (*default_headers, "idempotency-key")
 
 # logging configuration
 from .logging import LOGGING
@@ -8,6 +8,8 @@ INSTALLED_APPS = INSTALLED_APPS + LOCAL_INSTALLED_APPS
 
 LOCAL_MIDDLEWARE = [
     "debug_toolbar.middleware.DebugToolbarMiddleware",
+    # logs query budget overruns and repeated queries, e.g. N+1
+    "config.queries.QueryInspectionMiddleware",
 ]
 
 MIDDLEWARE = MIDDLEWARE + LOCAL_MIDDLEWARE
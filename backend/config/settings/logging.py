@@ -1,8 +1,11 @@
 import os
 
-from config.env import BASE_DIR
+from config.env import BASE_DIR, env
 
-DJANGO_APPS_NAMES = ["carts", "products", "users", "vendors"]
+DJANGO_APPS_NAMES = ["carts", "orders", "products", "users", "vendors"]
+
+# "json" formats every log as JSON lines with structured fields, for log shippers
+LOG_FORMAT = env("LOG_FORMAT", default="text")
 
 LOGGING = {
     "version": 1,
@@ -16,18 +19,27 @@ LOGGING = {
             "format": "{asctime}:{levelname} {message}",
             "style": "{",
         },
+        "json": {
+            "()": "config.telemetry.JSONFormatter",
+        },
     },
     "handlers": {
         "file": {
             "level": "INFO",
             "class": "logging.FileHandler",
             "filename": os.path.join(BASE_DIR, "django-log.log"),
-            "formatter": "verbose",
+            "formatter": "json" if LOG_FORMAT == "json" else "verbose",
         },
         "console": {
             "level": "DEBUG",
             "class": "logging.StreamHandler",
-            "formatter": "simple",
+            "formatter": "json" if LOG_FORMAT == "json" else "simple",
+        },
+        # request timings are structured whatever the format of the other logs
+        "telemetry": {
+            "level": "INFO",
+            "class": "logging.StreamHandler",
+            "formatter": "json",
         },
     },
     "loggers": {
@@ -43,6 +55,11 @@ LOGGING = {
             "level": "INFO",
             "handlers": ["file"],
         },
+        "config.telemetry": {
+            "level": "INFO",
+            "handlers": ["telemetry"],
+            "propagate": False,
+        },
         "vendors": {
             "level": "INFO",
             "handlers": ["file"],
@@ -55,5 +72,9 @@ LOGGING = {
             "level": "INFO",
             "handlers": ["file"],
         },
+        "orders": {
+            "level": "INFO",
+            "handlers": ["file"],
+        },
     },
 }
@@ -1 +1,9 @@
 from .base import *
+
+# the timings of every request would flood the test output
+LOGGING["handlers"]["telemetry"]["class"] = "logging.NullHandler"
+# the tests don't run a redis server
+CACHES["carts"] = {
+    "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    "LOCATION": "carts",
+}
@@ -0,0 +1,218 @@
+import json
+import logging
+import random
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# phases of the requests, in the order of the Server-Timing header
+PHASES = ("auth", "perm", "db", "serialize", "render")
+# timing of the current request, None when the request isn't sampled
+current_timing = ContextVar("current_timing", default=None)
+
+
+class RequestTiming:
+    """
+    Durations of the phases of a request. Each query is counted in the `db`
+    phase only, not in the phase that ran it, and a phase entered within
+    another one is counted in the inner phase only.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.durations = defaultdict(float)
+        self.queries = 0
+        self.total = None
+        # [name, start, db duration at the start, duration of the inner phases]
+        self._phases = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.durations["db"] += time.perf_counter() - start
+            self.queries += 1
+
+    def start_phase(self, name):
+        self._phases.append([name, time.perf_counter(), self.durations["db"], 0.0])
+
+    def end_phase(self):
+        name, start, db_start, inner = self._phases.pop()
+        duration = time.perf_counter() - start - (self.durations["db"] - db_start)
+        self.durations[name] += duration - inner
+        if self._phases:
+            self._phases[-1][3] += duration
+
+    @contextmanager
+    def phase(self, name):
+        self.start_phase(name)
+        try:
+            yield
+        finally:
+            self.end_phase()
+
+    def finish(self):
+        self.total = time.perf_counter() - self.start
+
+    def get_header(self):
+        """Returns the value of the Server-Timing header, in milliseconds."""
+        metrics = []
+        for name in PHASES:
+            if name not in self.durations:
+                continue
+            metric = f"{name};dur={self.durations[name] * 1000:.2f}"
+            if name == "db":
+                metric += f';desc="{self.queries} queries"'
+            metrics.append(metric)
+        metrics.append(f"total;dur={self.total * 1000:.2f}")
+        return ", ".join(metrics)
+
+    def get_log_fields(self):
+        fields = {
+            f"{name}_ms": round(self.durations[name] * 1000, 2)
+            for name in PHASES
+            if name in self.durations
+        }
+        fields["db_queries"] = self.queries
+        fields["duration_ms"] = round(self.total * 1000, 2)
+        return fields
+
+
+@contextmanager
+def timed_phase(name):
+    """Times the block as the `name` phase of the request, if it's sampled."""
+    timing = current_timing.get()
+    if timing is None:
+        yield
+        return
+    with timing.phase(name):
+        yield
+
+
+class ServerTimingMixin:
+    """
+    Times the authentication, permission checks and handler of sampled
+    requests to the view. The handler is timed as the `serialize` phase, which
+    is mostly serialization once the queries and the permission checks it runs
+    are counted in their own phases. Rendering is timed by the middleware.
+    """
+
+    _handler_timing = None
+
+    def perform_authentication(self, request):
+        with timed_phase("auth"):
+            super().perform_authentication(request)
+
+    def check_permissions(self, request):
+        with timed_phase("perm"):
+            super().check_permissions(request)
+
+    def check_object_permissions(self, request, obj):
+        with timed_phase("perm"):
+            super().check_object_permissions(request, obj)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._handler_timing = current_timing.get()
+        if self._handler_timing is not None:
+            self._handler_timing.start_phase("serialize")
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if self._handler_timing is not None:
+            self._handler_timing.end_phase()
+            self._handler_timing = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ServerTimingMiddleware:
+    """
+    Breaks sampled requests into database and rendering phases, and the
+    authentication, permission checks and serialization phases timed by the
+    views with `ServerTimingMixin`, logged as structured fields and sent in
+    the `Server-Timing` header. `SERVER_TIMING_SAMPLE_RATE` is the share of
+    the requests timed, the others only cost a random draw.
+
+    The header reveals the database time and query counts, so it's only sent
+    with DEBUG on or to staff users.
+
+    Must be the first middleware, so the total covers the other middlewares.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.SERVER_TIMING_SAMPLE_RATE
+
+    def __call__(self, request):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        timing = RequestTiming()
+        token = current_timing.set(timing)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timing))
+                response = self.get_response(request)
+        finally:
+            current_timing.reset(token)
+        timing.finish()
+
+        if self.shows_header(request):
+            response["Server-Timing"] = timing.get_header()
+        match = request.resolver_match
+        logger.info(
+            f"{request.method} {request.path} {response.status_code} "
+            f"in {timing.total * 1000:.1f} ms",
+            extra={
+                "method": request.method,
+                "path": request.path,
+                "view": match.view_name if match else None,
+                "status": response.status_code,
+                **timing.get_log_fields(),
+            },
+        )
+        return response
+
+    def shows_header(self, request):
+        if settings.DEBUG:
+            return True
+        # the user authenticated by the view, or by the middlewares
+        user = getattr(request, "user", None)
+        return user is not None and user.is_staff
+
+    def process_template_response(self, request, response):
+        timing = current_timing.get()
+        if timing is not None:
+            with timing.phase("render"):
+                response.render()
+        return response
+
+
+# attributes of every log record, the others are `extra` fields
+LOG_RECORD_ATTRIBUTES = {*vars(logging.makeLogRecord({})), "message", "asctime"}
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats records as JSON lines, with the `extra` fields of the records as fields."""
+
+    def format(self, record):
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name, value in vars(record).items():
+            if name not in LOG_RECORD_ATTRIBUTES:
+                data[name] = value
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
@@ -0,0 +1,59 @@
+from urllib.parse import urlsplit
+
+from django.urls import resolve
+from rest_framework.test import APIClient
+
+from config.caching import get_response_cache
+from config.queries import QueryRecorder
+
+# dataset sizes the query budgets are checked at
+QUERY_BUDGET_SIZES = (1, 10, 100)
+
+
+class QueryBudgetTestMixin:
+    """
+    Test case mixin checking that a view stays within the `query_budget`
+    declared on its class, and that its number of queries doesn't grow with
+    the number of rows, i.e. that it has no N+1.
+    """
+
+    def assertQueryBudget(self, url, create_rows, user=None, sizes=QUERY_BUDGET_SIZES):
+        """
+        Requests `url` after growing the dataset to each of `sizes` with
+        `create_rows(count)`, which creates `count` more rows. The user is
+        authenticated without queries, so only the queries of the view count.
+        """
+        view_class = resolve(urlsplit(url).path).func.view_class
+        budget = view_class.query_budget
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+
+        counts = []
+        created = 0
+        for size in sizes:
+            create_rows(size - created)
+            created = size
+            get_response_cache().clear()
+            with QueryRecorder(trace_fields=True) as recorder:
+                response = client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+
+            repeated = "\n".join(
+                f"{count} x {field or 'unknown field'}: {fingerprint}"
+                for fingerprint, count, field in recorder.get_repeated()
+            )
+            self.assertLessEqual(
+                recorder.count,
+                budget,
+                f"{view_class.__name__} ran {recorder.count} queries with {size} "
+                f"row(s), over its budget of {budget}.\n{repeated}",
+            )
+            counts.append(recorder.count)
+
+        self.assertEqual(
+            len(set(counts)),
+            1,
+            f"The queries of {view_class.__name__} grow with the rows: "
+            f"{dict(zip(sizes, counts))}.",
+        )
@@ -9,6 +9,8 @@ from drf_spectacular.views import (
     SpectacularSwaggerView,
 )
 
+from config.caching import ResponseCacheStatsView
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api-auth/", include("rest_framework.urls", namespace="rest_framework")),
@@ -16,6 +18,8 @@ urlpatterns = [
     path("api/", include("users.urls")),
     path("api/", include("vendors.urls")),
     path("api/carts/", include("carts.urls")),
+    path("api/orders/", include("orders.urls")),
+    path("api/cache/stats/", ResponseCacheStatsView.as_view()),
     path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
     # Optional UI:
     path(
@@ -0,0 +1,161 @@
+import functools
+import logging
+from decimal import Decimal
+
+from django.db import connections, models, transaction
+from django.utils import timezone
+
+from config.caching import bump_generation
+
+logger = logging.getLogger(__name__)
+
+# Takes the ordered units from the stock of the locked products, consumes the
+# reservations of the cart and clears it, in a single statement. A product is
+# only updated if it's active and its stock covers the line besides the units
+# held by other carts; the ids of the updated products are returned. Their
+# `updated_at` moves, so the validators of the product responses change.
+CHECKOUT_SQL = """
+    WITH lines (product_id, quantity) AS (
+        VALUES {lines}
+    ), consumed AS (
+        DELETE FROM {reservation} AS reservation
+        USING {item} AS item
+        WHERE reservation.cart_item_id = item.id AND item.cart_id = %(cart_id)s
+        RETURNING reservation.product_id, reservation.quantity
+    ), cleared AS (
+        DELETE FROM {item} WHERE cart_id = %(cart_id)s
+    ), updated AS (
+        UPDATE {product} AS product
+        SET stock = product.stock - lines.quantity,
+            updated_at = %(now)s,
+            reserved_stock = GREATEST(
+                product.reserved_stock - COALESCE(consumed.quantity, 0), 0
+            )
+        FROM lines
+        LEFT JOIN consumed ON consumed.product_id = lines.product_id
+        WHERE product.id = lines.product_id
+            AND product.status = %(status)s
+            AND product.stock - lines.quantity >= GREATEST(
+                product.reserved_stock - COALESCE(consumed.quantity, 0), 0
+            )
+        RETURNING product.id
+    )
+    SELECT id FROM updated
+"""
+
+
+class CheckoutError(Exception):
+    """The cart can't be checked out, `products` lists the short products."""
+
+    def __init__(self, message, products=()):
+        super().__init__(message)
+        self.products = list(products)
+
+
+class OrderQuerySet(models.QuerySet):
+    def with_items(self):
+        """Prefetches the lines of the orders."""
+        return self.prefetch_related("items")
+
+    def checkout(self, user):
+        """
+        Turns the cart of the user into an order in a single transaction, with a
+        constant number of queries whatever the number of items:
+
+        1. the cart items and their products are locked, ordered by product so
+           concurrent checkouts of the same products wait for each other
+           instead of deadlocking;
+        2. the stock of every line is taken and the cart is cleared with a
+           single statement, which fails the checkout if any line is short;
+        3. the order and its lines are inserted, with the prices of the locked
+           products as snapshots.
+
+        Raises CheckoutError if the cart is empty or a product is short.
+        """
+        from carts.models import STANDARD_DELIVERY_CHARGE, CartItem
+
+        from .models import OrderItem
+
+        with transaction.atomic(using=self.db):
+            items = list(
+                CartItem.objects.using(self.db)
+                .filter(cart__user=user)
+                .select_related("product")
+                .select_for_update(of=("self", "product"))
+                .order_by("product_id")
+            )
+            if not items:
+                raise CheckoutError("Your cart is empty.")
+
+            updated = self.take_stock(items[0].cart_id, items)
+            short = [item.product for item in items if item.product_id not in updated]
+            if short:
+                raise CheckoutError(
+                    "Some products are unavailable or out of stock.", short
+                )
+
+            subtotal = sum((item.get_total() for item in items), Decimal("0.00"))
+            order = self.create(
+                user=user,
+                subtotal=subtotal,
+                delivery_charge=STANDARD_DELIVERY_CHARGE,
+                total=subtotal + STANDARD_DELIVERY_CHARGE,
+            )
+            OrderItem.objects.using(self.db).bulk_create(
+                OrderItem(
+                    order=order,
+                    product=item.product,
+                    product_name=item.product.name,
+                    price=item.product.price,
+                    unit_price=item.product.selling_price,
+                    quantity=item.quantity,
+                )
+                for item in items
+            )
+            # the stock is part of the cached product responses
+            transaction.on_commit(
+                functools.partial(bump_generation, "product"), using=self.db
+            )
+
+        logger.info(
+            f"Order {order.id} placed by user {user.id} with {len(items)} line(s)."
+        )
+        return order
+
+    def take_stock(self, cart_id, items):
+        """
+        Takes the quantities of the cart items from the stock of their products
+        and clears the cart. Returns the ids of the updated products.
+        """
+        from carts.managers import get_table_names
+        from products.models import Product
+
+        params = {
+            "cart_id": cart_id,
+            "status": Product.Status.ACTIVE,
+            "now": timezone.now(),
+        }
+        lines = []
+        for index, item in enumerate(items):
+            lines.append(
+                f"(%(product_{index})s::bigint, %(quantity_{index})s::integer)"
+            )
+            params[f"product_{index}"] = item.product_id
+            params[f"quantity_{index}"] = item.quantity
+
+        connection = connections[self.db]
+        sql = CHECKOUT_SQL.format(lines=", ".join(lines), **get_table_names(connection))
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return {row[0] for row in cursor.fetchall()}
+
+
+class OrderManager(models.Manager):
+    def get_queryset(self):
+        return OrderQuerySet(self.model, using=self._db)
+
+    def with_items(self):
+        return self.get_queryset().with_items()
+
+    def checkout(self, user):
+        return self.get_queryset().checkout(user)
@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.db import models
+
+from products.models import Product
+
+from .managers import OrderManager
+
+
+class Order(models.Model):
+    class Status(models.TextChoices):
+        PENDING = "PENDING", "Pending"
+        PROCESSING = "PROCESSING", "Processing"
+        SHIPPED = "SHIPPED", "Shipped"
+        DELIVERED = "DELIVERED", "Delivered"
+        CANCELLED = "CANCELLED", "Cancelled"
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="orders",
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=Status.choices,
+        default=Status.PENDING,
+        help_text="Select the status of the order.",
+    )
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2)
+    delivery_charge = models.DecimalField(max_digits=10, decimal_places=2)
+    total = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = OrderManager()
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"Order {self.id} by {self.user}"
+
+
+class OrderItem(models.Model):
+    """A line of an order, with the product and its prices as they were at checkout."""
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items")
+    # kept when the product is deleted, the snapshot fields describe the line
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name="order_items",
+    )
+    product_name = models.CharField(max_length=250)
+    price = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        help_text="Original price of the product at checkout.",
+    )
+    unit_price = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        help_text="Selling price of the product at checkout.",
+    )
+    quantity = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f"Order {self.order_id}: {self.product_name} x {self.quantity}"
+
+    def get_total(self):
+        """Returns the total price of the line based on the unit price."""
+        return self.unit_price * self.quantity
@@ -0,0 +1,49 @@
+from decimal import Decimal
+
+from rest_framework import serializers
+
+from users.serializers import DynamicFieldsModelSerializer
+
+from .models import Order, OrderItem
+
+
+class OrderItemSerializer(DynamicFieldsModelSerializer):
+    total = serializers.SerializerMethodField()
+
+    field_lookups = {"total": ("unit_price", "quantity")}
+
+    class Meta:
+        model = OrderItem
+        fields = [
+            "id",
+            "product",
+            "product_name",
+            "price",
+            "unit_price",
+            "quantity",
+            "total",
+        ]
+
+    def get_total(self, obj) -> Decimal:
+        return obj.get_total()
+
+
+class OrderSerializer(DynamicFieldsModelSerializer):
+    items = OrderItemSerializer(many=True, read_only=True)
+    status = serializers.CharField(source="get_status_display", read_only=True)
+
+    field_lookups = {"status": ("status",)}
+
+    class Meta:
+        model = Order
+        fields = [
+            "id",
+            "user",
+            "status",
+            "items",
+            "subtotal",
+            "delivery_charge",
+            "total",
+            "created_at",
+            "updated_at",
+        ]
@@ -0,0 +1,191 @@
+import threading
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+
+from carts.models import Cart, CartItem, StockReservation
+from products.models import Category, Product
+from users.models import CustomUser
+from vendors.models import Vendor
+
+from .managers import CheckoutError
+from .models import Order
+
+
+def create_products(count, stock=10):
+    vendor_user = CustomUser.objects.create_user(
+        email="vendor@example.com",
+        username="vendor",
+        first_name="vendor",
+        last_name="doe",
+    )
+    category = Category.objects.create(name="cat1", slug="cat1")
+    vendor = Vendor.objects.create(
+        name="ven1",
+        user=vendor_user,
+        description="lorem",
+        email="ven1@example.com",
+        address="lorem",
+        phone_number="0000000000",
+        status=Vendor.Status.ACTIVE,
+    )
+    return [
+        Product.objects.create(
+            name=f"product{i}",
+            slug=f"product{i}",
+            description="lorem",
+            price=Decimal("20.00"),
+            discount_price=Decimal("15.00") if i % 2 else None,
+            stock=stock,
+            status=Product.Status.ACTIVE,
+            category=category,
+            vendor=vendor,
+        )
+        for i in range(count)
+    ]
+
+
+def create_customer(name):
+    return CustomUser.objects.create_user(
+        email=f"{name}@example.com",
+        username=name,
+        first_name=name,
+        last_name="doe",
+    )
+
+
+class CheckoutTestCase(TestCase):
+    def setUp(self):
+        self.products = create_products(5)
+        self.user = create_customer("customer")
+        self.client.force_login(self.user)
+
+    def test_checkout(self):
+        for product, quantity in ((self.products[0], 2), (self.products[1], 3)):
+            self.client.post(
+                "/api/carts/add/", {"product_id": product.id, "quantity": quantity}
+            )
+        response = self.client.post("/api/orders/checkout/")
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual(data["subtotal"], "85.00")
+        self.assertEqual(data["total"], "95.00")
+        self.assertEqual(
+            sorted((item["unit_price"], item["quantity"]) for item in data["items"]),
+            [("15.00", 3), ("20.00", 2)],
+        )
+
+        # the stock is taken, the reservations are consumed and the cart cleared
+        self.assertEqual(
+            list(
+                Product.objects.filter(pk__in=[p.pk for p in self.products[:2]])
+                .order_by("pk")
+                .values_list("stock", "reserved_stock")
+            ),
+            [(8, 0), (7, 0)],
+        )
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertFalse(CartItem.objects.filter(cart__user=self.user).exists())
+
+        # the lines keep their prices when the product changes
+        Product.objects.filter(pk=self.products[0].pk).update(price=Decimal("50.00"))
+        response = self.client.get(f"/api/orders/{data['id']}/")
+        self.assertEqual(response.json()["total"], "95.00")
+
+    def test_checkout_changes_product_etag(self):
+        product = self.products[0]
+        url = f"/api/products/{product.slug}/"
+        response = self.client.get(url)
+        etag = response["ETag"]
+        self.client.post("/api/carts/add/", {"product_id": product.id, "quantity": 2})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/orders/checkout/")
+        self.assertEqual(response.status_code, 201)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json()["stock"], 8)
+
+    def test_checkout_query_count_does_not_depend_on_items(self):
+        cart = Cart.objects.get(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.products[0])
+        with self.assertNumQueries(6):
+            Order.objects.checkout(self.user)
+
+        for product in self.products:
+            CartItem.objects.create(cart=cart, product=product)
+        with self.assertNumQueries(6):
+            order = Order.objects.checkout(self.user)
+        self.assertEqual(order.items.count(), 5)
+
+    def test_checkout_fails_if_any_line_is_short(self):
+        cart = Cart.objects.get(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.products[0], quantity=2)
+        CartItem.objects.create(cart=cart, product=self.products[1], quantity=5)
+        Product.objects.filter(pk=self.products[1].pk).update(stock=4)
+
+        response = self.client.post("/api/orders/checkout/")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            [product["id"] for product in response.json()["products"]],
+            [self.products[1].id],
+        )
+        # nothing is taken and the cart is kept
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).stock, 10)
+        self.assertEqual(cart.items.count(), 2)
+        self.assertFalse(Order.objects.exists())
+
+    def test_checkout_respects_other_reservations(self):
+        other = create_customer("other")
+        CartItem.objects.add_product(other, self.products[0].id, 8)
+        CartItem.objects.create(
+            cart=Cart.objects.get(user=self.user), product=self.products[0], quantity=3
+        )
+        with self.assertRaises(CheckoutError):
+            Order.objects.checkout(self.user)
+
+    def test_checkout_empty_cart(self):
+        response = self.client.post("/api/orders/checkout/")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"detail": "Your cart is empty."})
+
+
+class ConcurrentCheckoutTestCase(TransactionTestCase):
+    def test_concurrent_checkouts_do_not_oversell(self):
+        products = create_products(3, stock=5)
+        users = [create_customer(f"customer{i}") for i in range(8)]
+        for user in users:
+            # overlapping items, added in different orders
+            for product in sorted(products, key=lambda p: (p.pk * user.pk) % 3):
+                CartItem.objects.create(
+                    cart=Cart.objects.get(user=user), product=product, quantity=2
+                )
+
+        barrier = threading.Barrier(len(users))
+        results = []
+
+        def checkout(user):
+            try:
+                barrier.wait()
+                try:
+                    Order.objects.checkout(user)
+                    results.append("placed")
+                except CheckoutError:
+                    results.append("short")
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # every cart takes 2 of the 5 units of each product
+        self.assertEqual(sorted(results), ["placed"] * 2 + ["short"] * 6)
+        self.assertEqual(
+            list(Product.objects.values_list("stock", flat=True)), [1, 1, 1]
+        )
+        self.assertEqual(Order.objects.count(), 2)
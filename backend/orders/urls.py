@@ -0,0 +1,9 @@
+from django.urls import path
+
+from . import views
+
+urlpatterns = [
+    path("", views.OrderListView.as_view()),
+    path("<int:pk>/", views.OrderDetailView.as_view()),
+    path("checkout/", views.CheckoutView.as_view()),
+]
@@ -0,0 +1,67 @@
+from rest_framework import generics, permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from config.fields import SparseFieldsMixin
+from config.idempotency import idempotent
+from config.pagination import EstimatedCountLimitOffsetPagination
+from config.telemetry import ServerTimingMixin
+
+from .managers import CheckoutError
+from .models import Order
+from .serializers import OrderSerializer
+
+
+class UserOrderQuerysetMixin:
+    """Orders of the request user, admin users see every order."""
+
+    def get_queryset(self):
+        queryset = Order.objects.with_items()
+        user = self.request.user
+        if user.is_admin:
+            return queryset
+        return queryset.filter(user=user)
+
+
+class OrderListView(
+    ServerTimingMixin, SparseFieldsMixin, UserOrderQuerysetMixin, generics.ListAPIView
+):
+    """List the orders of the request user."""
+
+    query_budget = 3
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = OrderSerializer
+    pagination_class = EstimatedCountLimitOffsetPagination
+
+
+class OrderDetailView(
+    ServerTimingMixin,
+    SparseFieldsMixin,
+    UserOrderQuerysetMixin,
+    generics.RetrieveAPIView,
+):
+    """Retrieve an order of the request user."""
+
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = OrderSerializer
+
+
+class CheckoutView(ServerTimingMixin, APIView):
+    """Place an order with the items of the request user's cart."""
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    @idempotent
+    def post(self, request, *args, **kwargs):
+        try:
+            order = Order.objects.checkout(request.user)
+        except CheckoutError as error:
+            data = {"detail": str(error)}
+            if error.products:
+                data["products"] = [
+                    {"id": product.id, "slug": product.slug, "stock": product.stock}
+                    for product in error.products
+                ]
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+        serializer = OrderSerializer(order, context={"request": request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -1,5 +1,7 @@
 from django.contrib import admin
 
+from config.pagination import EstimatedCountPaginator
+
 from .models import Category, Product, Review
 
 
@@ -16,6 +18,8 @@ class CategoryAdmin(admin.ModelAdmin):
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     list_display = ["name", "price", "discount_price", "stock", "vendor", "status"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     prepopulated_fields = {
         "slug": [
             "name",
@@ -33,3 +37,5 @@ class ReviewAdmin(admin.ModelAdmin):
         "created_at",
         "updated_at",
     ]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
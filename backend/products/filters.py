@@ -1,13 +1,99 @@
+import functools
+
 import django_filters
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast, Greatest
+from rest_framework import filters
+
+from .managers import SEARCH_CONFIG
+from .models import Category, Product
+
+# Slug to id mappings are cached under this version, which the Category signal
+# handlers bump whenever a category is saved or deleted.
+CATEGORY_IDS_VERSION_KEY = "products:category-ids:version"
+CATEGORY_IDS_TIMEOUT = 60 * 60 * 24
+
+
+def get_category_id(slug: str) -> int | None:
+    """Returns the id of the category with the slug, resolving it once per cache version."""
+    version = cache.get_or_set(CATEGORY_IDS_VERSION_KEY, 1, timeout=None)
+    key = f"products:category-id:{slug}"
+    category_id = cache.get(key, version=version)
+    if category_id is None:
+        # 0 caches slugs of categories that don't exist
+        category_id = (
+            Category.objects.filter(slug=slug).values_list("id", flat=True).first() or 0
+        )
+        cache.set(key, category_id, timeout=CATEGORY_IDS_TIMEOUT, version=version)
+    return category_id or None
+
+
+def invalidate_category_ids():
+    try:
+        cache.incr(CATEGORY_IDS_VERSION_KEY)
+    except ValueError:
+        # the version expired from the cache, the next lookup starts a new one
+        pass
+
 
-from .models import Product
+@functools.cache
+def has_trigram_extension(alias: str) -> bool:
+    """Checks whether the pg_trgm extension is installed in the database."""
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = %s)", ["pg_trgm"]
+        )
+        return cursor.fetchone()[0]
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """
+    Full-text product search on the stored search vector, ordered by relevance.
+
+    When pg_trgm is installed, products whose name is similar to the search
+    terms also match, so misspelled searches still find products.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        search_terms = " ".join(self.get_search_terms(request))
+        if not search_terms:
+            return queryset
+
+        search_query = SearchQuery(
+            search_terms, config=SEARCH_CONFIG, search_type="websearch"
+        )
+        condition = Q(search_vector=search_query)
+        rank = SearchRank(F("search_vector"), search_query)
+        if has_trigram_extension(queryset.db):
+            condition |= Q(name__trigram_similar=search_terms)
+            rank = Greatest(rank, TrigramSimilarity("name", search_terms))
+
+        return (
+            queryset.filter(condition)
+            # double precision keeps the rank exact when used in pagination cursors
+            .annotate(search_rank=Cast(rank, output_field=FloatField()))
+            .order_by("-search_rank", *queryset.query.order_by)
+        )
 
 
 class ProductFilter(django_filters.FilterSet):
     category = django_filters.CharFilter(
-        field_name="category__slug", lookup_expr="icontains"
+        method="filter_category", label="Category slug or id"
     )
 
     class Meta:
         model = Product
         fields = ["category"]
+
+    def filter_category(self, queryset, name, value):
+        """Filters on the category foreign key, so no join to categories is needed."""
+        # slugs win over ids, so categories with all-digit slugs stay reachable
+        category_id = get_category_id(value)
+        if category_id is None and value.isascii() and value.isdecimal():
+            category_id = int(value)
+        if category_id is None:
+            return queryset.none()
+        return queryset.filter(category_id=category_id)
@@ -0,0 +1,266 @@
+import json
+import platform
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.utils import timezone
+from rest_framework.settings import api_settings
+
+from config.benchmarks import (
+    Endpoint,
+    EndpointBenchmark,
+    IsolatedCaches,
+    compare_results,
+    get_server_name,
+)
+from products.models import Category, Product
+from users.models import CustomUser, UserRole
+
+from .seed_data import SEED_EMAIL_DOMAIN, SEED_PASSWORD
+
+# products, categories and search terms the requests rotate over
+SAMPLE_SIZE = 100
+ORDERINGS = ("-created_at", "price", "-price", "-avg_rating", "-reviews_count")
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the hot endpoints through the URLconf and middleware, in "
+        "process with the test client: latency percentiles, throughput, "
+        "queries and allocated memory per request. Runs against the current "
+        "database, e.g. filled with seed_data. Each write request runs in a "
+        "transaction that is rolled back, and the cache entries of the benchmark "
+        "are kept apart from the entries of the site and deleted afterwards. "
+        "Results can be saved as JSON and compared against a baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests", type=int, default=100, help="Timed requests per endpoint."
+        )
+        parser.add_argument(
+            "--warmup", type=int, default=10, help="Untimed requests per endpoint."
+        )
+        parser.add_argument(
+            "--traced-requests",
+            type=int,
+            default=10,
+            help="Requests per endpoint tracing queries and memory.",
+        )
+        parser.add_argument(
+            "--cold",
+            action="store_true",
+            help="Delete the cached responses before each request.",
+        )
+        parser.add_argument(
+            "--endpoints", nargs="*", help="Names of the benchmarked endpoints."
+        )
+        parser.add_argument(
+            "--email",
+            help="Email of the user of authenticated endpoints, defaults to a "
+            "seeded customer with a cart.",
+        )
+        parser.add_argument("--password", default=SEED_PASSWORD)
+        parser.add_argument("--output", help="Path of the JSON results.")
+        parser.add_argument("--baseline", help="Path of JSON results to compare to.")
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.2,
+            help="Ratio over the baseline latencies and memory reported as a "
+            "regression. Any increase of queries is a regression.",
+        )
+
+    def handle(self, *args, **options):
+        if settings.DEBUG:
+            self.stderr.write(
+                self.style.WARNING(
+                    "DEBUG is on, the latencies include the debugging overhead."
+                )
+            )
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as file:
+                baseline = json.load(file)
+            if baseline["meta"]["cold"] != options["cold"]:
+                raise CommandError(
+                    "The baseline and the benchmark must both use --cold or not."
+                )
+
+        # the writes are rolled back, but not the cache entries of the requests
+        with IsolatedCaches() as isolated_caches:
+            results = self.benchmark(options, isolated_caches)
+
+        output = {
+            "meta": {
+                "created_at": timezone.now().isoformat(),
+                "settings": settings.SETTINGS_MODULE,
+                "debug": settings.DEBUG,
+                "python": platform.python_version(),
+                "cold": options["cold"],
+            },
+            "endpoints": results,
+        }
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                json.dump(output, file, indent=2)
+            self.stdout.write(f"Saved the results to {options['output']}.")
+        if baseline is not None:
+            self.compare(results, baseline["endpoints"], options["tolerance"])
+
+    def benchmark(self, options, isolated_caches):
+        client = Client(SERVER_NAME=get_server_name())
+        endpoints = self.get_endpoints(client, options)
+        names = options["endpoints"] or list(endpoints)
+        unknown = set(names) - set(endpoints)
+        if unknown:
+            raise CommandError(f"Unknown endpoint(s): {', '.join(sorted(unknown))}.")
+
+        benchmark = EndpointBenchmark(
+            client,
+            isolated_caches,
+            requests=options["requests"],
+            warmup=options["warmup"],
+            traced_requests=options["traced_requests"],
+            cold=options["cold"],
+        )
+        self.stdout.write(
+            f"{'endpoint':<16} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+            f"{'p99 ms':>8} {'queries':>8} {'KiB':>8}"
+        )
+        results = {}
+        for name in names:
+            try:
+                metrics = results[name] = benchmark.run(endpoints[name])
+            except RuntimeError as e:
+                raise CommandError(str(e))
+            self.stdout.write(
+                f"{name:<16} {metrics['requests_per_s']:>8.1f} "
+                f"{metrics['p50_ms']:>8.2f} {metrics['p95_ms']:>8.2f} "
+                f"{metrics['p99_ms']:>8.2f} {metrics['queries']:>8.1f} "
+                f"{metrics['allocated_kib']:>8.1f}"
+            )
+        return results
+
+    def get_endpoints(self, client, options):
+        products = list(
+            Product.objects.active_products()
+            .filter(stock__gt=0)
+            .order_by("pk")
+            .values_list("pk", "slug", "name")[:SAMPLE_SIZE]
+        )
+        reviewed_slugs = list(
+            Product.objects.active_products()
+            .order_by("-active_reviews_count", "pk")
+            .values_list("slug", flat=True)[:SAMPLE_SIZE]
+        )
+        category_slugs = list(
+            Category.objects.order_by("pk").values_list("slug", flat=True)[:SAMPLE_SIZE]
+        )
+        if not (products and category_slugs):
+            raise CommandError(
+                "There are no active products to benchmark, seed the database "
+                "with seed_data first."
+            )
+        search_terms = [name.split()[0].lower() for _, _, name in products]
+        authorization = f"Bearer {self.log_in(client, options)}"
+        ordering_param = api_settings.ORDERING_PARAM
+        search_param = api_settings.SEARCH_PARAM
+
+        def pick(values, index):
+            return values[index % len(values)]
+
+        def product_list(index):
+            return f"/api/products/?{ordering_param}={pick(ORDERINGS, index)}", None
+
+        def product_search(index):
+            return f"/api/products/?{search_param}={pick(search_terms, index)}", None
+
+        def product_filter(index):
+            category = pick(category_slugs, index)
+            ordering = pick(ORDERINGS, index)
+            return (
+                f"/api/products/?category={category}&{ordering_param}={ordering}",
+                None,
+            )
+
+        def product_detail(index):
+            return f"/api/products/{pick(products, index)[1]}/", None
+
+        def product_reviews(index):
+            return f"/api/products/{pick(reviewed_slugs, index)}/reviews/", None
+
+        def user_cart(index):
+            return "/api/carts/user/", None
+
+        def add_to_cart(index):
+            return "/api/carts/add/", {"product_id": pick(products, index)[0]}
+
+        def login(index):
+            return "/api/token/", {
+                "email": options["email"],
+                "password": options["password"],
+            }
+
+        endpoints = [
+            Endpoint("product_list", "GET", product_list),
+            Endpoint("product_search", "GET", product_search),
+            Endpoint("product_filter", "GET", product_filter),
+            Endpoint("product_detail", "GET", product_detail),
+            Endpoint(
+                "product_reviews",
+                "GET",
+                product_reviews,
+                HTTP_AUTHORIZATION=authorization,
+            ),
+            Endpoint("user_cart", "GET", user_cart, HTTP_AUTHORIZATION=authorization),
+            Endpoint(
+                "add_to_cart",
+                "POST",
+                add_to_cart,
+                expected_status=201,
+                HTTP_AUTHORIZATION=authorization,
+            ),
+            Endpoint("login", "POST", login),
+        ]
+        return {endpoint.name: endpoint for endpoint in endpoints}
+
+    def log_in(self, client, options):
+        """Returns an access token of the benchmark user."""
+        if not options["email"]:
+            user = (
+                CustomUser.objects.filter(
+                    email__endswith=f"@{SEED_EMAIL_DOMAIN}",
+                    role=UserRole.CUSTOMER,
+                    cart__items__isnull=False,
+                )
+                .order_by("pk")
+                .first()
+            )
+            if user is None:
+                raise CommandError(
+                    "There is no seeded customer with a cart, seed the database "
+                    "with seed_data or pass --email and --password."
+                )
+            options["email"] = user.email
+
+        response = client.post(
+            "/api/token/",
+            {"email": options["email"], "password": options["password"]},
+        )
+        if response.status_code != 200:
+            raise CommandError(f"Logging in as {options['email']} failed.")
+        return response.json()["access"]
+
+    def compare(self, results, baseline, tolerance):
+        regressions = compare_results(results, baseline, tolerance)
+        for name, metric, baseline_value, value in regressions:
+            self.stdout.write(
+                self.style.ERROR(
+                    f"{name} {metric}: {value} against {baseline_value} in the baseline"
+                )
+            )
+        if regressions:
+            raise CommandError(f"{len(regressions)} regression(s) over the baseline.")
+        self.stdout.write(self.style.SUCCESS("No regression over the baseline."))
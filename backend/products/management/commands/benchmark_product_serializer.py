@@ -0,0 +1,141 @@
+import contextlib
+import statistics
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from products.models import Category, Product
+from products.serializers import ProductSerializer
+from users.models import CustomUser, UserRole
+from users.serializers import DynamicFieldsModelSerializer
+from vendors.models import Vendor
+
+
+def generic_product_representation(self, instance):
+    """`ProductSerializer.to_representation` as it was before read plans."""
+    data = serializers.ModelSerializer.to_representation(self, instance)
+    if self.fields is None or "status" in self.fields:
+        data["status"] = instance.get_status_display()
+    user = self.context.get("request").user
+    if user.is_anonymous or (user.is_authenticated and not user.is_admin):
+        if "status" in data:
+            del data["status"]
+    return data
+
+
+@contextlib.contextmanager
+def generic_representation():
+    """Serializes with the generic ModelSerializer path instead of read plans."""
+    read_plan_representation = DynamicFieldsModelSerializer.to_representation
+    DynamicFieldsModelSerializer.to_representation = (
+        serializers.ModelSerializer.to_representation
+    )
+    ProductSerializer.to_representation = generic_product_representation
+    try:
+        yield
+    finally:
+        DynamicFieldsModelSerializer.to_representation = read_plan_representation
+        del ProductSerializer.to_representation
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the per-row cost of ProductSerializer with read plans against "
+        "the generic ModelSerializer representation. Uses unsaved products, so "
+        "no database rows are created."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows", type=int, default=50, help="Products per serialized page."
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=200, help="Number of timed pages."
+        )
+
+    def handle(self, *args, **options):
+        rows, repeat = options["rows"], options["repeat"]
+        products = self.build_products(rows)
+        admin = CustomUser(email="admin@example.com", role=UserRole.ADMINISTRATOR)
+
+        for label, user in (("anonymous", AnonymousUser()), ("admin", admin)):
+            request = Request(APIRequestFactory().get("/api/products/"))
+            request.user = user
+            context = {"request": request}
+
+            with generic_representation():
+                generic = self.benchmark(products, context, repeat)
+            plan = self.benchmark(products, context, repeat)
+
+            renderer = JSONRenderer()
+            if renderer.render(plan["data"]) != renderer.render(generic["data"]):
+                raise CommandError(f"Read plan output differs for {label} users.")
+
+            for cost in ("row", "page"):
+                self.stdout.write(
+                    f"{label:>9} per {cost}: "
+                    f"generic {generic[cost]:8.1f} us, "
+                    f"read plan {plan[cost]:8.1f} us, "
+                    f"{generic[cost] / plan[cost]:.2f}x faster"
+                )
+
+    def benchmark(self, products, context, repeat):
+        """
+        Returns the median cost of serializing a row once the serializer is built,
+        and of a whole page including building the serializer, in microseconds.
+        """
+
+        def serialize_page():
+            return ProductSerializer(products, many=True, context=context).data
+
+        serializer = ProductSerializer(products, many=True, context=context)
+        data = serializer.data
+        row_times = self.time(lambda: serializer.to_representation(products), repeat)
+        page_times = self.time(serialize_page, repeat)
+        return {
+            "data": data,
+            "row": statistics.median(row_times) / len(products) * 1e6,
+            "page": statistics.median(page_times) * 1e6,
+        }
+
+    def time(self, serialize, repeat):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            serialize()
+            times.append(time.perf_counter() - start)
+        return times
+
+    def build_products(self, rows):
+        now = timezone.now()
+        category = Category(id=1, name="Shoes", slug="shoes")
+        vendor = Vendor(id=1, name="Vendor", status=Vendor.Status.ACTIVE)
+        products = []
+        for index in range(1, rows + 1):
+            product = Product(
+                id=index,
+                name=f"Product {index}",
+                slug=f"product-{index}",
+                description="Lorem ipsum dolor sit amet. " * 4,
+                price=Decimal("120.00"),
+                discount_price=Decimal("99.50") if index % 2 else None,
+                stock=index,
+                status=Product.Status.ACTIVE,
+                category=category,
+                vendor=vendor,
+                created_at=now,
+                updated_at=now,
+            )
+            # the review annotations of `ProductQuerySet.reviews_annotations`
+            product.reviews_count = index
+            product.avg_rating = Decimal("4.25")
+            product.sum_rating = index * 4
+            products.append(product)
+        return products
@@ -0,0 +1,84 @@
+import statistics
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from rest_framework import serializers
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from carts.serializers import CartSerializer
+from products.serializers import ProductSerializer, ReviewSerializer
+from users.serializers import DynamicFieldsModelSerializer
+
+# serializers built by the endpoints, as (endpoint, serializer factory)
+ENDPOINT_SERIALIZERS = [
+    (
+        "GET /api/products/",
+        lambda context: ProductSerializer(many=True, context=context),
+    ),
+    ("GET /api/products/<slug>/", lambda context: ProductSerializer(context=context)),
+    (
+        "GET /api/products/<slug>/reviews/",
+        lambda context: ReviewSerializer(many=True, context=context),
+    ),
+    ("GET /api/carts/", lambda context: CartSerializer(many=True, context=context)),
+    ("GET /api/carts/user/", lambda context: CartSerializer(context=context)),
+]
+
+
+def build_fields(serializer):
+    """Builds the fields of the serializer and of its nested serializers."""
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    for field in serializer.fields.values():
+        if isinstance(field, serializers.BaseSerializer):
+            build_fields(field)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the time the field declaration cache of "
+        "DynamicFieldsModelSerializer saves when building the serializers of "
+        "the product and cart endpoints."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repeat", type=int, default=500, help="Number of timed serializers."
+        )
+
+    def handle(self, *args, **options):
+        request = Request(APIRequestFactory().get("/"))
+        request.user = AnonymousUser()
+        context = {"request": request}
+
+        for endpoint, factory in ENDPOINT_SERIALIZERS:
+            uncached = self.benchmark(factory, context, options["repeat"], 0)
+            cached = self.benchmark(
+                factory,
+                context,
+                options["repeat"],
+                DynamicFieldsModelSerializer.field_templates_maxsize,
+            )
+            self.stdout.write(
+                f"{endpoint:<35} uncached {uncached:7.1f} us, "
+                f"cached {cached:7.1f} us, saves {uncached - cached:7.1f} us "
+                f"per request"
+            )
+
+    def benchmark(self, factory, context, repeat, maxsize):
+        """Returns the median time to build the serializer, in microseconds."""
+        default_maxsize = DynamicFieldsModelSerializer.field_templates_maxsize
+        DynamicFieldsModelSerializer.field_templates_maxsize = maxsize
+        DynamicFieldsModelSerializer._field_templates.clear()
+        try:
+            build_fields(factory(context))
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                build_fields(factory(context))
+                times.append(time.perf_counter() - start)
+        finally:
+            DynamicFieldsModelSerializer.field_templates_maxsize = default_maxsize
+        return statistics.median(times) * 1e6
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = "Rebuild the stored review aggregates of products from the reviews table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "products",
+            nargs="*",
+            help="Slugs of the products to rebuild. Rebuilds all products if omitted.",
+        )
+
+    def handle(self, *args, **options):
+        queryset = Product.objects.all()
+        if options["products"]:
+            queryset = queryset.filter(slug__in=options["products"])
+
+        updated = queryset.refresh_review_aggregates()
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt review aggregates of {updated} product(s).")
+        )
@@ -0,0 +1,421 @@
+import itertools
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils.crypto import RANDOM_STRING_CHARS
+from django.utils.text import slugify
+from faker import Faker
+
+from carts.models import Cart, CartItem, StockReservation
+from config.caching import bump_generation
+from products.filters import invalidate_category_ids
+from products.models import Category, Product, Review
+from users.models import CustomUser, UserRole
+from vendors.models import Vendor
+
+# password of every seeded user, so benchmarks can log in as any of them
+SEED_PASSWORD = "seed-password"
+SEED_EMAIL_DOMAIN = "seed.example.com"
+# the seeded rows are created within the year before this date
+SEED_EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+SEED_PERIOD = timedelta(days=365)
+# texts generated with faker once and picked for each row, faker is far too
+# slow to generate millions of texts
+TEXT_POOL_SIZE = 1000
+
+# exponent of the zipf distribution of products across vendors and categories
+POPULARITY_EXPONENT = 1.1
+# shape of the pareto distribution of reviews per product, most products get
+# no or a few reviews and a few products get hundreds
+REVIEWS_ALPHA = 1.1
+# weights of the ratings from 1 to 5
+RATING_WEIGHTS = (4, 3, 8, 25, 60)
+PRODUCT_STATUS_WEIGHTS = {
+    Product.Status.ACTIVE: 85,
+    Product.Status.DRAFT: 5,
+    Product.Status.INACTIVE: 5,
+    Product.Status.DISCONTINUED: 5,
+}
+VENDOR_STATUS_WEIGHTS = {
+    Vendor.Status.ACTIVE: 90,
+    Vendor.Status.PENDING: 5,
+    Vendor.Status.SUSPENDED: 5,
+}
+MAX_CART_ITEMS = 8
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def get_zipf_cum_weights(count, exponent=POPULARITY_EXPONENT):
+    """Returns the cumulative weights of `count` choices, the first ones being the most popular."""
+    return list(
+        itertools.accumulate(1 / rank**exponent for rank in range(1, count + 1))
+    )
+
+
+class ExplicitValuesQuerySet(models.QuerySet):
+    """
+    Inserts the values assigned to the fields as they are, like fixtures are
+    loaded, so `auto_now` and `auto_now_add` fields get the reproducible
+    timestamps of the seeded rows instead of the current time.
+    """
+
+    def _insert(self, *args, **kwargs):
+        kwargs["raw"] = True
+        return super()._insert(*args, **kwargs)
+
+
+@contextmanager
+def asynchronous_commit():
+    """
+    Doesn't wait for the commits of the connection to be flushed to disk, a
+    crash loses the last commits, which seeded rows can afford.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SET synchronous_commit TO OFF")
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute("RESET synchronous_commit")
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed the database with generated categories, vendors, users, products, "
+        "reviews and carts for benchmarks. Rows are inserted with bulk inserts, "
+        "and the same seed and volumes generate the same data, timestamps "
+        "included, except the expiry of the cart reservations, which are held "
+        "for the rest of their lifetime from the time of the run. Every "
+        f"seeded user logs in with the password {SEED_PASSWORD!r}."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+        parser.add_argument("--categories", type=int, default=1000)
+        parser.add_argument("--vendors", type=int, default=5000)
+        parser.add_argument(
+            "--users", type=int, default=100_000, help="Number of customers."
+        )
+        parser.add_argument("--products", type=int, default=1_000_000)
+        parser.add_argument(
+            "--max-reviews",
+            type=int,
+            default=500,
+            help="Maximum number of reviews of a product.",
+        )
+        parser.add_argument(
+            "--carts", type=int, default=10_000, help="Number of non-empty carts."
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=5000, help="Rows per insert."
+        )
+
+    def handle(self, *args, **options):
+        if options["carts"] > options["users"]:
+            raise CommandError("There can't be more carts than users.")
+        if CustomUser.objects.filter(email__endswith=f"@{SEED_EMAIL_DOMAIN}").exists():
+            raise CommandError("The database is already seeded, flush it first.")
+
+        self.seed = options["seed"]
+        self.batch_size = options["batch_size"]
+        self.texts = self.generate_texts()
+        # reservations are held from now on, so they aren't released as expired
+        self.reservations_held_from = datetime.now(timezone.utc)
+        start = time.perf_counter()
+
+        with asynchronous_commit():
+            category_ids = self.seed_categories(options["categories"])
+            vendor_ids = self.seed_vendors(options["vendors"])
+            user_ids = self.seed_users(options["users"])
+            products = self.seed_products(options["products"], category_ids, vendor_ids)
+            self.seed_reviews(products, user_ids, options["max_reviews"])
+            self.seed_carts(products, user_ids, options["carts"])
+
+        bump_generation("category", "vendor", "product", "review")
+        invalidate_category_ids()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Seeded the database in {time.perf_counter() - start:.2f} s."
+            )
+        )
+
+    def get_random(self, name):
+        # one generator per table, so the rows of a table don't change with the
+        # volumes of the others
+        return random.Random(f"{self.seed}-{name}")
+
+    def generate_texts(self):
+        faker = Faker()
+        faker.seed_instance(self.seed)
+
+        def pool(generate):
+            return [generate() for _ in range(TEXT_POOL_SIZE)]
+
+        return {
+            "word": pool(faker.word),
+            "first_name": pool(faker.first_name),
+            "last_name": pool(faker.last_name),
+            "company": pool(faker.company),
+            "address": pool(lambda: faker.address().replace("\n", ", ")),
+            "product": pool(faker.catch_phrase),
+            "paragraph": pool(lambda: faker.paragraph(nb_sentences=5)),
+            "sentence": pool(faker.sentence),
+        }
+
+    def get_timestamp(self, rng):
+        return SEED_EPOCH - SEED_PERIOD * rng.random()
+
+    def insert(self, model, objects):
+        """Inserts the objects in batches, and yields the batches with their primary keys."""
+        for batch in batched(objects, self.batch_size):
+            with transaction.atomic():
+                yield ExplicitValuesQuerySet(model).bulk_create(batch)
+
+    def report(self, label, count, start):
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"Seeded {count} {label} in {elapsed:.2f} s "
+            f"({count / max(elapsed, 1e-9):.0f} rows/s)."
+        )
+
+    def seed_categories(self, count):
+        rng = self.get_random("categories")
+
+        def build(index):
+            name = f"{rng.choice(self.texts['word']).title()} {index}"
+            created_at = self.get_timestamp(rng)
+            return Category(
+                name=name,
+                slug=slugify(name),
+                created_at=created_at,
+                updated_at=created_at,
+            )
+
+        start = time.perf_counter()
+        category_ids = [
+            category.pk
+            for batch in self.insert(Category, map(build, range(1, count + 1)))
+            for category in batch
+        ]
+        self.report("categories", len(category_ids), start)
+        return category_ids
+
+    def seed_vendors(self, count):
+        """Returns the ids of the active vendors."""
+        rng = self.get_random("vendors")
+        users = self.import_users(count, "vendor", UserRole.VENDOR, rng)
+        statuses = list(VENDOR_STATUS_WEIGHTS)
+        weights = list(VENDOR_STATUS_WEIGHTS.values())
+
+        def build(index, user):
+            created_at = self.get_timestamp(rng)
+            return Vendor(
+                name=f"{rng.choice(self.texts['company'])} {index}",
+                user=user,
+                description=rng.choice(self.texts["paragraph"]),
+                email=f"contact{index}@{SEED_EMAIL_DOMAIN}",
+                address=rng.choice(self.texts["address"])[:255],
+                phone_number=f"98{index:08d}",
+                status=rng.choices(statuses, weights)[0],
+                created_at=created_at,
+                updated_at=created_at,
+            )
+
+        start = time.perf_counter()
+        vendors = [
+            vendor
+            for batch in self.insert(
+                Vendor, itertools.starmap(build, enumerate(users, 1))
+            )
+            for vendor in batch
+        ]
+        self.report("vendors", len(vendors), start)
+        return [
+            vendor.pk for vendor in vendors if vendor.status == Vendor.Status.ACTIVE
+        ]
+
+    def seed_users(self, count):
+        users = self.import_users(
+            count, "customer", UserRole.CUSTOMER, self.get_random("users")
+        )
+        return [user.pk for user in users]
+
+    def import_users(self, count, prefix, role, rng):
+        start = time.perf_counter()
+        # a single hash, hashing each password would take hours. The salt is
+        # as long as a random one, or logging in would hash the password again
+        # and revoke the tokens of the user.
+        salt = "".join(rng.choices(RANDOM_STRING_CHARS, k=22))
+        password = make_password(SEED_PASSWORD, salt=salt)
+
+        def build(index):
+            return CustomUser(
+                email=f"{prefix}{index}@{SEED_EMAIL_DOMAIN}",
+                username=f"{prefix}{index}",
+                first_name=rng.choice(self.texts["first_name"]),
+                last_name=rng.choice(self.texts["last_name"]),
+                password=password,
+                role=role,
+                date_joined=self.get_timestamp(rng),
+            )
+
+        users = []
+        for batch in batched(map(build, range(1, count + 1)), self.batch_size):
+            with transaction.atomic():
+                batch = CustomUser.objects.bulk_import(batch, self.batch_size)
+                # the carts are created along with the users
+                Cart.objects.filter(user__in=batch).update(
+                    created_at=Subquery(
+                        CustomUser.objects.filter(pk=OuterRef("user_id")).values(
+                            "date_joined"
+                        )
+                    )
+                )
+            users.extend(batch)
+        self.report(f"{prefix} users", len(users), start)
+        return users
+
+    def seed_products(self, count, category_ids, vendor_ids):
+        """Returns `(id, status, stock)` tuples of the products."""
+        if count and not (category_ids and vendor_ids):
+            raise CommandError("Products need categories and active vendors.")
+        rng = self.get_random("products")
+        category_weights = get_zipf_cum_weights(len(category_ids))
+        vendor_weights = get_zipf_cum_weights(len(vendor_ids))
+        statuses = list(PRODUCT_STATUS_WEIGHTS)
+        status_weights = list(itertools.accumulate(PRODUCT_STATUS_WEIGHTS.values()))
+
+        def build(index):
+            name = rng.choice(self.texts["product"])
+            # log-normal prices, mostly in the tens and hundreds
+            price = Decimal(f"{min(10 + rng.lognormvariate(3.5, 1.2), 99_999):.2f}")
+            discount_price = None
+            if rng.random() < 0.3:
+                discount_price = Decimal(
+                    f"{price * Decimal(rng.uniform(0.5, 0.95)):.2f}"
+                )
+                if discount_price < 10:
+                    discount_price = None
+            created_at = self.get_timestamp(rng)
+            return Product(
+                name=name,
+                slug=f"{slugify(name)}-{index}",
+                description=rng.choice(self.texts["paragraph"]),
+                price=price,
+                discount_price=discount_price,
+                stock=rng.randint(0, 1000),
+                status=rng.choices(statuses, cum_weights=status_weights)[0],
+                category_id=rng.choices(category_ids, cum_weights=category_weights)[0],
+                vendor_id=rng.choices(vendor_ids, cum_weights=vendor_weights)[0],
+                created_at=created_at,
+                updated_at=created_at,
+            )
+
+        start = time.perf_counter()
+        products = []
+        # `Product.save()` validates each row, which queries its vendor
+        for batch in self.insert(Product, map(build, range(1, count + 1))):
+            Product.objects.filter(
+                pk__range=(batch[0].pk, batch[-1].pk)
+            ).refresh_search_vectors()
+            products.extend(
+                (product.pk, product.status, product.stock) for product in batch
+            )
+        self.report("products", len(products), start)
+        return products
+
+    def seed_reviews(self, products, user_ids, max_reviews):
+        rng = self.get_random("reviews")
+        max_reviews = min(max_reviews, len(user_ids))
+        ratings = range(1, 6)
+        rating_weights = list(itertools.accumulate(RATING_WEIGHTS))
+
+        def build():
+            for product_id, _, _ in products:
+                count = min(int(rng.paretovariate(REVIEWS_ALPHA)) - 1, max_reviews)
+                for user_id in rng.sample(user_ids, count):
+                    created_at = self.get_timestamp(rng)
+                    yield Review(
+                        product_id=product_id,
+                        user_id=user_id,
+                        rating=rng.choices(ratings, cum_weights=rating_weights)[0],
+                        comment=rng.choice(self.texts["sentence"]),
+                        is_active=rng.random() < 0.95,
+                        created_at=created_at,
+                        updated_at=created_at,
+                    )
+
+        start = time.perf_counter()
+        count = sum(len(batch) for batch in self.insert(Review, build()))
+        self.report("reviews", count, start)
+        for batch in batched(products, self.batch_size):
+            Product.objects.filter(
+                pk__range=(batch[0][0], batch[-1][0])
+            ).refresh_review_aggregates(updated_at=SEED_EPOCH)
+
+    def seed_carts(self, products, user_ids, count):
+        rng = self.get_random("carts")
+        # units left to reserve, so reservations never exceed the stock
+        available = {
+            product_id: stock
+            for product_id, status, stock in products
+            if status == Product.Status.ACTIVE and stock > 0
+        }
+        candidates = list(available)
+        if count and not candidates:
+            raise CommandError("Carts need active products in stock.")
+
+        cart_user_ids = rng.sample(user_ids, count)
+        cart_ids = {}
+        for batch in batched(cart_user_ids, self.batch_size):
+            cart_ids.update(
+                Cart.objects.filter(user_id__in=batch).values_list("user_id", "pk")
+            )
+
+        def build():
+            for user_id in cart_user_ids:
+                size = min(rng.randint(1, MAX_CART_ITEMS), len(candidates))
+                for product_id in rng.sample(candidates, size):
+                    quantity = min(rng.randint(1, 3), available[product_id])
+                    if not quantity:
+                        continue
+                    available[product_id] -= quantity
+                    yield CartItem(
+                        cart_id=cart_ids[user_id],
+                        product_id=product_id,
+                        quantity=quantity,
+                        # added within the reservation lifetime before the epoch
+                        date_added=SEED_EPOCH
+                        - settings.CART_RESERVATION_TTL * rng.random(),
+                    )
+
+        start = time.perf_counter()
+        count = 0
+        for items in self.insert(CartItem, build()):
+            StockReservation.objects.bulk_create(
+                StockReservation(
+                    cart_item=item,
+                    product_id=item.product_id,
+                    quantity=item.quantity,
+                    # the lifetime left at the epoch, from the time of the run
+                    expires_at=self.reservations_held_from
+                    + (item.date_added + settings.CART_RESERVATION_TTL - SEED_EPOCH),
+                )
+                for item in items
+            )
+            count += len(items)
+        StockReservation.objects.rebuild_reserved_stock()
+        self.report("reserved cart items", count, start)
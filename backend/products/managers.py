@@ -1,6 +1,13 @@
-from django.db import models
-from django.db.models import Avg, Count, Q, Sum
-from django.db.models.functions import Round
+from django.contrib.postgres.search import SearchVector
+from django.db import models, transaction
+from django.db.models import Avg, Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Now, Round
+
+# text search configuration of the product search vector
+SEARCH_CONFIG = "english"
+
+# Review fields that affect the review aggregates stored on the product.
+REVIEW_AGGREGATE_FIELDS = {"product", "product_id", "rating", "is_active"}
 
 
 class ProductQuerySet(models.QuerySet):
@@ -13,18 +20,73 @@ class ProductQuerySet(models.QuerySet):
     def reviews_annotations(self, all_reviews: bool = False):
         """
         Annotates the product with reviews to get total reviews, average rating, and sum of ratings of a product.
+
+        The values are read from the review aggregate columns stored on the product,
+        so no join to the reviews table is needed.
         """
 
         # for admin users, include all product reviews
         # for other users, include only active product reviews
-        review_filter = Q() if all_reviews else Q(reviews__is_active=True)
-
+        if all_reviews:
+            return self.annotate(
+                reviews_count=F("all_reviews_count"),
+                avg_rating=F("all_rating_avg"),
+                sum_rating=F("all_rating_sum"),
+            )
         return self.annotate(
-            reviews_count=Count("reviews", filter=review_filter),
-            avg_rating=Round(
-                Avg("reviews__rating", filter=review_filter, default=0), 2
-            ),
-            sum_rating=Sum("reviews__rating", filter=review_filter, default=0),
+            reviews_count=F("active_reviews_count"),
+            avg_rating=F("active_rating_avg"),
+            sum_rating=F("active_rating_sum"),
+        )
+
+    def refresh_review_aggregates(self, updated_at=None) -> int:
+        """
+        Recomputes the stored review aggregates of the products in the queryset
+        with a single UPDATE statement, stamped with `updated_at` (the current
+        time by default). Returns the number of updated products.
+        """
+        from .models import Review
+
+        def review_aggregate(aggregate, output_field, active_only):
+            reviews = Review.objects.filter(product=OuterRef("pk"))
+            if active_only:
+                reviews = reviews.filter(is_active=True)
+            reviews = reviews.order_by().values("product").annotate(value=aggregate)
+            return Coalesce(
+                Subquery(reviews.values("value"), output_field=output_field),
+                0,
+                output_field=output_field,
+            )
+
+        integer = models.IntegerField()
+        decimal = models.DecimalField(max_digits=3, decimal_places=2)
+        aggregates = {}
+        for prefix, active_only in (("active", True), ("all", False)):
+            aggregates[f"{prefix}_reviews_count"] = review_aggregate(
+                Count("pk"), integer, active_only
+            )
+            aggregates[f"{prefix}_rating_sum"] = review_aggregate(
+                Sum("rating"), integer, active_only
+            )
+            aggregates[f"{prefix}_rating_avg"] = review_aggregate(
+                Round(Avg("rating", output_field=decimal), 2), decimal, active_only
+            )
+        return self.update(**aggregates, reviews_updated_at=updated_at or Now())
+
+    def refresh_search_vectors(self) -> int:
+        """
+        Recomputes the stored full-text search vector (name, category name and
+        description) of the products in the queryset with a single UPDATE statement.
+        """
+        from .models import Category
+
+        category_name = Subquery(
+            Category.objects.filter(pk=OuterRef("category_id")).values("name")[:1]
+        )
+        return self.update(
+            search_vector=SearchVector("name", weight="A", config=SEARCH_CONFIG)
+            + SearchVector(category_name, weight="B", config=SEARCH_CONFIG)
+            + SearchVector("description", weight="C", config=SEARCH_CONFIG)
         )
 
 
@@ -40,3 +102,46 @@ class ProductManager(models.Manager):
 
     def reviews_annotations(self, all_reviews: bool = False):
         return self.get_queryset().reviews_annotations(all_reviews=all_reviews)
+
+    def refresh_review_aggregates(self, updated_at=None) -> int:
+        return self.get_queryset().refresh_review_aggregates(updated_at)
+
+    def refresh_search_vectors(self) -> int:
+        return self.get_queryset().refresh_search_vectors()
+
+
+class ReviewQuerySet(models.QuerySet):
+    """
+    Refreshes the review aggregates of the products after bulk writes, which
+    don't send the signals that keep them in sync for single reviews.
+    """
+
+    def refresh_product_review_aggregates(self, product_ids):
+        product_ids.discard(None)
+        if product_ids:
+            product_model = self.model._meta.get_field("product").related_model
+            product_model.objects.using(self.db).filter(
+                pk__in=product_ids
+            ).refresh_review_aggregates()
+
+    def update(self, **kwargs):
+        if not REVIEW_AGGREGATE_FIELDS & set(kwargs):
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db):
+            product_ids = set(self.values_list("product_id", flat=True))
+            product = kwargs.get("product", kwargs.get("product_id"))
+            product_ids.add(getattr(product, "pk", product))
+            rows = super().update(**kwargs)
+            self.refresh_product_review_aggregates(product_ids)
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            self.refresh_product_review_aggregates({obj.product_id for obj in objs})
+        return objs
+
+
+class ReviewManager(models.Manager):
+    def get_queryset(self):
+        return ReviewQuerySet(self.model, using=self._db)
@@ -0,0 +1,93 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:03
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Avg, Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Round
+
+
+def backfill_review_aggregates(apps, schema_editor):
+    Product = apps.get_model("products", "Product")
+    Review = apps.get_model("products", "Review")
+
+    def review_aggregate(aggregate, output_field, active_only):
+        reviews = Review.objects.filter(product=OuterRef("pk"))
+        if active_only:
+            reviews = reviews.filter(is_active=True)
+        reviews = reviews.order_by().values("product").annotate(value=aggregate)
+        return Coalesce(
+            Subquery(reviews.values("value"), output_field=output_field),
+            0,
+            output_field=output_field,
+        )
+
+    integer = models.IntegerField()
+    decimal = models.DecimalField(max_digits=3, decimal_places=2)
+    aggregates = {}
+    for prefix, active_only in (("active", True), ("all", False)):
+        aggregates[f"{prefix}_reviews_count"] = review_aggregate(
+            Count("pk"), integer, active_only
+        )
+        aggregates[f"{prefix}_rating_sum"] = review_aggregate(
+            Sum("rating"), integer, active_only
+        )
+        aggregates[f"{prefix}_rating_avg"] = review_aggregate(
+            Round(Avg("rating", output_field=decimal), 2), decimal, active_only
+        )
+    Product.objects.update(**aggregates)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0002_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="active_rating_avg",
+            field=models.DecimalField(
+                decimal_places=2, default=Decimal("0.00"), editable=False, max_digits=3
+            ),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="active_rating_sum",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="active_reviews_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="all_rating_avg",
+            field=models.DecimalField(
+                decimal_places=2, default=Decimal("0.00"), editable=False, max_digits=3
+            ),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="all_rating_sum",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="all_reviews_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["-active_rating_avg"], name="products_pr_active__586109_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["-active_reviews_count"], name="products_pr_active__51b210_idx"
+            ),
+        ),
+        migrations.RunPython(backfill_review_aggregates, migrations.RunPython.noop),
+    ]
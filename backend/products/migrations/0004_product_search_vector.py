@@ -0,0 +1,62 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:07
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+# pg_trgm ships with the PostgreSQL contrib package, which is not installed on
+# every server, so the extension and the trigram index on the product name are
+# only created when it is available.
+CREATE_TRIGRAM_INDEX = """
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE INDEX IF NOT EXISTS products_product_name_trgm
+            ON products_product USING gin (name gin_trgm_ops);
+    END IF;
+END
+$$;
+"""
+
+DROP_TRIGRAM_INDEX = "DROP INDEX IF EXISTS products_product_name_trgm;"
+
+
+def backfill_search_vectors(apps, schema_editor):
+    Product = apps.get_model("products", "Product")
+    Category = apps.get_model("products", "Category")
+
+    category_name = Subquery(
+        Category.objects.filter(pk=OuterRef("category_id")).values("name")[:1]
+    )
+    Product.objects.update(
+        search_vector=SearchVector("name", weight="A", config="english")
+        + SearchVector(category_name, weight="B", config="english")
+        + SearchVector("description", weight="C", config="english")
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0003_review_aggregates"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="products_pr_search__98d711_gin"
+            ),
+        ),
+        migrations.RunSQL(CREATE_TRIGRAM_INDEX, DROP_TRIGRAM_INDEX),
+        migrations.RunPython(backfill_search_vectors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("vendors", "0002_alter_vendor_status"),
+        ("products", "0004_product_search_vector"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["category", "status", "-created_at"],
+                name="products_pr_categor_23d7e7_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["vendor", "status", "-created_at"],
+                name="products_pr_vendor__bd9df3_idx",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="product",
+            name="category",
+            field=models.ForeignKey(
+                db_index=False,
+                help_text="Assign category",
+                on_delete=django.db.models.deletion.RESTRICT,
+                related_name="products",
+                to="products.category",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="product",
+            name="vendor",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="products",
+                to="vendors.vendor",
+            ),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0005_product_category_vendor_status_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="reviews_updated_at",
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0006_product_reviews_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="reserved_stock",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
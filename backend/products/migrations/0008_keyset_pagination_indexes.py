@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0007_product_reserved_stock"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="products_pr_created_e6f9fc_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["price", "id"], name="products_pr_price_dbec84_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="review",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="products_re_created_3f5d06_idx"
+            ),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from decimal import Decimal
 
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
@@ -8,7 +10,7 @@ from django.utils.text import slugify
 
 from vendors.models import Vendor
 
-from .managers import ProductManager
+from .managers import ProductManager, ReviewManager
 
 
 class Category(models.Model):
@@ -74,25 +76,67 @@ class Product(models.Model):
         default=Status.DRAFT,
         help_text="Select the status of the product.",
     )
+    # category and vendor lookups are served by the composite indexes below
     category = models.ForeignKey(
         Category,
         on_delete=models.RESTRICT,
         help_text="Assign category",
         related_name="products",
+        db_index=False,
     )
     vendor = models.ForeignKey(
         Vendor,
         on_delete=models.CASCADE,
         related_name="products",
+        db_index=False,
     )
+    # Review aggregates, kept in sync by the Review signal handlers.
+    # `active_*` cover active reviews only, `all_*` cover every review.
+    active_reviews_count = models.PositiveIntegerField(default=0, editable=False)
+    active_rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    active_rating_avg = models.DecimalField(
+        max_digits=3, decimal_places=2, default=Decimal("0.00"), editable=False
+    )
+    all_reviews_count = models.PositiveIntegerField(default=0, editable=False)
+    all_rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    all_rating_avg = models.DecimalField(
+        max_digits=3, decimal_places=2, default=Decimal("0.00"), editable=False
+    )
+    # when the review aggregates were last refreshed, versions conditional requests
+    reviews_updated_at = models.DateTimeField(null=True, editable=False)
+    # Full-text search document, kept in sync by the Product and Category signal handlers.
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Units held by active cart reservations, kept in sync by the reservation statements.
+    reserved_stock = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     objects = ProductManager()
 
+    # fields maintained with SQL updates, which saving a loaded product must not overwrite
+    maintained_fields = {
+        "active_reviews_count",
+        "active_rating_sum",
+        "active_rating_avg",
+        "all_reviews_count",
+        "all_rating_sum",
+        "all_rating_avg",
+        "reviews_updated_at",
+        "search_vector",
+        "reserved_stock",
+    }
+
     class Meta:
         indexes = [
             models.Index(fields=["name"]),
+            models.Index(fields=["-active_rating_avg"]),
+            models.Index(fields=["-active_reviews_count"]),
+            GinIndex(fields=["search_vector"]),
+            models.Index(fields=["category", "status", "-created_at"]),
+            models.Index(fields=["vendor", "status", "-created_at"]),
+            # keyset pagination seeks on the ordering field plus the primary key
+            models.Index(fields=["-created_at", "-id"]),
+            models.Index(fields=["price", "id"]),
         ]
         ordering = ["-created_at"]
 
@@ -116,12 +160,23 @@ class Product(models.Model):
         if not self.slug:
             self.slug = slugify(self.name)
         self.full_clean()
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.maintained_fields
+            ]
         super().save(*args, **kwargs)
 
     @property
     def in_stock(self) -> bool:
         return self.status == Product.Status.ACTIVE and self.stock > 0
 
+    @property
+    def available_stock(self) -> int:
+        """Returns the stock that isn't held by cart reservations."""
+        return max(self.stock - self.reserved_stock, 0)
+
     @property
     def has_discount(self) -> bool:
         """Checks whether the product has a discount."""
@@ -166,6 +221,8 @@ class Review(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ReviewManager()
+
     class Meta:
         ordering = ["-created_at"]
         constraints = [
@@ -175,7 +232,16 @@ class Review(models.Model):
         ]
         indexes = [
             models.Index(fields=["rating"]),
+            models.Index(fields=["-created_at", "-id"]),
         ]
 
     def __str__(self):
         return f"Review by {self.user.email} on product {self.product.name}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the loaded product, so moving a review to another product
+        # refreshes the review aggregates of both products
+        instance._loaded_product_id = instance.__dict__.get("product_id")
+        return instance
@@ -1,4 +1,5 @@
 import logging
+import operator
 from decimal import Decimal
 
 from rest_framework import serializers
@@ -13,6 +14,9 @@ from .models import Category, Product, Review
 
 logger = logging.getLogger(__name__)
 
+# product fields serialized from `ProductQuerySet.reviews_annotations`
+PRODUCT_REVIEW_FIELDS = ("rating", "total_reviews", "total_ratings")
+
 
 class CategorySerializer(DynamicFieldsModelSerializer):
     class Meta:
@@ -40,6 +44,12 @@ class ProductSerializer(DynamicFieldsModelSerializer):
     has_discount = serializers.SerializerMethodField()
     discount_percentage = serializers.SerializerMethodField()
 
+    field_lookups = {
+        **{field_name: () for field_name in PRODUCT_REVIEW_FIELDS},
+        "has_discount": ("discount_price",),
+        "discount_percentage": ("price", "discount_price"),
+    }
+
     class Meta:
         model = Product
         fields = [
@@ -91,22 +101,21 @@ class ProductSerializer(DynamicFieldsModelSerializer):
     def get_discount_percentage(self, obj) -> Decimal:
         return obj.discount_percentage
 
-    def to_representation(self, instance):
-        data = super().to_representation(instance)
-        # self.fields is None - serializer includes all fields by default
-        # only display the field if 'fields' is None or is explicitly included in 'fields' when initializing the serializer
-        if self.fields is None or "status" in self.fields:
-            # return the label of the choice instead of value.
-            data["status"] = instance.get_status_display()
-
+    def get_read_plan(self):
+        plan = super().get_read_plan()
         # Serializer Context
         request = self.context.get("request")
         user = request.user
-        # return serializer fields based on user role
+        # return serializer fields based on user role, once per serializer instead of once per row
         if user.is_anonymous or (user.is_authenticated and not user.is_admin):
-            if "status" in data:
-                del data["status"]
-        return data
+            return [step for step in plan if step[0] != "status"]
+        # return the label of the choice instead of value.
+        return [
+            ("status", operator.methodcaller("get_status_display"), None)
+            if field_name == "status"
+            else (field_name, get_attribute, to_representation)
+            for field_name, get_attribute, to_representation in plan
+        ]
 
 
 class UserReviewSerializer(serializers.ModelSerializer):
@@ -0,0 +1,78 @@
+import functools
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from config.caching import bump_generation
+
+from .filters import invalidate_category_ids
+from .managers import REVIEW_AGGREGATE_FIELDS
+from .models import Category, Product, Review
+
+# Product fields indexed in the full-text search vector.
+SEARCH_VECTOR_FIELDS = {"name", "description", "category", "category_id"}
+
+
+def refresh_review_aggregates(review):
+    product_ids = {review.product_id, getattr(review, "_loaded_product_id", None)}
+    product_ids.discard(None)
+    Product.objects.filter(pk__in=product_ids).refresh_review_aggregates()
+
+
+@receiver(post_save, sender=Review)
+def update_product_review_aggregates(sender, instance, update_fields, **kwargs):
+    # skip saves that cannot change the aggregates (e.g. comment only updates)
+    if update_fields is not None and not REVIEW_AGGREGATE_FIELDS & set(update_fields):
+        return
+    refresh_review_aggregates(instance)
+
+
+@receiver(post_delete, sender=Review)
+def delete_product_review_aggregates(sender, instance, **kwargs):
+    refresh_review_aggregates(instance)
+
+
+@receiver(post_save, sender=Product)
+def update_product_search_vector(sender, instance, update_fields, **kwargs):
+    if update_fields is not None and not SEARCH_VECTOR_FIELDS & set(update_fields):
+        return
+    Product.objects.filter(pk=instance.pk).refresh_search_vectors()
+
+
+@receiver(post_save, sender=Category)
+def update_category_products_search_vector(sender, instance, created, **kwargs):
+    if not created:
+        Product.objects.filter(category=instance).refresh_search_vectors()
+
+
+def invalidate_on_commit(func, *args, using):
+    """
+    Runs the cache invalidation once the transaction commits, so concurrent
+    requests cannot cache the uncommitted state under the new generation.
+    """
+    transaction.on_commit(functools.partial(func, *args), using=using)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_cached_category_ids(sender, using, **kwargs):
+    invalidate_on_commit(invalidate_category_ids, using=using)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_cached_product_responses(sender, using, **kwargs):
+    invalidate_on_commit(bump_generation, "product", using=using)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_cached_category_responses(sender, using, **kwargs):
+    invalidate_on_commit(bump_generation, "category", using=using)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_cached_review_responses(sender, using, **kwargs):
+    invalidate_on_commit(bump_generation, "review", using=using)
@@ -1,11 +1,44 @@
+import json
+import os
+import tempfile
+from datetime import timedelta
 from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Q
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.serializers import BaseSerializer
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
 
-from users.models import CustomUser
+from carts.models import Cart, CartItem, StockReservation
+from config.caching import get_generations, get_response_cache
+from config.fields import QueryPlan, get_serializer_lookups
+from config.pagination import (
+    ESTIMATED_COUNT_THRESHOLD,
+    CustomCursorPagination,
+    EstimatedCountLimitOffsetPagination,
+    get_estimated_count,
+)
+from config.queries import QueryRecorder
+from config.telemetry import JSONFormatter, RequestTiming
+from config.testing import QueryBudgetTestMixin
+from users.models import CustomUser, UserRole
 from vendors.models import Vendor
 
-from .models import Category, Product
+from .filters import get_category_id, has_trigram_extension
+from .models import Category, Product, Review
+from .serializers import ProductSerializer, ReviewSerializer
+from .views import ProductListView
 
 
 class ProductTestCase(TestCase):
@@ -59,3 +92,1274 @@ class ProductTestCase(TestCase):
         self.assertEqual(self.product1.selling_price, Decimal("10.0"))
         # without discount
         self.assertEqual(self.product2.selling_price, Decimal("20.0"))
+
+
+class ReviewAggregatesTestCase(TestCase):
+    def setUp(self):
+        self.vendor_user = CustomUser.objects.create_user(
+            email="vendor@example.com",
+            username="vendor",
+            first_name="vendor",
+            last_name="doe",
+        )
+        self.users = [
+            CustomUser.objects.create_user(
+                email=f"user{i}@example.com",
+                username=f"user{i}",
+                first_name=f"user{i}",
+                last_name="doe",
+            )
+            for i in range(3)
+        ]
+        category = Category.objects.create(name="cat1", slug="cat1")
+        vendor = Vendor.objects.create(
+            name="ven1",
+            user=self.vendor_user,
+            description="lorem",
+            email="ven1@example.com",
+            address="lorem",
+            phone_number="0000000000",
+        )
+        self.product = Product.objects.create(
+            name="product1",
+            slug="product1",
+            description="lorem",
+            price=Decimal("20.0"),
+            stock=2,
+            category=category,
+            vendor=vendor,
+        )
+        self.other_product = Product.objects.create(
+            name="product2",
+            slug="product2",
+            description="lorem",
+            price=Decimal("20.0"),
+            stock=2,
+            category=category,
+            vendor=vendor,
+        )
+
+    def assertAggregates(self, product, active, everything):
+        product.refresh_from_db()
+        self.assertEqual(
+            (
+                product.active_reviews_count,
+                product.active_rating_sum,
+                product.active_rating_avg,
+            ),
+            active,
+        )
+        self.assertEqual(
+            (product.all_reviews_count, product.all_rating_sum, product.all_rating_avg),
+            everything,
+        )
+
+    def test_aggregates_follow_review_changes(self):
+        review1 = Review.objects.create(
+            product=self.product, user=self.users[0], rating=5, comment="lorem"
+        )
+        review2 = Review.objects.create(
+            product=self.product, user=self.users[1], rating=2, comment="lorem"
+        )
+        self.assertAggregates(
+            self.product, (2, 7, Decimal("3.50")), (2, 7, Decimal("3.50"))
+        )
+
+        review2.is_active = False
+        review2.save()
+        self.assertAggregates(
+            self.product, (1, 5, Decimal("5.00")), (2, 7, Decimal("3.50"))
+        )
+
+        review1 = Review.objects.get(pk=review1.pk)
+        review1.product = self.other_product
+        review1.save()
+        self.assertAggregates(
+            self.product, (0, 0, Decimal("0.00")), (1, 2, Decimal("2.00"))
+        )
+        self.assertAggregates(
+            self.other_product, (1, 5, Decimal("5.00")), (1, 5, Decimal("5.00"))
+        )
+
+        review2.delete()
+        self.assertAggregates(
+            self.product, (0, 0, Decimal("0.00")), (0, 0, Decimal("0.00"))
+        )
+
+    def test_rebuild_review_aggregates(self):
+        Review.objects.create(
+            product=self.product, user=self.users[0], rating=4, comment="lorem"
+        )
+        Review.objects.create(
+            product=self.product, user=self.users[1], rating=3, comment="lorem"
+        )
+        # product updates bypass the aggregate refresh
+        Product.objects.filter(pk=self.product.pk).update(
+            active_reviews_count=0, all_reviews_count=0
+        )
+
+        call_command("rebuild_review_aggregates", stdout=StringIO())
+        self.assertAggregates(
+            self.product, (2, 7, Decimal("3.50")), (2, 7, Decimal("3.50"))
+        )
+
+    def test_bulk_writes_refresh_review_aggregates(self):
+        Review.objects.bulk_create(
+            Review(product=self.product, user=user, rating=rating, comment="lorem")
+            for user, rating in zip(self.users, (4, 3))
+        )
+        self.assertAggregates(
+            self.product, (2, 7, Decimal("3.50")), (2, 7, Decimal("3.50"))
+        )
+
+        Review.objects.filter(rating=3).update(is_active=False)
+        self.assertAggregates(
+            self.product, (1, 4, Decimal("4.00")), (2, 7, Decimal("3.50"))
+        )
+
+        Review.objects.filter(rating=4).update(product=self.other_product)
+        self.assertAggregates(
+            self.product, (0, 0, Decimal("0.00")), (1, 3, Decimal("3.00"))
+        )
+        self.assertAggregates(
+            self.other_product, (1, 4, Decimal("4.00")), (1, 4, Decimal("4.00"))
+        )
+
+    def test_reviews_annotations(self):
+        Review.objects.create(
+            product=self.product, user=self.users[0], rating=4, comment="lorem"
+        )
+        Review.objects.create(
+            product=self.product,
+            user=self.users[1],
+            rating=1,
+            comment="lorem",
+            is_active=False,
+        )
+        product = Product.objects.reviews_annotations().get(pk=self.product.pk)
+        self.assertEqual((product.reviews_count, product.sum_rating), (1, 4))
+        product = Product.objects.reviews_annotations(all_reviews=True).get(
+            pk=self.product.pk
+        )
+        self.assertEqual((product.reviews_count, product.sum_rating), (2, 5))
+
+
+class ProductCursorPaginationTestCase(TestCase):
+    def setUp(self):
+        user = CustomUser.objects.create_user(
+            email="vendor@example.com",
+            username="vendor",
+            first_name="vendor",
+            last_name="doe",
+        )
+        category = Category.objects.create(name="cat1", slug="cat1")
+        vendor = Vendor.objects.create(
+            name="ven1",
+            user=user,
+            description="lorem",
+            email="ven1@example.com",
+            address="lorem",
+            phone_number="0000000000",
+        )
+        for i in range(7):
+            Product.objects.create(
+                name=f"product{i}",
+                slug=f"product{i}",
+                description="lorem",
+                price=Decimal("20.0") + i % 3,
+                stock=2,
+                status=Product.Status.ACTIVE,
+                category=category,
+                vendor=vendor,
+            )
+        # products sharing a creation time must still be paginated exactly once
+        Product.objects.filter(slug__in=["product2", "product3", "product4"]).update(
+            created_at=Product.objects.get(slug="product2").created_at
+        )
+
+    def collect_pages(self, url):
+        slugs, previous_links = [], []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("count", response.data)
+            slugs.append([product["slug"] for product in response.data["results"]])
+            previous_links.append(response.data["previous"])
+            url = response.data["next"]
+        return slugs, previous_links
+
+    def test_cursor_pages_match_ordering(self):
+        for sort in ["-created_at", "price", "-price"]:
+            expected = list(
+                Product.objects.order_by(
+                    sort, "-pk" if "-" in sort else "pk"
+                ).values_list("slug", flat=True)
+            )
+            pages, previous_links = self.collect_pages(
+                f"/api/products/?cursor=&limit=3&sort={sort}"
+            )
+            self.assertEqual([slug for page in pages for slug in page], expected)
+            self.assertEqual([len(page) for page in pages], [3, 3, 1])
+
+            # walking back from the last page returns the same pages
+            response = self.client.get(previous_links[-1])
+            self.assertEqual(
+                [product["slug"] for product in response.data["results"]], pages[1]
+            )
+
+    def test_seek_filter_bounds_the_leading_ordering_field(self):
+        boundary = Product.objects.get(slug="product3")
+        position = {"created_at": str(boundary.created_at), "id": str(boundary.pk)}
+        seek_filter = CustomCursorPagination().get_seek_filter(
+            ["-created_at", "-id"], position
+        )
+        queryset = Product.objects.filter(seek_filter)
+        # the redundant bound lets PostgreSQL seek into the composite index
+        self.assertIn('"created_at" <=', str(queryset.query))
+        self.assertQuerySetEqual(
+            queryset.order_by("-created_at", "-id"),
+            Product.objects.order_by("-created_at", "-id").filter(
+                Q(created_at__lt=boundary.created_at)
+                | Q(created_at=boundary.created_at, pk__lt=boundary.pk)
+            ),
+        )
+
+    def test_limit_offset_without_cursor(self):
+        response = self.client.get("/api/products/?limit=3")
+        self.assertEqual(response.data["count"], 7)
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/api/products/?cursor=bogus")
+        self.assertEqual(response.status_code, 404)
+
+
+class EstimatedCountPaginationTestCase(TestCase):
+    def setUp(self):
+        user = CustomUser.objects.create_user(
+            email="vendor@example.com",
+            username="vendor",
+            first_name="vendor",
+            last_name="doe",
+        )
+        category = Category.objects.create(name="cat1", slug="cat1")
+        vendor = Vendor.objects.create(
+            name="ven1",
+            user=user,
+            description="lorem",
+            email="ven1@example.com",
+            address="lorem",
+            phone_number="0000000000",
+        )
+        for i in range(5):
+            Product.objects.create(
+                name=f"product{i}",
+                slug=f"product{i}",
+                description="lorem",
+                price=Decimal("20.0"),
+                stock=2,
+                category=category,
+                vendor=vendor,
+            )
+
+    def paginate(self, query, threshold):
+        paginator = EstimatedCountLimitOffsetPagination()
+        paginator.estimate_count_threshold = threshold
+        request = Request(APIRequestFactory().get(f"/api/products/?{query}"))
+        page = paginator.paginate_queryset(Product.objects.order_by("pk"), request)
+        return page, paginator.get_paginated_response(page).data
+
+    def test_estimated_count(self):
+        page, data = self.paginate("limit=2", threshold=0)
+        self.assertEqual(len(page), 2)
+        self.assertTrue(data["count_is_estimated"])
+        self.assertIsNotNone(data["next"])
+
+        # the estimate never hides rows that exist
+        page, data = self.paginate("limit=2&offset=2", threshold=0)
+        self.assertGreaterEqual(data["count"], 5)
+        self.assertIsNotNone(data["next"])
+
+    def test_last_page_count_is_exact(self):
+        page, data = self.paginate("limit=2&offset=4", threshold=0)
+        self.assertEqual(len(page), 1)
+        self.assertEqual(data["count"], 5)
+        self.assertFalse(data["count_is_estimated"])
+        self.assertIsNone(data["next"])
+
+    def test_exact_count_below_threshold(self):
+        page, data = self.paginate("limit=2", threshold=ESTIMATED_COUNT_THRESHOLD)
+        self.assertEqual(data["count"], 5)
+        self.assertFalse(data["count_is_estimated"])
+
+    def test_get_estimated_count(self):
+        self.assertIsInstance(get_estimated_count(Product.objects.all()), int)
+        self.assertIsInstance(
+            get_estimated_count(Product.objects.filter(stock__gt=1)), int
+        )
+
+
+class ProductSearchTestCase(TestCase):
+    def setUp(self):
+        user = CustomUser.objects.create_user(
+            email="vendor@example.com",
+            username="vendor",
+            first_name="vendor",
+            last_name="doe",
+        )
+        self.shoes = Category.objects.create(name="Shoes", slug="shoes")
+        hats = Category.objects.create(name="Hats", slug="hats")
+        vendor = Vendor.objects.create(
+            name="ven1",
+            user=user,
+            description="lorem",
+            email="ven1@example.com",
+            address="lorem",
+            phone_number="0000000000",
+        )
+        products = [
+            ("Trail runner", "Light shoes for running on trails", self.shoes),
+            ("Running cap", "A breathable cap", hats),
+            ("Woolly hat", "Keeps you warm", hats),
+        ]
+        for name, description, category in products:
+            Product.objects.create(
+                name=name,
+                description=description,
+                price=Decimal("20.0"),
+                stock=2,
+                status=Product.Status.ACTIVE,
+                category=category,
+                vendor=vendor,
+            )
+
+    def search(self, terms):
+        response = self.client.get("/api/products/", {"q": terms})
+        self.assertEqual(response.status_code, 200)
+        return [product["name"] for product in response.data["results"]]
+
+    def test_search_is_ranked_by_relevance(self):
+        # a match in the name ranks above a match in the description
+        self.assertEqual(self.search("running"), ["Running cap", "Trail runner"])
+        self.assertEqual(self.search("warm"), ["Woolly hat"])
+
+    def test_search_matches_category_name(self):
+        self.assertEqual(self.search("hats"), ["Woolly hat", "Running cap"])
+
+        self.shoes.name = "Footwear"
+        self.shoes.save()
+        self.assertEqual(self.search("footwear"), ["Trail runner"])
+
+    def test_search_tolerates_typos(self):
+        if not has_trigram_extension("default"):
+            self.skipTest("pg_trgm is not installed.")
+        self.assertIn("Woolly hat", self.search("wooly hat"))
+
+
+class ProductCategoryFilterTestCase(TestCase):
+    def setUp(self):
+        user = CustomUser.objects.create_user(
+            email="vendor@example.com",
+            username="vendor",
+            first_name="vendor",
+            last_name="doe",
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shoes = Category.objects.create(name="Shoes", slug="shoes")
+            self.snowshoes = Category.objects.create(name="Snowshoes", slug="snowshoes")
+        vendor = Vendor.objects.create(
+            name="ven1",
+            user=user,
+            description="lorem",
+            email="ven1@example.com",
+            address="lorem",
+            phone_number="0000000000",
+        )
+        for name, category in [("Runner", self.shoes), ("Racket", self.snowshoes)]:
+            Product.objects.create(
+                name=name,
+                description="lorem",
+                price=Decimal("20.0"),
+                stock=2,
+                status=Product.Status.ACTIVE,
+                category=category,
+                vendor=vendor,
+            )
+
+    def filter(self, category):
+        response = self.client.get("/api/products/", {"category": category})
+        self.assertEqual(response.status_code, 200)
+        return [product["name"] for product in response.data["results"]]
+
+    def test_filter_by_slug_or_id(self):
+        self.assertEqual(self.filter("shoes"), ["Runner"])
+        self.assertEqual(self.filter(str(self.snowshoes.pk)), ["Racket"])
+        self.assertEqual(self.filter("sho"), [])
+        self.assertEqual(self.filter("unknown"), [])
+
+    def test_non_ascii_digits_are_not_ids(self):
+        self.assertEqual(self.filter("\u00b2"), [])
+        self.assertEqual(self.filter("\u0661"), [])
+
+    def test_all_digit_slug_is_matched_before_ids(self):
+        self.shoes.slug = str(self.snowshoes.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shoes.save()
+        self.assertEqual(self.filter(str(self.snowshoes.pk)), ["Runner"])
+
+    def test_slug_resolution_is_cached(self):
+        self.filter("shoes")
+        with self.assertNumQueries(0):
+            self.assertEqual(get_category_id("shoes"), self.shoes.pk)
+
+    def test_renamed_slug(self):
+        self.assertEqual(self.filter("shoes"), ["Runner"])
+        self.shoes.slug = "sneakers"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shoes.save()
+        self.assertEqual(self.filter("shoes"), [])
+        self.assertEqual(self.filter("sneakers"), ["Runner"])
+
+
+class ResponseCacheTestCase(TestCase):
+    def setUp(self):
+        get_response_cache().clear()
+        self.admin = CustomUser.objects.create_superuser(
+            email="admin@example.com",
+            username="admin",
+            first_name="admin",
+            last_name="doe",
+        )
+        user = CustomUser.objects.create_user(
+            email="vendor@example.com",
+            username="vendor",
+            first_name="vendor",
+            last_name="doe",
+        )
+        self.category = Category.objects.create(name="cat1", slug="cat1")
+        vendor = Vendor.objects.create(
+            name="ven1",
+            user=user,
+            description="lorem",
+            email="ven1@example.com",
+            address="lorem",
+            phone_number="0000000000",
+        )
+        self.product = Product.objects.create(
+            name="product1",
+            slug="product1",
+            description="lorem",
+            price=Decimal("20.0"),
+            stock=2,
+            status=Product.Status.ACTIVE,
+            category=self.category,
+            vendor=vendor,
+        )
+
+    def test_repeated_requests_are_served_from_cache(self):
+        response = self.client.get("/api/products/", {"limit": 5, "offset": 0})
+        self.assertEqual(response["X-Cache"], "MISS")
+        with self.assertNumQueries(0):
+            # the order of the query parameters doesn't matter
+            cached = self.client.get("/api/products/", {"offset": 0, "limit": 5})
+        self.assertEqual(cached["X-Cache"], "HIT")
+        self.assertEqual(cached.json(), response.json())
+
+    def test_changes_invalidate_cached_responses(self):
+        self.client.get("/api/products/product1/")
+        self.category.name = "renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.save()
+        response = self.client.get("/api/products/product1/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()["category"]["name"], "renamed")
+
+        self.product.price = Decimal("30.0")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        response = self.client.get("/api/products/product1/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()["price"], "30.00")
+
+    def test_generations_are_bumped_after_commit(self):
+        generation = get_generations(["product"])["product"]
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.product.price = Decimal("30.0")
+            self.product.save()
+            self.assertEqual(get_generations(["product"])["product"], generation)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_generations(["product"])["product"], generation)
+
+    def test_admin_responses_are_cached_separately(self):
+        self.client.get("/api/products/product1/")
+        self.client.force_login(self.admin)
+        response = self.client.get("/api/products/product1/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()["status"], "Active")
+
+        response = self.client.get("/api/cache/stats/")
+        stats = {view["view"]: view for view in response.json()["views"]}
+        self.assertEqual(stats["ProductDetailView"]["misses"], 2)
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        get_response_cache().clear()
+        self.user = CustomUser.objects.create_user(
+            email="vendor@example.com",
+            username="vendor",
+            first_name="vendor",
+            last_name="doe",
+        )
+        self.category = Category.objects.create(name="cat1", slug="cat1")
+        vendor = Vendor.objects.create(
+            name="ven1",
+            user=self.user,
+            description="lorem",
+            email="ven1@example.com",
+            address="lorem",
+            phone_number="0000000000",
+        )
+        self.product = Product.objects.create(
+            name="product1",
+            slug="product1",
+            description="lorem",
+            price=Decimal("20.0"),
+            stock=2,
+            status=Product.Status.ACTIVE,
+            category=self.category,
+            vendor=vendor,
+        )
+        self.draft = Product.objects.create(
+            name="product2",
+            slug="product2",
+            description="lorem",
+            price=Decimal("20.0"),
+            stock=2,
+            status=Product.Status.DRAFT,
+            category=self.category,
+            vendor=vendor,
+        )
+
+    def test_unchanged_product_is_not_modified(self):
+        response = self.client.get("/api/products/product1/")
+        self.assertFalse(response["ETag"].startswith("W/"))
+        self.assertIn("Last-Modified", response)
+
+        get_response_cache().clear()
+        # answered from the pre-query, without loading the product
+        with self.assertNumQueries(1):
+            not_modified = self.client.get(
+                "/api/products/product1/", HTTP_IF_NONE_MATCH=response["ETag"]
+            )
+        self.assertEqual(not_modified.status_code, 304)
+
+        # a cached response is revalidated with the cached validators
+        self.client.get("/api/products/product1/")
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(
+                "/api/products/product1/", HTTP_IF_NONE_MATCH=response["ETag"]
+            )
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_new_review_changes_product_etag(self):
+        etag = self.client.get("/api/products/product1/")["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(product=self.product, user=self.user, rating=4)
+        response = self.client.get("/api/products/product1/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json()["total_reviews"], 1)
+
+    def test_hidden_product_is_never_not_modified(self):
+        self.client.force_login(self.user)
+        etag = self.client.get("/api/products/product2/")["ETag"]
+        self.client.logout()
+        response = self.client.get("/api/products/product2/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
+
+    def test_list_etag_changes_with_rows(self):
+        response = self.client.get("/api/products/")
+        etag = response["ETag"]
+        self.assertTrue(etag.startswith("W/"))
+        self.assertNotIn("Last-Modified", response)
+        self.assertEqual(
+            self.client.get("/api/products/", HTTP_IF_NONE_MATCH=etag).status_code,
+            304,
+        )
+
+        self.draft.status = Product.Status.ACTIVE
+        with self.captureOnCommitCallbacks(execute=True):
+            self.draft.save()
+        response = self.client.get("/api/products/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["count"], 2)
+
+    def test_list_etag_changes_with_removed_rows(self):
+        self.draft.status = Product.Status.ACTIVE
+        with self.captureOnCommitCallbacks(execute=True):
+            self.draft.save()
+        etag = self.client.get("/api/products/")["ETag"]
+
+        # removing a row that isn't the latest one leaves every timestamp as is
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+        response = self.client.get("/api/products/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_category_detail_is_not_modified(self):
+        etag = self.client.get("/api/categories/cat1/")["ETag"]
+        response = self.client.get("/api/categories/cat1/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+class ProductSerializerReadPlanTestCase(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name="cat1", slug="cat1")
+        user = CustomUser.objects.create_user(
+            email="vendor@example.com",
+            username="vendor",
+            first_name="vendor",
+            last_name="doe",
+        )
+        self.vendor = Vendor.objects.create(
+            name="ven1",
+            user=user,
+            description="lorem",
+            email="ven1@example.com",
+            address="lorem",
+            phone_number="0000000000",
+            status=Vendor.Status.ACTIVE,
+        )
+        self.product = Product.objects.create(
+            name="product1",
+            slug="product1",
+            description="lorem",
+            price=Decimal("20.0"),
+            discount_price=Decimal("15.0"),
+            stock=2,
+            status=Product.Status.ACTIVE,
+            category=self.category,
+            vendor=self.vendor,
+        )
+
+    def get_context(self, user):
+        request = Request(APIRequestFactory().get("/api/products/"))
+        request.user = user
+        return {"request": request}
+
+    def test_benchmark_output_matches_generic_serializer(self):
+        # the command fails if the read plan and generic outputs differ
+        out = StringIO()
+        call_command("benchmark_product_serializer", rows=3, repeat=1, stdout=out)
+        self.assertIn("faster", out.getvalue())
+
+    def test_representation(self):
+        product = Product.objects.reviews_annotations().get(pk=self.product.pk)
+        data = ProductSerializer(
+            product, context=self.get_context(AnonymousUser())
+        ).data
+        self.assertNotIn("status", data)
+        self.assertEqual(data["price"], "20.00")
+        self.assertEqual(data["discount_percentage"], Decimal("25.00"))
+        self.assertEqual(
+            data["category"], {"id": self.category.id, "name": "cat1", "slug": "cat1"}
+        )
+        self.assertEqual(
+            data["vendor"], {"id": self.vendor.id, "name": "ven1", "status": "Active"}
+        )
+        self.assertEqual(data["total_reviews"], 0)
+
+        admin = CustomUser(role=UserRole.ADMINISTRATOR)
+        data = ProductSerializer(product, context=self.get_context(admin)).data
+        self.assertEqual(data["status"], "Active")
+
+    def test_missing_annotations_are_skipped(self):
+        data = ProductSerializer(
+            self.product, context=self.get_context(AnonymousUser())
+        ).data
+        self.assertNotIn("rating", data)
+        self.assertNotIn("total_reviews", data)
+
+
+class SparseFieldsTestCase(TestCase):
+    def setUp(self):
+        get_response_cache().clear()
+        self.user = CustomUser.objects.create_user(
+            email="vendor@example.com",
+            username="vendor",
+            first_name="vendor",
+            last_name="doe",
+        )
+        category = Category.objects.create(name="cat1", slug="cat1")
+        vendor = Vendor.objects.create(
+            name="ven1",
+            user=self.user,
+            description="lorem",
+            email="ven1@example.com",
+            address="lorem",
+            phone_number="0000000000",
+            status=Vendor.Status.ACTIVE,
+        )
+        self.product = Product.objects.create(
+            name="product1",
+            slug="product1",
+            description="lorem",
+            price=Decimal("20.0"),
+            discount_price=Decimal("15.0"),
+            stock=2,
+            status=Product.Status.ACTIVE,
+            category=category,
+            vendor=vendor,
+        )
+        self.draft = Product.objects.create(
+            name="product2",
+            slug="product2",
+            description="lorem",
+            price=Decimal("20.0"),
+            stock=2,
+            status=Product.Status.DRAFT,
+            category=category,
+            vendor=vendor,
+        )
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        # the query of the serialized rows follows the conditional pre-query
+        return response, queries[-1]["sql"]
+
+    def test_selected_fields_trim_the_select(self):
+        response, sql = self.get("/api/products/?fields=id,name,has_discount")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()["results"],
+            [{"id": self.product.id, "name": "product1", "has_discount": True}],
+        )
+        self.assertNotIn('"description"', sql)
+        self.assertNotIn("active_rating_avg", sql)
+        self.assertNotIn('JOIN "products_category"', sql)
+
+        response, sql = self.get("/api/products/?fields=name,category,rating")
+        self.assertEqual(
+            response.json()["results"],
+            [
+                {
+                    "name": "product1",
+                    "category": {
+                        "id": self.product.category_id,
+                        "name": "cat1",
+                        "slug": "cat1",
+                    },
+                    "rating": 0.0,
+                }
+            ],
+        )
+        self.assertIn('JOIN "products_category"', sql)
+        self.assertIn("active_rating_avg", sql)
+        self.assertNotIn('JOIN "vendors_vendor"', sql)
+
+    def test_sorting_on_unselected_review_fields(self):
+        response = self.client.get(
+            "/api/products/?fields=name&sort=-avg_rating&cursor="
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"], [{"name": "product1"}])
+
+    def test_unknown_fields(self):
+        response = self.client.get("/api/products/?fields=name,secret")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"fields": ["Unknown field(s): secret."]})
+
+    def test_detail_view_checks_status_of_trimmed_object(self):
+        response, sql = self.get("/api/products/product1/?fields=name")
+        self.assertEqual(response.json(), {"name": "product1"})
+        self.assertNotIn('"description"', sql)
+        self.assertEqual(
+            self.client.get("/api/products/product2/?fields=name").status_code, 404
+        )
+
+        self.client.force_login(self.user)
+        response = self.client.get("/api/products/product2/?fields=name")
+        self.assertEqual(response.json(), {"name": "product2"})
+
+    def test_etag_varies_with_fields(self):
+        first = self.client.get("/api/products/product1/?fields=name")
+        second = self.client.get("/api/products/product1/?fields=slug")
+        self.assertNotEqual(first["ETag"], second["ETag"])
+
+    def test_include_adds_to_default_fields(self):
+        self.client.force_login(self.user)
+        url = f"/api/vendors/{self.product.vendor_id}/products/"
+        response = self.client.get(url)
+        self.assertNotIn("created_at", response.json()["results"][0])
+        response = self.client.get(f"{url}?include=created_at")
+        self.assertIn("created_at", response.json()["results"][0])
+        self.assertIn("description", response.json()["results"][0])
+
+
+class QueryPlanTestCase(TestCase):
+    def setUp(self):
+        get_response_cache().clear()
+        self.user = CustomUser.objects.create_user(
+            email="customer@example.com",
+            username="customer",
+            first_name="customer",
+            last_name="doe",
+        )
+        category = Category.objects.create(name="cat1", slug="cat1")
+        self.vendor = Vendor.objects.create(
+            name="ven1",
+            user=self.user,
+            description="lorem",
+            email="ven1@example.com",
+            address="lorem",
+            phone_number="0000000000",
+            status=Vendor.Status.ACTIVE,
+        )
+        self.products = [
+            Product.objects.create(
+                name=f"product{i}",
+                slug=f"product{i}",
+                description="lorem",
+                price=Decimal("20.0"),
+                stock=2,
+                status=Product.Status.ACTIVE,
+                category=category,
+                vendor=self.vendor,
+            )
+            for i in range(3)
+        ]
+
+    def test_review_serializer_plan(self):
+        request = Request(APIRequestFactory().get("/"))
+        request.user = AnonymousUser()
+        serializer = ReviewSerializer(context={"request": request})
+        plan = QueryPlan(Review)
+        for lookup in get_serializer_lookups(serializer, Review):
+            plan.add(lookup)
+        self.assertEqual(plan.get_select_related(), ["product", "user"])
+        self.assertEqual(plan.get_prefetches(), [])
+        self.assertEqual(
+            plan.get_only(),
+            [
+                "comment",
+                "created_at",
+                "id",
+                "is_active",
+                "product",
+                "rating",
+                "updated_at",
+                "user",
+                "product__id",
+                "product__name",
+                "product__slug",
+                "user__first_name",
+                "user__id",
+                "user__last_name",
+            ],
+        )
+
+    def test_nested_serializers_query_once(self):
+        for product in self.products:
+            Review.objects.create(product=product, user=self.user, rating=4)
+        self.client.force_login(self.user)
+        # the session, the user, the count and the reviews joined with their
+        # products and users
+        with self.assertNumQueries(4):
+            response = self.client.get("/api/products/product0/reviews/")
+        self.assertEqual(
+            response.json()["results"][0]["user"],
+            {"id": self.user.id, "first_name": "customer", "last_name": "doe"},
+        )
+
+        # the session, the user, the count and the reviews with their products
+        with self.assertNumQueries(4):
+            response = self.client.get("/api/users/me/reviews/")
+        self.assertEqual(len(response.json()["results"]), 3)
+
+
+class QueryBudgetTestCase(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="customer@example.com",
+            username="customer",
+            first_name="customer",
+            last_name="doe",
+        )
+        self.category = Category.objects.create(name="cat1", slug="cat1")
+        self.vendor = Vendor.objects.create(
+            name="ven1",
+            user=self.user,
+            description="lorem",
+            email="ven1@example.com",
+            address="lorem",
+            phone_number="0000000000",
+            status=Vendor.Status.ACTIVE,
+        )
+        self.product = self.create_products(1)[0]
+
+    def create_products(self, count):
+        start = Product.objects.count()
+        return Product.objects.bulk_create(
+            Product(
+                name=f"product{i}",
+                slug=f"product{i}",
+                description="lorem",
+                price=Decimal("20.0"),
+                stock=2,
+                status=Product.Status.ACTIVE,
+                category=self.category,
+                vendor=self.vendor,
+            )
+            for i in range(start, start + count)
+        )
+
+    def create_reviews(self, count):
+        users = CustomUser.objects.bulk_create(
+            CustomUser(email=f"reviewer{i}@example.com", username=f"reviewer{i}")
+            for i in range(
+                CustomUser.objects.count(), CustomUser.objects.count() + count
+            )
+        )
+        Review.objects.bulk_create(
+            Review(product=self.product, user=user, rating=4) for user in users
+        )
+
+    def test_product_list(self):
+        self.assertQueryBudget("/api/products/?limit=50", self.create_products)
+        self.assertQueryBudget(
+            f"/api/vendors/{self.vendor.id}/products/?limit=50",
+            self.create_products,
+            user=self.user,
+            sizes=(101, 110),
+        )
+
+    def test_product_reviews(self):
+        self.assertQueryBudget(
+            "/api/products/product0/reviews/?limit=50",
+            self.create_reviews,
+            user=self.user,
+        )
+        self.assertQueryBudget(
+            "/api/users/me/reviews/?limit=50",
+            lambda count: Review.objects.bulk_create(
+                Review(product=product, user=self.user, rating=4)
+                for product in self.create_products(count)
+            ),
+            user=self.user,
+        )
+
+    def test_repeated_queries_are_traced_to_serializer_fields(self):
+        self.create_reviews(3)
+        request = Request(APIRequestFactory().get("/"))
+        request.user = self.user
+        # without the planned query, the product of every review is loaded on its own
+        with QueryRecorder(trace_fields=True) as recorder:
+            ReviewSerializer(
+                Review.objects.select_related("user"),
+                many=True,
+                context={"request": request},
+            ).data
+        self.assertEqual(recorder.count, 4)
+        [(fingerprint, count, field)] = recorder.get_repeated()
+        self.assertEqual(count, 3)
+        self.assertEqual(field, "ReviewSerializer.product")
+        self.assertIn('FROM "products_product"', fingerprint)
+
+    def test_inspection_middleware_logs_budget_overruns(self):
+        middleware = [*settings.MIDDLEWARE, "config.queries.QueryInspectionMiddleware"]
+        with (
+            self.settings(MIDDLEWARE=middleware),
+            mock.patch.object(ProductListView, "query_budget", 1),
+            self.assertLogs("config.queries", "WARNING") as logs,
+        ):
+            self.client.get("/api/products/")
+        self.assertIn(
+            "GET /api/products/: 2 queries over the budget of 1", logs.output[0]
+        )
+
+
+class SeedDataTestCase(TestCase):
+    volumes = {
+        "categories": 5,
+        "vendors": 4,
+        "users": 30,
+        "products": 40,
+        "max_reviews": 10,
+        "carts": 5,
+        "batch_size": 7,
+    }
+
+    def seed(self, seed):
+        call_command("seed_data", seed=seed, **self.volumes, stdout=StringIO())
+        return {
+            "products": list(
+                Product.objects.order_by("slug").values_list(
+                    "slug",
+                    "price",
+                    "discount_price",
+                    "stock",
+                    "status",
+                    "category__name",
+                    "vendor__name",
+                    "created_at",
+                    "updated_at",
+                    "all_reviews_count",
+                    "reviews_updated_at",
+                    "reserved_stock",
+                )
+            ),
+            "reviews": list(
+                Review.objects.order_by("product__slug", "user__email").values_list(
+                    "product__slug", "user__email", "rating", "is_active", "created_at"
+                )
+            ),
+            "carts": list(
+                Cart.objects.order_by("user__email").values_list(
+                    "user__email", "created_at"
+                )
+            ),
+            "cart_items": list(
+                CartItem.objects.order_by(
+                    "cart__user__email", "product__slug"
+                ).values_list(
+                    "cart__user__email",
+                    "product__slug",
+                    "quantity",
+                    "date_added",
+                )
+            ),
+        }
+
+    def unseed(self):
+        Product.objects.all().delete()
+        Category.objects.all().delete()
+        CustomUser.objects.all().delete()
+
+    def test_seed_data(self):
+        data = self.seed(1)
+        self.assertEqual(len(data["products"]), 40)
+        self.assertEqual(Vendor.objects.count(), 4)
+        self.assertEqual(CustomUser.objects.filter(role=UserRole.VENDOR).count(), 4)
+        self.assertEqual(Cart.objects.count(), 34)
+        self.assertEqual(Cart.objects.filter(items__isnull=False).distinct().count(), 5)
+        self.assertEqual(StockReservation.objects.count(), len(data["cart_items"]))
+        # the reservations are held from the time of the run
+        now = timezone.now()
+        self.assertFalse(StockReservation.objects.filter(expires_at__lte=now).exists())
+        self.assertFalse(
+            StockReservation.objects.filter(
+                expires_at__gt=now + settings.CART_RESERVATION_TTL
+            ).exists()
+        )
+        self.assertTrue(Product.objects.filter(search_vector__isnull=False).exists())
+        self.assertEqual(
+            sum(product[9] for product in data["products"]), len(data["reviews"])
+        )
+        # the timestamps of the seeded rows are explicit, the others still aren't
+        category = Category.objects.create(name="new", slug="new")
+        self.assertGreater(category.created_at, timezone.now() - timedelta(minutes=1))
+        # seeded users can log in
+        response = self.client.post(
+            "/api/token/",
+            {"email": "customer1@seed.example.com", "password": "seed-password"},
+        )
+        self.assertEqual(response.status_code, 200)
+
+        self.unseed()
+        self.assertEqual(self.seed(1), data)
+        self.unseed()
+        self.assertNotEqual(self.seed(2)["products"], data["products"])
+
+
+class BenchmarkEndpointsTestCase(TestCase):
+    def setUp(self):
+        get_response_cache().clear()
+        call_command(
+            "seed_data",
+            categories=2,
+            vendors=2,
+            users=5,
+            products=10,
+            max_reviews=3,
+            carts=2,
+            stdout=StringIO(),
+        )
+
+    def benchmark(self, **options):
+        options = {"requests": 2, "warmup": 1, "traced_requests": 1, **options}
+        call_command(
+            "benchmark_endpoints", **options, stdout=StringIO(), stderr=StringIO()
+        )
+
+    def test_benchmark_endpoints(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "results.json")
+            items = list(CartItem.objects.values_list("pk", "quantity"))
+            self.benchmark(output=path)
+            with open(path) as file:
+                results = json.load(file)
+            self.assertEqual(
+                list(results["endpoints"]),
+                [
+                    "product_list",
+                    "product_search",
+                    "product_filter",
+                    "product_detail",
+                    "product_reviews",
+                    "user_cart",
+                    "add_to_cart",
+                    "login",
+                ],
+            )
+            self.assertEqual(
+                set(results["endpoints"]["user_cart"]),
+                {
+                    "requests",
+                    "requests_per_s",
+                    "mean_ms",
+                    "p50_ms",
+                    "p95_ms",
+                    "p99_ms",
+                    "queries",
+                    "allocated_kib",
+                },
+            )
+            # the products added to the cart are rolled back after each request
+            self.assertEqual(
+                list(CartItem.objects.values_list("pk", "quantity")), items
+            )
+            # the responses cached by the benchmark are deleted
+            response = self.client.get("/api/products/")
+            self.assertEqual(response["X-Cache"], "MISS")
+
+            # a query more than the baseline is a regression
+            results["meta"]["cold"] = True
+            results["endpoints"]["product_detail"]["queries"] = 0
+            with open(path, "w") as file:
+                json.dump(results, file)
+            with self.assertRaisesMessage(CommandError, "1 regression(s)"):
+                self.benchmark(
+                    cold=True,
+                    endpoints=["product_detail"],
+                    baseline=path,
+                    tolerance=100,
+                )
+
+    def test_entries_of_the_site_are_kept(self):
+        caches["default"].set("site-entry", 1)
+        self.client.get("/api/products/")
+        self.benchmark(cold=True, endpoints=["product_list", "user_cart"])
+        self.assertEqual(caches["default"].get("site-entry"), 1)
+        self.assertEqual(self.client.get("/api/products/")["X-Cache"], "HIT")
+
+    @override_settings(ALLOWED_HOSTS=["api.example.com"])
+    def test_requests_use_an_allowed_host(self):
+        self.benchmark(endpoints=["product_list"])
+
+
+class ServerTimingTestCase(TestCase):
+    def setUp(self):
+        get_response_cache().clear()
+        user = CustomUser.objects.create_user(
+            email="vendor@example.com",
+            username="vendor",
+            first_name="vendor",
+            last_name="doe",
+            role=UserRole.VENDOR,
+        )
+        vendor = Vendor.objects.create(
+            name="Vendor",
+            user=user,
+            description="Vendor",
+            email="vendor@example.com",
+            address="Kathmandu",
+            phone_number="9800000000",
+        )
+        category = Category.objects.create(name="Shoes")
+        Product.objects.create(
+            name="Running shoes",
+            description="Shoes",
+            price=Decimal("100.00"),
+            stock=10,
+            status=Product.Status.ACTIVE,
+            category=category,
+            vendor=vendor,
+        )
+
+    def get_metrics(self, response):
+        metrics = {}
+        for metric in response["Server-Timing"].split(", "):
+            name, *params = metric.split(";")
+            metrics[name] = dict(param.split("=", 1) for param in params)
+        return metrics
+
+    @override_settings(DEBUG=True)
+    def test_phases(self):
+        with self.assertLogs("config.telemetry", "INFO") as logs:
+            response = self.client.get("/api/products/")
+        self.assertEqual(response.status_code, 200)
+        metrics = self.get_metrics(response)
+        self.assertEqual(
+            list(metrics), ["auth", "perm", "db", "serialize", "render", "total"]
+        )
+        self.assertEqual(metrics["db"]["desc"], '"2 queries"')
+
+        [record] = logs.records
+        self.assertEqual(record.path, "/api/products/")
+        self.assertEqual(record.status, 200)
+        self.assertEqual(record.db_queries, 2)
+        self.assertEqual(record.duration_ms, float(metrics["total"]["dur"]))
+
+        data = json.loads(JSONFormatter().format(record))
+        self.assertEqual(data["logger"], "config.telemetry")
+        self.assertEqual(data["method"], "GET")
+        self.assertEqual(data["serialize_ms"], record.serialize_ms)
+
+    def test_header_is_only_sent_to_staff(self):
+        with self.assertLogs("config.telemetry", "INFO") as logs:
+            response = self.client.get("/api/products/")
+        self.assertNotIn("Server-Timing", response)
+        self.assertEqual(logs.records[0].db_queries, 2)
+
+        CustomUser.objects.create_user(
+            email="staff@example.com",
+            username="staff",
+            first_name="staff",
+            last_name="doe",
+            password="staff-password",
+            is_staff=True,
+        )
+        response = self.client.post(
+            "/api/token/",
+            {"email": "staff@example.com", "password": "staff-password"},
+        )
+        response = self.client.get(
+            "/api/products/",
+            HTTP_AUTHORIZATION=f"Bearer {response.json()['access']}",
+        )
+        self.assertIn("db;dur=", response["Server-Timing"])
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0)
+    def test_unsampled_requests(self):
+        response = self.client.get("/api/products/")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Server-Timing", response)
+
+    def test_nested_phases(self):
+        timing = RequestTiming()
+        with mock.patch("config.telemetry.time.perf_counter") as perf_counter:
+            perf_counter.side_effect = [1.0, 1.5, 2.0, 3.0]
+            with timing.phase("serialize"):
+                with timing.phase("perm"):
+                    pass
+        # the permission checks of the handler aren't counted as serialization
+        self.assertEqual(timing.durations["perm"], 0.5)
+        self.assertEqual(timing.durations["serialize"], 1.5)
+
+    def test_drf_isnt_patched(self):
+        self.client.get("/api/products/")
+        self.assertFalse(hasattr(APIView.perform_authentication, "__wrapped__"))
+        self.assertFalse(hasattr(BaseSerializer.data.fget, "__wrapped__"))
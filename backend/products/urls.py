@@ -8,6 +8,10 @@ urlpatterns = [
     path("products/", views.ProductListView.as_view()),
     path("products/status-choices/", views.ProductStatusChoicesView.as_view()),
     path("products/<slug:product_slug>/", views.ProductDetailView.as_view()),
+    path(
+        "products/<slug:product_slug>/availability/",
+        views.ProductAvailabilityView.as_view(),
+    ),
     path(
         "products/<slug:product_slug>/reviews/",
         views.ProductReviewListView.as_view(),
@@ -14,15 +14,23 @@ from rest_framework.permissions import SAFE_METHODS, AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from config.pagination import CustomLimitOffsetPagination
+from config.caching import CachedResponseMixin, ConditionalGetMixin
+from config.fields import SparseFieldsMixin
+from config.idempotency import idempotent
+from config.pagination import (
+    CursorOrEstimatedCountPagination,
+    CursorOrLimitOffsetPagination,
+)
+from config.telemetry import ServerTimingMixin
 from users.models import UserRole
 from users.permissions import IsAdmin, IsAdminOrReadOnly
 from vendors.permissions import IsVendor
 
-from .filters import ProductFilter
+from .filters import ProductFilter, ProductSearchFilter
 from .models import Category, Product, Review
 from .permissions import IsProductVendorOwnerOrReadOnly, IsReviewOwnerOrReadOnly
 from .serializers import (
+    PRODUCT_REVIEW_FIELDS,
     CategorySerializer,
     ProductSerializer,
     ReviewSerializer,
@@ -31,10 +39,26 @@ from .serializers import (
 
 logger = logging.getLogger(__name__)
 
+# fields versioning the serialized products, including the nested category
+# and vendor and the review aggregates
+PRODUCT_CONDITIONAL_FIELDS = (
+    "updated_at",
+    "reviews_updated_at",
+    "category__updated_at",
+    "vendor__updated_at",
+)
+
 
-class CategoryListView(ListCreateAPIView):
+class CategoryListView(
+    ServerTimingMixin,
+    SparseFieldsMixin,
+    CachedResponseMixin,
+    ConditionalGetMixin,
+    ListCreateAPIView,
+):
     """List all categories, or create a new category."""
 
+    cache_dependencies = ("category",)
     queryset = Category.objects.all()
     permission_classes = [IsAdminOrReadOnly]
     serializer_class = CategorySerializer
@@ -43,7 +67,12 @@ class CategoryListView(ListCreateAPIView):
     search_fields = ["name"]
 
 
-class CategoryDetailView(RetrieveUpdateDestroyAPIView):
+class CategoryDetailView(
+    ServerTimingMixin,
+    SparseFieldsMixin,
+    ConditionalGetMixin,
+    RetrieveUpdateDestroyAPIView,
+):
     """Retrieve, update or delete a category."""
 
     queryset = Category.objects.all()
@@ -56,26 +85,30 @@ class CategoryDetailView(RetrieveUpdateDestroyAPIView):
 from django_filters.rest_framework import DjangoFilterBackend
 
 
-class ProductListView(ListCreateAPIView):
+class ProductListView(
+    ServerTimingMixin,
+    SparseFieldsMixin,
+    CachedResponseMixin,
+    ConditionalGetMixin,
+    ListCreateAPIView,
+):
     """List all products, or create a new product."""
 
-    queryset = (
-        Product.objects.all()
-        .select_related("category", "vendor")
-        .order_by("-created_at")
-    )
+    query_budget = 2
+    cache_dependencies = ("product", "category", "review", "vendor")
+    queryset = Product.objects.all().order_by("-created_at")
     serializer_class = ProductSerializer
-    pagination_class = CustomLimitOffsetPagination
+    pagination_class = CursorOrLimitOffsetPagination
     parser_classes = [FormParser, MultiPartParser]
     filter_backends = [
-        filters.SearchFilter,
+        ProductSearchFilter,
         filters.OrderingFilter,
         DjangoFilterBackend,
     ]
     filterset_class = ProductFilter
     # filterset_fields = ['category']
-    ordering_fields = ["price", "stock", "created_at"]
-    search_fields = ["name"]
+    # `avg_rating` and `reviews_count` sort on the stored review aggregates
+    ordering_fields = ["price", "stock", "created_at", "avg_rating", "reviews_count"]
 
     def get_permissions(self):
         if self.request.method in SAFE_METHODS:
@@ -87,21 +120,32 @@ class ProductListView(ListCreateAPIView):
     def get_queryset(self):
         queryset = super().get_queryset()
         user = self.request.user
+        is_admin = user.is_authenticated and user.is_admin
 
-        if user.is_authenticated and user.is_admin:
-            # list all products for admin users
-            queryset = queryset.reviews_annotations(all_reviews=True)
-        else:
+        if not is_admin:
             # list only Active and Discontinued products for non-admin/anonymous users
             queryset = queryset.filter(
-                Q(status=Product.Status.ACTIVE) | Q(status=Product.Status.DISCONTINUED)
-            ).reviews_annotations(all_reviews=False)
+                status__in=[Product.Status.ACTIVE, Product.Status.DISCONTINUED]
+            )
+        if self.needs_review_annotations(queryset):
+            # admin users see the aggregates of all product reviews
+            queryset = queryset.reviews_annotations(all_reviews=is_admin)
 
         return queryset
 
+    def needs_review_annotations(self, queryset):
+        """Returns whether the review fields are serialized or sorted on."""
+        if self.is_field_selected(*PRODUCT_REVIEW_FIELDS):
+            return True
+        ordering = filters.OrderingFilter().get_ordering(self.request, queryset, self)
+        return any(
+            term.lstrip("-") in ("avg_rating", "reviews_count", "sum_rating")
+            for term in ordering or ()
+        )
+
 
 # TODO: cache the view
-class ProductStatusChoicesView(APIView):
+class ProductStatusChoicesView(ServerTimingMixin, APIView):
     """Retrieve status choices of a Product model."""
 
     def get(self, request, *args, **kwargs):
@@ -111,9 +155,45 @@ class ProductStatusChoicesView(APIView):
         return Response({"choices": status_choices})
 
 
-class ProductDetailView(RetrieveUpdateDestroyAPIView):
+class ProductAvailabilityView(ServerTimingMixin, APIView):
+    """
+    Retrieve the stock of a product that isn't held by carts. Not cached, as
+    it changes with every cart update.
+    """
+
+    def get(self, request, *args, **kwargs):
+        queryset = Product.objects.filter(slug=kwargs["product_slug"])
+        user = request.user
+        if not (user.is_authenticated and user.is_admin):
+            queryset = queryset.filter(
+                status__in=[Product.Status.ACTIVE, Product.Status.DISCONTINUED]
+            )
+        product = queryset.values("id", "stock", "reserved_stock").first()
+        if product is None:
+            raise NotFound
+        return Response(
+            {
+                "id": product["id"],
+                "stock": product["stock"],
+                "available": max(product["stock"] - product["reserved_stock"], 0),
+            }
+        )
+
+
+class ProductDetailView(
+    ServerTimingMixin,
+    SparseFieldsMixin,
+    CachedResponseMixin,
+    ConditionalGetMixin,
+    RetrieveUpdateDestroyAPIView,
+):
     """Retrieve, update or delete a product."""
 
+    query_budget = 2
+    cache_dependencies = ("product", "category", "review", "vendor")
+    conditional_fields = PRODUCT_CONDITIONAL_FIELDS
+    # read by `get_object`
+    required_lookups = ("status", "vendor__user__id")
     queryset = Product.objects.all().select_related("vendor__user")
     permission_classes = [IsProductVendorOwnerOrReadOnly | IsAdmin]
     serializer_class = ProductSerializer
@@ -127,6 +207,7 @@ class ProductDetailView(RetrieveUpdateDestroyAPIView):
 
         # check if the product is in Draft or Inactive status
         statuses = [Product.Status.DRAFT, Product.Status.INACTIVE]
+        self.object_is_public = obj.status not in statuses
         if obj.status in statuses:
             if user.is_anonymous:
                 raise NotFound
@@ -137,40 +218,40 @@ class ProductDetailView(RetrieveUpdateDestroyAPIView):
 
         return obj  # Allow access for other status products
 
+    def is_response_cacheable(self, response):
+        # Draft and Inactive products are served to their vendor owner, whatever
+        # the role of the owner, so their responses aren't shared
+        return super().is_response_cacheable(response) and self.object_is_public
+
+    def get_conditional_queryset(self):
+        queryset = super().get_conditional_queryset()
+        user = self.request.user
+        if user.is_authenticated and user.is_admin:
+            return queryset
+        # same rules as `get_object`, Draft and Inactive products are only
+        # visible to the vendor owner
+        visible = Q(status__in=[Product.Status.ACTIVE, Product.Status.DISCONTINUED])
+        if user.is_authenticated:
+            visible |= Q(vendor__user=user)
+        return queryset.filter(visible)
+
     def get_queryset(self):
         queryset = super().get_queryset()
         user = self.request.user
 
-        if user.is_authenticated and user.is_admin:
-            queryset = queryset.reviews_annotations(all_reviews=True)
-        else:
-            queryset = queryset.reviews_annotations(all_reviews=False)
+        if self.is_field_selected(*PRODUCT_REVIEW_FIELDS):
+            queryset = queryset.reviews_annotations(
+                all_reviews=user.is_authenticated and user.is_admin
+            )
         return queryset
 
 
-class ReviewListView(ListCreateAPIView):
+class ReviewListView(ServerTimingMixin, SparseFieldsMixin, ListCreateAPIView):
     """List all reviews, or create a new review."""
 
-    queryset = (
-        Review.objects.all()
-        .select_related("product", "user")
-        .only(
-            "id",
-            "product__id",
-            "product__name",
-            "product__slug",
-            "user__id",
-            "user__first_name",
-            "user__last_name",
-            "rating",
-            "comment",
-            "is_active",
-            "created_at",
-            "updated_at",
-        )
-    )
+    queryset = Review.objects.all().select_related("product", "user")
     filterset_fields = ["rating"]
-    pagination_class = CustomLimitOffsetPagination
+    pagination_class = CursorOrEstimatedCountPagination
 
     def get_permissions(self):
         if self.request.method in SAFE_METHODS:
@@ -179,6 +260,10 @@ class ReviewListView(ListCreateAPIView):
             permission_classes = [IsAuthenticated]
         return [permission() for permission in permission_classes]
 
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
     def get_serializer_class(self):
         if self.request.user.is_admin:
             return ReviewSerializer
@@ -191,30 +276,17 @@ class ReviewListView(ListCreateAPIView):
             serializer.save(user=self.request.user)
 
 
-class ReviewDetailView(RetrieveUpdateDestroyAPIView):
+class ReviewDetailView(
+    ServerTimingMixin, SparseFieldsMixin, RetrieveUpdateDestroyAPIView
+):
     """Retrieve, update or delete a review."""
 
-    queryset = (
-        Review.objects.all()
-        .select_related("product", "user")
-        .only(
-            "id",
-            "product__id",
-            "product__name",
-            "product__slug",
-            "user__id",
-            "user__first_name",
-            "user__last_name",
-            "rating",
-            "comment",
-            "is_active",
-            "created_at",
-            "updated_at",
-        )
-    )
+    queryset = Review.objects.all().select_related("product", "user")
     serializer_class = ReviewSerializer
     permission_classes = [IsReviewOwnerOrReadOnly | IsAdmin]
     lookup_url_kwarg = "review_id"
+    # read by `get_object`
+    required_lookups = ("is_active", "user__id")
 
     def get_object(self):
         obj = super().get_object()
@@ -234,11 +306,19 @@ class ReviewDetailView(RetrieveUpdateDestroyAPIView):
     # return UserReviewSerializer
 
 
-class ProductReviewListView(ListAPIView):
+class ProductReviewListView(
+    ServerTimingMixin,
+    SparseFieldsMixin,
+    CachedResponseMixin,
+    ConditionalGetMixin,
+    ListAPIView,
+):
     """List all reviews of a product."""
 
+    query_budget = 2
+    cache_dependencies = ("review", "product")
     serializer_class = ReviewSerializer
-    pagination_class = CustomLimitOffsetPagination
+    pagination_class = CursorOrLimitOffsetPagination
     # permission_classes = [AllowAny]
     filterset_fields = ["rating"]
 
@@ -251,17 +331,7 @@ class ProductReviewListView(ListAPIView):
         user = self.request.user
         product_slug = self.kwargs.get("product_slug")
 
-        queryset = Review.objects.select_related("product", "user").defer(
-            "product__description",
-            "product__image",
-            "user__role",
-            "user__password",
-            "user__is_superuser",
-            "user__last_login",
-            "user__is_staff",
-            "user__is_active",
-            "user__date_joined",
-        )
+        queryset = Review.objects.all()
 
         if user.is_authenticated:
             if user.is_admin:
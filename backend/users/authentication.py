@@ -0,0 +1,204 @@
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+from rest_framework.authentication import BasicAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .models import TokenRevocation
+
+# Cache alias holding the verified Basic credentials.
+BASIC_AUTH_CACHE_ALIAS = "default"
+# seconds the in-memory copy of the revocations is used before reloading it
+REVOCATIONS_REFRESH_INTERVAL = 5
+
+# user fields carried by the access tokens as claims, read by the permission
+# classes and the pagination limits
+USER_CLAIMS = ("role", "is_active", "is_staff", "is_superuser")
+
+
+class CachedBasicAuthentication(BasicAuthentication):
+    """
+    HTTP Basic authentication that caches successful credential verifications,
+    so clients sending the same credentials don't pay a password hash on every
+    request.
+
+    Entries are keyed on a keyed HMAC of the credentials, which never appear in
+    the cache, and hold the user id with the session auth hash of the user, an
+    HMAC of the password hash. Changing the password changes the session auth
+    hash, so entries of the old password stop matching. Entries expire after
+    BASIC_AUTH_CACHE_TTL.
+    """
+
+    key_salt = "users.authentication.CachedBasicAuthentication"
+
+    def get_cache_key(self, userid, password):
+        digest = salted_hmac(
+            self.key_salt, f"{userid}\0{password}", algorithm="sha256"
+        ).hexdigest()
+        return f"basic-auth:{digest}"
+
+    def authenticate_credentials(self, userid, password, request=None):
+        cache = caches[BASIC_AUTH_CACHE_ALIAS]
+        cache_key = self.get_cache_key(userid, password)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            user_id, auth_hash = cached
+            user = (
+                get_user_model()
+                ._default_manager.filter(pk=user_id, is_active=True)
+                .first()
+            )
+            if user is not None and constant_time_compare(
+                user.get_session_auth_hash(), auth_hash
+            ):
+                return (user, None)
+            cache.delete(cache_key)
+
+        user, auth = super().authenticate_credentials(userid, password, request)
+        cache.set(
+            cache_key,
+            (user.pk, user.get_session_auth_hash()),
+            settings.BASIC_AUTH_CACHE_TTL.total_seconds(),
+        )
+        return (user, auth)
+
+
+class PreciseIssuedAtMixin:
+    """
+    Sets the `iat` claim to the microsecond, like the revocations, so tokens
+    issued right after a revocation aren't taken for tokens issued before it.
+    """
+
+    def set_iat(self, claim="iat", at_time=None):
+        if at_time is None:
+            at_time = self.current_time
+        self.payload[claim] = at_time.timestamp()
+
+
+class AccessToken(PreciseIssuedAtMixin, tokens.AccessToken):
+    pass
+
+
+class RefreshToken(PreciseIssuedAtMixin, tokens.RefreshToken):
+    access_token_class = AccessToken
+
+
+def get_token_lifetime():
+    return max(jwt_settings.ACCESS_TOKEN_LIFETIME, jwt_settings.REFRESH_TOKEN_LIFETIME)
+
+
+class RevocationList:
+    """
+    Users whose tokens issued before a given time are revoked, as a
+    {user id: revoked at timestamp} dict. The revocations are stored in the
+    `TokenRevocation` table, shared by every process, and mirrored in memory
+    for REVOCATIONS_REFRESH_INTERVAL seconds, so checking a token doesn't
+    leave the process. Revocations are dropped once every token they revoke
+    has expired, which keeps the list short.
+    """
+
+    def __init__(self):
+        self.revocations = {}
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    def get_revocations(self):
+        now = time.monotonic()
+        if (
+            self.loaded_at is None
+            or now - self.loaded_at > REVOCATIONS_REFRESH_INTERVAL
+        ):
+            revocations = {
+                # keyed like the user id claim of the tokens
+                str(user_id): revoked_at.timestamp()
+                for user_id, revoked_at in TokenRevocation.objects.filter(
+                    revoked_at__gt=timezone.now() - get_token_lifetime()
+                ).values_list("user_id", "revoked_at")
+            }
+            with self.lock:
+                self.revocations, self.loaded_at = revocations, now
+        return self.revocations
+
+    def is_revoked(self, user_id, issued_at):
+        revoked_at = self.get_revocations().get(str(user_id))
+        return revoked_at is not None and (issued_at is None or issued_at < revoked_at)
+
+    def revoke(self, user_id):
+        """Revokes the tokens issued to the user until now."""
+        now = timezone.now()
+        TokenRevocation.objects.update_or_create(
+            user_id=user_id, defaults={"revoked_at": now}
+        )
+        TokenRevocation.objects.filter(
+            revoked_at__lte=now - get_token_lifetime()
+        ).delete()
+        transaction.on_commit(lambda: self.add(user_id, now.timestamp()))
+
+    def add(self, user_id, revoked_at):
+        with self.lock:
+            self.revocations = {**self.revocations, str(user_id): revoked_at}
+
+
+revocation_list = RevocationList()
+
+
+def get_claims_user(user_id, claims):
+    """
+    Returns a user built from the token claims, without a query. The fields
+    that aren't claims are deferred, and loaded all at once on first access.
+    """
+    User = get_user_model()
+    values = {
+        jwt_settings.USER_ID_FIELD: User._meta.get_field(
+            jwt_settings.USER_ID_FIELD
+        ).to_python(user_id),
+        **{claim: claims[claim] for claim in USER_CLAIMS},
+    }
+    # `from_db` takes the values in the order of the fields of the model
+    field_names = [
+        field.attname for field in User._meta.concrete_fields if field.attname in values
+    ]
+    user = User.from_db(
+        DEFAULT_DB_ALIAS, field_names, [values[name] for name in field_names]
+    )
+    user.is_claims_user = True
+    return user
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that builds the user from the claims of the access
+    token, so authenticated requests don't query the user. The role, active
+    and staff statuses are enough for the permission classes, pagination
+    limits and ownership comparisons; other user fields are loaded lazily.
+
+    Tokens issued before a revocation of their user are rejected, see
+    `revoke_user_tokens`. Tokens without the claims load the user as usual.
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(jwt_settings.USER_ID_CLAIM)
+        if user_id is not None and revocation_list.is_revoked(
+            user_id, validated_token.get("iat")
+        ):
+            raise AuthenticationFailed("Token has been revoked.", code="token_revoked")
+
+        if any(claim not in validated_token for claim in USER_CLAIMS):
+            return super().get_user(validated_token)
+        if not validated_token["is_active"]:
+            raise AuthenticationFailed("User is inactive.", code="user_inactive")
+        return get_claims_user(user_id, validated_token)
+
+
+def revoke_user_tokens(user_id):
+    """Rejects the tokens issued to the user until now."""
+    revocation_list.revoke(user_id)
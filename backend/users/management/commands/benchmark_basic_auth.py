@@ -0,0 +1,90 @@
+import base64
+import time
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.authentication import BasicAuthentication
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+
+from users.authentication import BASIC_AUTH_CACHE_ALIAS, CachedBasicAuthentication
+from users.models import CustomUser
+
+
+class RollBack(Exception):
+    pass
+
+
+def build_view(authentication_class):
+    class BenchmarkView(APIView):
+        authentication_classes = [authentication_class]
+        permission_classes = [IsAuthenticated]
+
+        def get(self, request, *args, **kwargs):
+            return Response({"id": request.user.pk})
+
+    return BenchmarkView.as_view()
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the throughput of Basic authenticated requests with "
+        "BasicAuthentication against CachedBasicAuthentication. Creates a "
+        "temporary user in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests", type=int, default=50, help="Timed requests per class."
+        )
+
+    def handle(self, *args, **options):
+        caches[BASIC_AUTH_CACHE_ALIAS].clear()
+        try:
+            with transaction.atomic():
+                self.benchmark(options["requests"])
+                raise RollBack
+        except RollBack:
+            pass
+
+    def benchmark(self, requests):
+        email, password = "benchmark@example.com", "benchmark-password"
+        CustomUser.objects.create_user(
+            email=email,
+            username="benchmark",
+            first_name="benchmark",
+            last_name="user",
+            password=password,
+        )
+        credentials = base64.b64encode(f"{email}:{password}".encode()).decode()
+        factory = APIRequestFactory()
+
+        throughputs = {}
+        for label, authentication_class in (
+            ("BasicAuthentication", BasicAuthentication),
+            ("CachedBasicAuthentication", CachedBasicAuthentication),
+        ):
+            view = build_view(authentication_class)
+            # a first request fills the cache
+            view(factory.get("/", HTTP_AUTHORIZATION=f"Basic {credentials}"))
+            start = time.perf_counter()
+            for _ in range(requests):
+                response = view(
+                    factory.get("/", HTTP_AUTHORIZATION=f"Basic {credentials}")
+                )
+                assert response.status_code == 200, response.status_code
+            elapsed = time.perf_counter() - start
+            throughputs[label] = requests / elapsed
+            self.stdout.write(
+                f"{label:<26} {throughputs[label]:8.1f} requests/s, "
+                f"{elapsed / requests * 1e3:7.2f} ms per request"
+            )
+
+        speedup = (
+            throughputs["CachedBasicAuthentication"]
+            / throughputs["BasicAuthentication"]
+        )
+        self.stdout.write(self.style.SUCCESS(f"{speedup:.1f}x the throughput"))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from config.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the responses recorded for Idempotency-Key headers once they are "
+        "older than IDEMPOTENCY_KEY_TTL. Meant to run periodically, e.g. hourly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="Rows deleted per query."
+        )
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_keys(options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Purged {deleted} expired idempotency key(s).")
+        )
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0002_idempotencykey_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TokenRevocation",
+            fields=[
+                ("user_id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("revoked_at", models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -2,6 +2,7 @@ import os
 
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser, BaseUserManager
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 
 
@@ -75,6 +76,29 @@ class CustomUserManager(BaseUserManager):
         user.save(using=self._db)
         return user
 
+    def provision(self, users):
+        """
+        Creates the profile and the cart of new users, with a single insert per
+        table whatever the number of users.
+        """
+        from carts.models import Cart
+
+        Profile.objects.using(self._db).bulk_create(
+            Profile(user=user) for user in users
+        )
+        Cart.objects.using(self._db).bulk_create(Cart(user=user) for user in users)
+
+    def bulk_import(self, users, batch_size=1000):
+        """
+        Inserts unsaved users along with their profiles and carts, with bulk
+        inserts of `batch_size` rows, and returns them. No signals are sent,
+        and the passwords must already be hashed (e.g. `set_unusable_password`).
+        """
+        users = self.bulk_create(users, batch_size=batch_size)
+        for start in range(0, len(users), batch_size):
+            self.provision(users[start : start + batch_size])
+        return users
+
 
 class CustomUser(AbstractUser):
     email = models.EmailField(unique=True)
@@ -87,6 +111,10 @@ class CustomUser(AbstractUser):
 
     objects = CustomUserManager()
 
+    # fields granting access, changing them revokes the issued tokens, as does
+    # setting a new password
+    access_fields = ("role", "is_active", "is_staff", "is_superuser")
+
     def __str__(self):
         return self.email
 
@@ -94,6 +122,25 @@ class CustomUser(AbstractUser):
         verbose_name = "User"
         verbose_name_plural = "Users"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the loaded access fields, so changing them revokes the
+        # tokens issued with the previous values
+        instance._loaded_access = {
+            name: instance.__dict__[name]
+            for name in cls.access_fields
+            if name in instance.__dict__
+        }
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        # users built from token claims load every deferred field on the first
+        # access to one of them, instead of a query per field
+        if fields is not None and getattr(self, "is_claims_user", False):
+            fields = {*fields, *self.get_deferred_fields()}
+        super().refresh_from_db(using, fields)
+
     @property
     def is_admin(self):
         return self.role == UserRole.ADMINISTRATOR
@@ -125,3 +172,48 @@ class Profile(models.Model):
 
     def __str__(self):
         return f"{self.user.email}'s profile"
+
+
+class IdempotencyKey(models.Model):
+    """
+    First response to a write sent with an `Idempotency-Key` header, replayed
+    for retries of the request. See `config.idempotency`.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="+",
+        db_index=False,
+    )
+    key = models.CharField(max_length=255)
+    # sha256 of the method, path and data of the request
+    fingerprint = models.CharField(max_length=64)
+    # empty until the handler returns, within the claiming transaction
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(encoder=DjangoJSONEncoder, null=True)
+    created_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "key"], name="unique_user_idempotency_key"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.key} by {self.user_id}"
+
+
+class TokenRevocation(models.Model):
+    """
+    Time until which the tokens issued to a user are revoked. See
+    `users.authentication.RevocationList`.
+    """
+
+    # not a foreign key, so the tokens of deleted users stay revoked
+    user_id = models.BigIntegerField(primary_key=True)
+    revoked_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Tokens of {self.user_id} revoked at {self.revoked_at}"
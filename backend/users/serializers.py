@@ -1,18 +1,123 @@
+import copy
+import datetime
+import decimal
+import operator
+import threading
+from collections import OrderedDict
+
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
-from rest_framework import serializers
+from django.db import models
+from django.utils.functional import cached_property
+from rest_framework import ISO_8601, serializers
 from rest_framework.exceptions import AuthenticationFailed
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework.fields import SkipField
+from rest_framework.relations import ManyRelatedField, PKOnlyObject, RelatedField
+from rest_framework.settings import api_settings
+from rest_framework_simplejwt.serializers import (
+    TokenObtainPairSerializer,
+    TokenRefreshSerializer,
+)
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 
+from .authentication import USER_CLAIMS, RefreshToken, revocation_list
 from .models import Profile
 
 
+def get_instance(instance):
+    return instance
+
+
+def copy_field(field):
+    """Returns an unbound copy of a cached field declaration."""
+    if isinstance(field, serializers.BaseSerializer):
+        # serializers that built their fields, or bound a child, need new instances
+        if "fields" in vars(field) or hasattr(field, "child"):
+            return copy.deepcopy(field)
+    elif hasattr(field, "child") or hasattr(field, "child_relation"):
+        return copy.deepcopy(field)
+    # binding only sets attributes on the copy, so the declaration stays unbound
+    clone = object.__new__(type(field))
+    clone.__dict__.update(vars(field))
+    return clone
+
+
+def get_datetime_representation(field):
+    """
+    Returns `field.to_representation` with the output format and time zone of
+    the `DateTimeField` resolved in advance, for ISO 8601 output.
+    """
+    output_format = getattr(field, "format", api_settings.DATETIME_FORMAT)
+    field_timezone = (
+        field.timezone if hasattr(field, "timezone") else field.default_timezone()
+    )
+    if output_format is None or output_format.lower() != ISO_8601:
+        return field.to_representation
+    if field_timezone is None:
+        return field.to_representation
+
+    def to_representation(value):
+        if not isinstance(value, datetime.datetime) or value.utcoffset() is None:
+            return field.to_representation(value)
+        value = value.astimezone(field_timezone).isoformat()
+        if value.endswith("+00:00"):
+            value = value[:-6] + "Z"
+        return value
+
+    return to_representation
+
+
+def get_decimal_representation(field):
+    """
+    Returns `field.to_representation` with the quantization of the
+    `DecimalField` resolved in advance, for string output.
+    """
+    coerce_to_string = getattr(
+        field, "coerce_to_string", api_settings.COERCE_DECIMAL_TO_STRING
+    )
+    if (
+        not coerce_to_string
+        or field.decimal_places is None
+        or field.normalize_output
+        or field.localize
+    ):
+        return field.to_representation
+
+    exponent = decimal.Decimal(".1") ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+
+    def to_representation(value):
+        if not isinstance(value, decimal.Decimal):
+            return field.to_representation(value)
+        return f"{value.quantize(exponent, rounding=rounding, context=context):f}"
+
+    return to_representation
+
+
 class DynamicFieldsModelSerializer(serializers.ModelSerializer):
     """
     A ModelSerializer that takes an additional `fields` argument that
     controls which fields should be displayed.
     """
 
+    # Field declarations are built once per serializer class and `fields`
+    # argument, and copied for every instance. They must not depend on the
+    # serializer instance (e.g. its context). Up to `field_templates_maxsize`
+    # combinations are cached, 0 disables the cache.
+    field_templates_maxsize = 256
+    _field_templates = OrderedDict()
+    _field_templates_lock = threading.Lock()
+
+    # model lookups of the fields that don't read a model field of their source
+    # (method fields, properties, annotations), annotations have no lookups.
+    # See `config.fields.SparseFieldsMixin`.
+    field_lookups = {}
+    # model lookups read by `to_representation` whatever the selected fields
+    representation_lookups = ()
+
     def __init__(self, *args, **kwargs):
         # Don't pass the 'fields' arg up to the superclass
         dynamic_fields = kwargs.pop("fields", None)
@@ -20,17 +125,129 @@ class DynamicFieldsModelSerializer(serializers.ModelSerializer):
         # Instantiate the superclass normally
         super().__init__(*args, **kwargs)
 
-        if dynamic_fields is not None:
+        # dynamic_fields - refers to a keyword argument passed when initializing the serializer
+        # fields that are not specified in it are dropped in `get_fields`
+        self.dynamic_fields = (
+            frozenset(dynamic_fields) if dynamic_fields is not None else None
+        )
+
+    def get_fields(self):
+        key = (type(self), self.dynamic_fields)
+        with self._field_templates_lock:
+            templates = self._field_templates.get(key)
+            if templates is not None:
+                self._field_templates.move_to_end(key)
+
+        if templates is None:
+            templates = self.build_field_templates()
+            if self.field_templates_maxsize:
+                with self._field_templates_lock:
+                    self._field_templates[key] = templates
+                    while len(self._field_templates) > self.field_templates_maxsize:
+                        self._field_templates.popitem(last=False)
+
+        return {name: copy_field(field) for name, field in templates.items()}
+
+    def build_field_templates(self):
+        fields = super().get_fields()
+        if self.dynamic_fields is not None:
             # Drop any fields that are not specified in the `fields` argument.
-            # dynamic_fields - refers to a keyword argument passed when initializing the serializer
-            allowed = set(dynamic_fields)
-            # self.fields - represents all the fields defined in the serializer
-            existing = set(self.fields)
-            for field_name in existing - allowed:
-                self.fields.pop(field_name)
+            fields = {
+                name: field
+                for name, field in fields.items()
+                if name in self.dynamic_fields
+            }
+        return fields
+
+    @cached_property
+    def read_plan(self):
+        # compiled on first use, once the serializer is bound to its parent
+        return self.get_read_plan()
+
+    def get_read_plan(self):
+        """
+        Returns a list of `(field_name, get_attribute, to_representation)` steps
+        compiled from the readable fields, so that representing each row doesn't
+        resolve the fields, their sources and methods again.
+        `to_representation` is None when the attribute is the representation.
+        """
+        return [self.get_read_step(field) for field in self._readable_fields]
+
+    def get_read_step(self, field):
+        if isinstance(field, serializers.SerializerMethodField):
+            # the method is given the instance itself, like `source="*"`
+            return field.field_name, get_instance, getattr(self, field.method_name)
+
+        if len(field.source_attrs) == 1 and not isinstance(
+            field, (RelatedField, ManyRelatedField)
+        ):
+            source = field.source_attrs[0]
+            opts = self.Meta.model._meta
+            many_relations = {related.name for related in opts.related_objects}
+            many_relations.update(related.name for related in opts.many_to_many)
+            # callables and to-many relations need the handling of `field.get_attribute`
+            if not (
+                callable(getattr(self.Meta.model, source, None))
+                or source in many_relations
+            ):
+                return (
+                    field.field_name,
+                    operator.attrgetter(source),
+                    self.get_read_representation(field),
+                )
+
+        def get_attribute(instance):
+            attribute = field.get_attribute(instance)
+            if isinstance(attribute, PKOnlyObject) and attribute.pk is None:
+                return None
+            return attribute
+
+        return field.field_name, get_attribute, self.get_read_representation(field)
+
+    def get_read_representation(self, field):
+        # only fields that don't override the representation of DRF are compiled
+        representation = type(field).to_representation
+        if representation is serializers.DateTimeField.to_representation:
+            return get_datetime_representation(field)
+        if representation is serializers.DecimalField.to_representation:
+            return get_decimal_representation(field)
+        return field.to_representation
+
+    def to_representation(self, instance):
+        if not isinstance(instance, models.Model):
+            return super().to_representation(instance)
+
+        ret = {}
+        for field_name, get_attribute, to_representation in self.read_plan:
+            try:
+                attribute = get_attribute(instance)
+            except AttributeError:
+                # missing attributes follow the default and skip rules of the field
+                try:
+                    attribute = self.fields[field_name].get_attribute(instance)
+                except SkipField:
+                    continue
+            except SkipField:
+                continue
+            # like `Serializer.to_representation`, None is never passed to fields
+            if attribute is None or to_representation is None:
+                ret[field_name] = attribute
+            else:
+                ret[field_name] = to_representation(attribute)
+        return ret
 
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = RefreshToken
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        # carried over to the access tokens, see `ClaimsJWTAuthentication`
+        for claim in USER_CLAIMS:
+            token[claim] = getattr(user, claim)
+        return token
+
     def validate(self, attrs):
         try:
             data = super().validate(attrs)
@@ -40,6 +257,18 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         return data
 
 
+class CustomTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = RefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+        if revocation_list.is_revoked(
+            refresh.get(jwt_settings.USER_ID_CLAIM), refresh.get("iat")
+        ):
+            raise AuthenticationFailed("Token has been revoked.", code="token_revoked")
+        return super().validate(attrs)
+
+
 class UserRegistrationSerializer(serializers.ModelSerializer):
     password = serializers.CharField(
         write_only=True, required=True, validators=[validate_password]
@@ -1,29 +1,42 @@
 import logging
 
 from django.contrib.auth import get_user_model
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
-from carts.models import Cart
-
-from .models import Profile
+from .authentication import revoke_user_tokens
 
 logger = logging.getLogger(__name__)
 
 
 @receiver(post_save, sender=get_user_model())
-def create_profile(sender, instance, created, **kwargs):
-    if created:
-        Profile.objects.create(user=instance)
-
-
-@receiver(post_save, sender=get_user_model())
-def save_profile(sender, instance, **kwargs):
-    instance.profile.save()
+def provision_user(sender, instance, created, raw=False, **kwargs):
+    # the profile is saved on its own, saving the user doesn't touch it
+    if created and not raw:
+        sender.objects.provision([instance])
+        logger.info(f"Profile and cart created for user {instance.email}.")
 
 
 @receiver(post_save, sender=get_user_model())
-def create_user_cart(sender, instance, created, **kwargs):
-    if created:
-        Cart.objects.create(user=instance)
-        logger.info(f"Cart created for user {instance.email}.")
+def revoke_tokens_on_access_change(sender, instance, created, **kwargs):
+    # the tokens carry the role and active status as claims
+    loaded_access = getattr(instance, "_loaded_access", {})
+    access_changed = any(
+        getattr(instance, name) != value for name, value in loaded_access.items()
+    )
+    # `_password` is kept until the save by `set_password`, and cleared before
+    # the save when `check_password` upgrades the hash of the same password
+    password_changed = not created and instance._password is not None
+    if access_changed or password_changed:
+        revoke_user_tokens(instance.pk)
+    # compare the next saves against the saved values
+    instance._loaded_access = {
+        name: instance.__dict__[name]
+        for name in instance.access_fields
+        if name in instance.__dict__
+    }
+
+
+@receiver(post_delete, sender=get_user_model())
+def revoke_tokens_on_delete(sender, instance, **kwargs):
+    revoke_user_tokens(instance.pk)
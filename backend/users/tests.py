@@ -1,3 +1,281 @@
+import base64
+import csv
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.contrib.auth.models import Group
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.tokens import AccessToken
+
+from carts.models import Cart
+from config.caching import get_response_cache
+from products.serializers import CategorySerializer, ProductSerializer
+
+from .authentication import ClaimsJWTAuthentication, revocation_list
+from .models import CustomUser, Profile, TokenRevocation, UserRole
+from .serializers import DynamicFieldsModelSerializer, UserSerializer
+
+
+class UserSerializerTestCase(TestCase):
+    def test_many_to_many_fields_are_serialized_as_pks(self):
+        user = CustomUser.objects.create_user(
+            email="customer@example.com",
+            username="customer",
+            first_name="customer",
+            last_name="doe",
+        )
+        group = Group.objects.create(name="customers")
+        user.groups.add(group)
+        data = UserSerializer(user).data
+        self.assertEqual(data["groups"], [group.pk])
+        self.assertEqual(data["user_permissions"], [])
+
+
+class DynamicFieldsModelSerializerTestCase(TestCase):
+    def setUp(self):
+        DynamicFieldsModelSerializer._field_templates.clear()
+
+    def test_field_declarations_are_cached_per_fields_argument(self):
+        first = CategorySerializer(fields=["id", "name"])
+        second = CategorySerializer(fields=["name", "id"])
+        self.assertEqual(list(first.fields), ["id", "name"])
+        self.assertEqual(list(second.fields), ["id", "name"])
+        self.assertEqual(
+            list(DynamicFieldsModelSerializer._field_templates),
+            [(CategorySerializer, frozenset(["id", "name"]))],
+        )
+
+        # every instance gets its own fields, bound to itself
+        self.assertIsNot(first.fields["name"], second.fields["name"])
+        self.assertIs(first.fields["name"].parent, first)
+        self.assertIs(second.fields["name"].parent, second)
+
+    def test_nested_serializers_use_the_context_of_their_parent(self):
+        context = {"request": None}
+        serializer = ProductSerializer(context=context)
+        category = serializer.fields["category"]
+        self.assertEqual(list(category.fields), ["id", "name", "slug"])
+        self.assertIs(category.fields["name"].root, serializer)
+        self.assertIs(category.context, context)
+
+    def test_cache_is_bounded(self):
+        maxsize = DynamicFieldsModelSerializer.field_templates_maxsize
+        DynamicFieldsModelSerializer.field_templates_maxsize = 2
+        try:
+            for fields in (["id"], ["name"], ["slug"]):
+                CategorySerializer(fields=fields).fields
+        finally:
+            DynamicFieldsModelSerializer.field_templates_maxsize = maxsize
+        self.assertEqual(
+            list(DynamicFieldsModelSerializer._field_templates),
+            [
+                (CategorySerializer, frozenset(["name"])),
+                (CategorySerializer, frozenset(["slug"])),
+            ],
+        )
+
+
+class CachedBasicAuthenticationTestCase(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.user = CustomUser.objects.create_user(
+            email="script@example.com",
+            username="script",
+            first_name="script",
+            last_name="doe",
+            password="first-password",
+        )
+
+    def get_profile(self, password):
+        credentials = base64.b64encode(f"script@example.com:{password}".encode())
+        return self.client.get(
+            "/api/users/me/", HTTP_AUTHORIZATION=f"Basic {credentials.decode()}"
+        )
+
+    def test_verified_credentials_are_cached(self):
+        with mock.patch.object(
+            CustomUser,
+            "check_password",
+            autospec=True,
+            side_effect=CustomUser.check_password,
+        ) as check_password:
+            for _ in range(3):
+                self.assertEqual(self.get_profile("first-password").status_code, 200)
+            self.assertEqual(self.get_profile("wrong-password").status_code, 401)
+            self.assertEqual(self.get_profile("wrong-password").status_code, 401)
+        # once for the valid credentials, and for every invalid attempt
+        self.assertEqual(check_password.call_count, 3)
+
+    def test_password_change_invalidates_cached_credentials(self):
+        self.assertEqual(self.get_profile("first-password").status_code, 200)
+        self.user.set_password("second-password")
+        self.user.save()
+        self.assertEqual(self.get_profile("first-password").status_code, 401)
+        self.assertEqual(self.get_profile("second-password").status_code, 200)
+
+
+class ClaimsJWTAuthenticationTestCase(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        # the in-memory copy of the revocations is reloaded once per interval
+        revocation_list.loaded_at = None
+        revocation_list.get_revocations()
+        self.user = CustomUser.objects.create_user(
+            email="customer@example.com",
+            username="customer",
+            first_name="customer",
+            last_name="doe",
+            password="secret-password",
+        )
+        response = self.client.post(
+            "/api/token/",
+            {"email": "customer@example.com", "password": "secret-password"},
+        )
+        self.tokens = response.json()
+
+    def get(self, url, token=None):
+        token = token or self.tokens["access"]
+        return self.client.get(url, HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_user_is_built_from_the_claims(self):
+        with self.assertNumQueries(0):
+            response = self.get("/api/products/status-choices/")
+        self.assertEqual(response.status_code, 200)
+        # admin only endpoints are decided by the role claim
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get("/api/users/").status_code, 403)
+        # staff only endpoints by the staff claims
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get("/api/carts/").status_code, 403)
+
+    def test_paginated_list_does_not_load_the_user(self):
+        get_response_cache().clear()
+        user_table = CustomUser._meta.db_table
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get("/api/products/?limit=10")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(
+            [query for query in queries.captured_queries if user_table in query["sql"]]
+        )
+
+    def test_claims_are_set_on_their_fields(self):
+        with self.assertNumQueries(0):
+            user = ClaimsJWTAuthentication().get_user(
+                AccessToken(self.tokens["access"])
+            )
+            self.assertEqual(user.pk, self.user.pk)
+            self.assertEqual(user.role, UserRole.CUSTOMER)
+            self.assertIs(user.is_active, True)
+            self.assertIs(user.is_staff, False)
+            self.assertIs(user.is_superuser, False)
+
+    def test_other_fields_are_loaded_once(self):
+        with self.assertNumQueries(1):
+            user = ClaimsJWTAuthentication().get_user(
+                AccessToken(self.tokens["access"])
+            )
+            self.assertEqual(user, self.user)
+            self.assertEqual(user.email, "customer@example.com")
+            self.assertEqual(user.first_name, "customer")
+        self.assertEqual(self.get("/api/users/me/").json()["email"], user.email)
+
+    def test_role_change_revokes_tokens(self):
+        self.user.role = UserRole.VENDOR
+        self.user.save()
+        revocation_list.loaded_at = None
+        self.assertEqual(self.get("/api/products/status-choices/").status_code, 401)
+        response = self.client.post(
+            "/api/token/refresh/", {"refresh": self.tokens["refresh"]}
+        )
+        self.assertEqual(response.status_code, 401)
+
+        # unrelated changes keep the tokens
+        CustomUser.objects.filter(pk=self.user.pk).update(role=UserRole.CUSTOMER)
+        user = CustomUser.objects.get(pk=self.user.pk)
+        user.first_name = "changed"
+        user.save()
+        self.assertEqual(list(revocation_list.get_revocations()), [str(self.user.pk)])
+
+    def test_password_change_revokes_tokens(self):
+        user = CustomUser.objects.get(pk=self.user.pk)
+        user.set_password("new-password")
+        user.save()
+        revocation_list.loaded_at = None
+        self.assertEqual(self.get("/api/users/me/").status_code, 401)
+
+        # tokens issued after the revocation are accepted, even within a second
+        response = self.client.post(
+            "/api/token/", {"email": "customer@example.com", "password": "new-password"}
+        )
+        self.assertEqual(
+            self.get("/api/users/me/", response.json()["access"]).status_code, 200
+        )
+
+    def test_password_hash_upgrade_keeps_tokens(self):
+        # an outdated hash is upgraded by `check_password` when logging in
+        CustomUser.objects.filter(pk=self.user.pk).update(
+            password=PBKDF2PasswordHasher().encode(
+                "secret-password", "0123456789abcdefghijkl", iterations=1000
+            )
+        )
+        response = self.client.post(
+            "/api/token/",
+            {"email": "customer@example.com", "password": "secret-password"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(
+            CustomUser.objects.get(pk=self.user.pk).password.split("$")[1], "1000"
+        )
+        revocation_list.loaded_at = None
+        self.assertEqual(
+            self.get("/api/users/me/", response.json()["access"]).status_code, 200
+        )
+        self.assertFalse(TokenRevocation.objects.exists())
+
+    def test_deleted_user_tokens_are_revoked(self):
+        CustomUser.objects.get(pk=self.user.pk).delete()
+        revocation_list.loaded_at = None
+        self.assertEqual(self.get("/api/products/status-choices/").status_code, 401)
+        self.assertTrue(TokenRevocation.objects.filter(user_id=self.user.pk).exists())
+
+
+class UserProvisioningTestCase(TestCase):
+    def test_registration_creates_profile_and_cart(self):
+        # the user, its profile and its cart
+        with self.assertNumQueries(3):
+            user = CustomUser.objects.create_user(
+                email="customer@example.com",
+                username="customer",
+                first_name="customer",
+                last_name="doe",
+            )
+        self.assertTrue(Profile.objects.filter(user=user).exists())
+        self.assertTrue(Cart.objects.filter(user=user).exists())
+
+        # saving the user doesn't save the profile
+        with self.assertNumQueries(1):
+            user.save(update_fields=["last_login"])
+
+    def test_import_users(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as file:
+            writer = csv.writer(file)
+            writer.writerow(["email", "username", "first_name", "last_name", "role"])
+            for i in range(25):
+                writer.writerow([f"user{i}@Example.com", f"user{i}", "user", "doe", ""])
+        self.addCleanup(os.remove, file.name)
 
-# Create your tests here.
+        # a transaction and three inserts per batch
+        with self.assertNumQueries(2 + 3 * 3):
+            call_command("import_users", file.name, batch_size=10, stdout=StringIO())
+        self.assertEqual(CustomUser.objects.count(), 25)
+        self.assertEqual(Profile.objects.count(), 25)
+        self.assertEqual(Cart.objects.count(), 25)
+        user = CustomUser.objects.get(email="user3@example.com")
+        self.assertFalse(user.has_usable_password())
@@ -11,9 +11,13 @@ from rest_framework.generics import (
 from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
+from carts.guest import merge_guest_cart
+from config.fields import SparseFieldsMixin
 from config.pagination import CustomLimitOffsetPagination
+from config.telemetry import ServerTimingMixin
 from products.models import Review
 from products.serializers import ReviewSerializer
 
@@ -27,7 +31,7 @@ from .serializers import (
 logger = logging.getLogger(__name__)
 
 
-class UserListView(ListAPIView):
+class UserListView(ServerTimingMixin, SparseFieldsMixin, ListAPIView):
     """List all users in the system."""
 
     queryset = get_user_model().objects.all().select_related("profile")
@@ -36,7 +40,9 @@ class UserListView(ListAPIView):
     filterset_fields = ["role"]
 
 
-class UserDetailView(RetrieveUpdateDestroyAPIView):
+class UserDetailView(
+    ServerTimingMixin, SparseFieldsMixin, RetrieveUpdateDestroyAPIView
+):
     """Retrive, update, or delete a user."""
 
     queryset = get_user_model().objects.all().select_related("profile")
@@ -44,11 +50,27 @@ class UserDetailView(RetrieveUpdateDestroyAPIView):
     serializer_class = UserSerializer
 
 
-class LoginView(TokenObtainPairView):
+class LoginView(ServerTimingMixin, TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
 
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        try:
+            serializer.is_valid(raise_exception=True)
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
+
+        response = Response(serializer.validated_data, status=status.HTTP_200_OK)
+        # the guest cart of the browsing session becomes part of the user cart
+        merge_guest_cart(request, serializer.user, response)
+        return response
+
 
-class UserRegistrationView(APIView):
+class RefreshView(ServerTimingMixin, TokenRefreshView):
+    pass
+
+
+class UserRegistrationView(ServerTimingMixin, APIView):
     """Register a new user."""
 
     permission_classes = [permissions.AllowAny]
@@ -64,7 +86,7 @@ class UserRegistrationView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class ProfileView(RetrieveUpdateAPIView):
+class ProfileView(ServerTimingMixin, SparseFieldsMixin, RetrieveUpdateAPIView):
     """Display profile of the request user."""
 
     permission_classes = [permissions.IsAuthenticated]
@@ -74,28 +96,28 @@ class ProfileView(RetrieveUpdateAPIView):
         return self.request.user
 
 
-class UserReviewListView(ListAPIView):
+class UserReviewListView(ServerTimingMixin, SparseFieldsMixin, ListAPIView):
     """
     List all product reviews of the request authenticated user.
     If `user_id` is passed, list all user's product reviews of the ID.
     """
 
+    query_budget = 2
     serializer_class = ReviewSerializer
     pagination_class = CustomLimitOffsetPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ["rating"]
+    default_fields = [
+        "id",
+        "product",
+        "rating",
+        "comment",
+        "created_at",
+        "updated_at",
+    ]
 
     def get_queryset(self):
-        queryset = Review.objects.select_related("product").only(
-            "id",
-            "product__id",
-            "product__name",
-            "product__slug",
-            "rating",
-            "comment",
-            "created_at",
-            "updated_at",
-        )
+        queryset = Review.objects.all()
         user_id = self.kwargs.get("user_id")
 
         if user_id:
@@ -111,23 +133,3 @@ class UserReviewListView(ListAPIView):
         else:
             permission_classes = [IsAuthenticated]
         return [permission() for permission in permission_classes]
-
-    def list(self, request, *args, **kwargs):
-        queryset = self.filter_queryset(self.get_queryset())
-
-        serializer_fields = [
-            "id",
-            "product",
-            "rating",
-            "comment",
-            "created_at",
-            "updated_at",
-        ]
-
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True, fields=serializer_fields)
-            return self.get_paginated_response(serializer.data)
-
-        serializer = self.get_serializer(queryset, many=True, fields=serializer_fields)
-        return Response(serializer.data)
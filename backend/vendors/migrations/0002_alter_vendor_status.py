@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("vendors", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="vendor",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("PENDING", "Pending"),
+                    ("ACTIVE", "Active"),
+                    ("SUSPENDED", "Suspended"),
+                    ("REJECTED", "Rejected"),
+                ],
+                default="ACTIVE",
+                help_text="Select the status of the vendor.",
+                max_length=10,
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("vendors", "0002_alter_vendor_status"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="vendor",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="vendors_ven_created_6d935b_idx"
+            ),
+        ),
+    ]
@@ -28,5 +28,11 @@ class Vendor(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # keyset pagination seeks on the ordering field plus the primary key
+        indexes = [
+            models.Index(fields=["-created_at", "-id"]),
+        ]
+
     def __str__(self):
         return self.name
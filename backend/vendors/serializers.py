@@ -63,6 +63,8 @@ class VendorSerializer(DynamicFieldsModelSerializer):
             "updated_at",
         ]
 
+    representation_lookups = ("status",)
+
     def validate_user_id(self, value):
         """Check that the user has the 'Vendor' role."""
         if value.role != UserRole.VENDOR:
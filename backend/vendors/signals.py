@@ -0,0 +1,17 @@
+import functools
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from config.caching import bump_generation
+
+from .models import Vendor
+
+
+@receiver(post_save, sender=Vendor)
+@receiver(post_delete, sender=Vendor)
+def invalidate_cached_vendor_responses(sender, using, **kwargs):
+    # bumped after the commit, so concurrent requests cannot cache the
+    # uncommitted state under the new generation
+    transaction.on_commit(functools.partial(bump_generation, "vendor"), using=using)
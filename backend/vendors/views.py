@@ -1,5 +1,6 @@
 import logging
 
+from django.db.models import Q
 from django.shortcuts import get_object_or_404
 from rest_framework import filters, status
 from rest_framework.exceptions import NotFound, PermissionDenied
@@ -12,9 +13,16 @@ from rest_framework.permissions import SAFE_METHODS, AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from config.pagination import CustomLimitOffsetPagination
+from config.caching import ConditionalGetMixin
+from config.fields import SparseFieldsMixin
+from config.idempotency import idempotent
+from config.pagination import (
+    CursorOrEstimatedCountPagination,
+    CursorOrLimitOffsetPagination,
+)
+from config.telemetry import ServerTimingMixin
 from products.models import Product
-from products.serializers import ProductSerializer
+from products.serializers import PRODUCT_REVIEW_FIELDS, ProductSerializer
 from users.models import UserRole
 from users.permissions import IsAdmin, IsAdminOrReadOnly
 
@@ -25,13 +33,14 @@ from .serializers import UserVendorSerializer, VendorSerializer
 logger = logging.getLogger(__name__)
 
 
-class VendorApplicationSubmitView(APIView):
+class VendorApplicationSubmitView(ServerTimingMixin, APIView):
     """
     view for submitting a vendor application for regular users.
     """
 
     permission_classes = [IsAuthenticated]
 
+    @idempotent
     def post(self, request, *args, **kwargs):
         user = request.user
         serializer = UserVendorSerializer(data=request.data)
@@ -46,7 +55,7 @@ class VendorApplicationSubmitView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class VendorApplicationConfirmView(APIView):
+class VendorApplicationConfirmView(ServerTimingMixin, APIView):
     """view for confirming a vendor application."""
 
     permission_classes = [IsAdmin]
@@ -77,28 +86,19 @@ class VendorApplicationConfirmView(APIView):
         )
 
 
-class VendorListView(ListCreateAPIView):
+class VendorListView(
+    ServerTimingMixin, SparseFieldsMixin, ConditionalGetMixin, ListCreateAPIView
+):
     """List all vendors, or create a new vendor."""
 
-    queryset = (
-        Vendor.objects.all()
-        .select_related("user")
-        .defer(
-            "user__password",
-            "user__last_login",
-            "user__is_superuser",
-            "user__is_staff",
-            "user__is_active",
-            "user__date_joined",
-            "user__role",
-        )
-    )
+    queryset = Vendor.objects.all()
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ["name"]
     ordering_fields = ["name", "created_at", "updated_at"]
     ordering = ["-created_at"]
-    pagination_class = CustomLimitOffsetPagination
+    pagination_class = CursorOrEstimatedCountPagination
 
+    @idempotent
     def create(self, request, *args, **kwargs):
         response = super().create(request, *args, **kwargs)
         user = self.request.user
@@ -131,7 +131,7 @@ class VendorListView(ListCreateAPIView):
             serializer.save(user=self.request.user)
 
 
-class VendorStatusChoicesView(APIView):
+class VendorStatusChoicesView(ServerTimingMixin, APIView):
     """Retrieve status choices of a Vendor model."""
 
     def get(self, request, *args, **kwargs):
@@ -141,12 +141,26 @@ class VendorStatusChoicesView(APIView):
         return Response({"choices": status_choices}, status=status.HTTP_200_OK)
 
 
-class VendorDetailView(RetrieveUpdateDestroyAPIView):
+class VendorDetailView(
+    ServerTimingMixin,
+    SparseFieldsMixin,
+    ConditionalGetMixin,
+    RetrieveUpdateDestroyAPIView,
+):
     """Retrieve, update or delete a vendor."""
 
     queryset = Vendor.objects.all().select_related("user")
     permission_classes = [IsVendorOwnerOrReadOnly | IsAdmin]
     serializer_class = VendorSerializer
+    # users have no modification timestamp, version on the nested user fields
+    conditional_fields = (
+        "updated_at",
+        "user__first_name",
+        "user__last_name",
+        "user__email",
+    )
+    # read by `get_object`
+    required_lookups = ("status", "user")
 
     def get_object(self):
         obj = super().get_object()
@@ -166,6 +180,17 @@ class VendorDetailView(RetrieveUpdateDestroyAPIView):
                 raise PermissionDenied
         return obj
 
+    def get_conditional_queryset(self):
+        queryset = super().get_conditional_queryset()
+        user = self.request.user
+        if user.is_authenticated and user.is_admin:
+            return queryset
+        # same rules as `get_object`, only Active vendors are visible to everyone
+        visible = Q(status=Vendor.Status.ACTIVE)
+        if user.is_authenticated:
+            visible |= Q(user=user)
+        return queryset.filter(visible)
+
     # def get_permissions(self):
     #     if self.request.method in SAFE_METHODS:
     #         permission_classes = [AllowAny]
@@ -179,19 +204,32 @@ class VendorDetailView(RetrieveUpdateDestroyAPIView):
     # return UserVendorSerializer
 
 
-class VendorProductListView(ListAPIView):
+class VendorProductListView(ServerTimingMixin, SparseFieldsMixin, ListAPIView):
     """
     List all products for the currently authenticated vendor user.
     If `vendor_id` is passed, list all vendor's products of the ID.
     """
 
-    queryset = (
-        Product.objects.all()
-        .select_related("category")
-        .reviews_annotations(all_reviews=True)
-    )
-    pagination_class = CustomLimitOffsetPagination
+    query_budget = 3
+    queryset = Product.objects.all()
+    pagination_class = CursorOrLimitOffsetPagination
     serializer_class = ProductSerializer
+    default_fields = [
+        "id",
+        "name",
+        "slug",
+        "description",
+        "price",
+        "discount_price",
+        "stock",
+        "image",
+        "category",
+        "rating",
+        "total_reviews",
+        "total_ratings",
+        "has_discount",
+        "discount_percentage",
+    ]
 
     # def get_permissions(self):
     #     # only admin users can view products of a specific vendor
@@ -211,34 +249,6 @@ class VendorProductListView(ListAPIView):
             queryset = queryset.filter(vendor=vendor)
         else:
             queryset = queryset.filter(vendor__user=self.request.user)
+        if self.is_field_selected(*PRODUCT_REVIEW_FIELDS):
+            queryset = queryset.reviews_annotations(all_reviews=True)
         return queryset
-
-    def list(self, request, *args, **kwargs):
-        queryset = self.filter_queryset(self.get_queryset())
-
-        serializer_fields = [
-            "id",
-            "name",
-            "slug",
-            "description",
-            "price",
-            "discount_price",
-            "stock",
-            "image",
-            "category",
-            "rating",
-            "total_reviews",
-            "total_ratings",
-            "has_discount",
-            "discount_percentage",
-            # "created_at",
-            # "updated_at",
-        ]
-
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True, fields=serializer_fields)
-            return self.get_paginated_response(serializer.data)
-
-        serializer = self.get_serializer(queryset, many=True, fields=serializer_fields)
-        return Response(serializer.data, status=status.HTTP_200_OK)